@@ -1,9 +1,20 @@
+import time
 import logging
 import asyncio
 
-from .fetcher import fetch, initialize as initialize_fetcher, FETCHERS
+from .common.memoize import reset_statistics, get_statistics, print_statistics, wait_background_refresh, \
+    checkpoint_async
+from .common.http import close_shared_clients
+from .common.processpool import shutdown_process_pool
+from .common.schedule import RefreshSchedule
+from .common.foreach import get_concurrency_statistics, set_run_budget
+from .common.profile import reset_run_profile, get_run_profile, print_run_profile, write_run_profile
+from .fetcher import fetch, refresh, get_outdated_fetchers, initialize as initialize_fetcher, FETCHERS
 from .database import initialize_database
 from .searx_instances import get_searx_stats_result_from_repository, get_searx_stats_result_from_list
+from .shard import select_shard
+from .checkpoint import RunCheckpoint
+from .config import RUN_BUDGET, RUN_PROFILE_SLOWEST_COUNT, REFRESH_INTERVALS, get_run_checkpoint_file_name
 
 
 async def initialize():
@@ -21,36 +32,134 @@ def initialize_logging():
         logging.getLogger(logger_name).setLevel(logging.WARNING)
 
 
-async def run_once(output_file: str, private: bool, instance_urls: list, selected_fetcher_names: list):
-    # select fetchers
-    selected_fetchers = list(
-        filter(lambda f: f.name in selected_fetcher_names, FETCHERS))
-
-    # initialize fetchers
-    await initialize_fetcher(selected_fetchers)
-
-    # fetch instance list
+async def load_instances(private: bool, instance_urls: list, shard: tuple = None):
     if not private and (instance_urls is None or len(instance_urls) == 0):
         searx_stats_result = await get_searx_stats_result_from_repository()
     else:
         searx_stats_result = await get_searx_stats_result_from_list(instance_urls, private)
 
+    # keep only the instances of this machine
+    if shard is not None:
+        select_shard(searx_stats_result, shard)
+
     # output
     print('\n{0} instance(s)\n'.format(len(searx_stats_result.instances.keys())))
+    return searx_stats_result
 
-    # fetch
-    await fetch(searx_stats_result, selected_fetchers)
+
+async def write_result(searx_stats_result, output_file: str, profile_file: str = None):
+    # cache statistics
+    print_statistics()
+    searx_stats_result.metadata['memoize'] = get_statistics()
+    searx_stats_result.metadata['concurrency'] = get_concurrency_statistics()
+
+    # where the time went
+    run_profile = get_run_profile(RUN_PROFILE_SLOWEST_COUNT)
+    print_run_profile(run_profile)
+    searx_stats_result.metadata['run'] = run_profile
+    if profile_file:
+        write_run_profile(run_profile, profile_file)
 
     # write results
     searx_stats_result.write(output_file)
 
+    # the results are written using the stale values: wait for the new values for the next run
+    await wait_background_refresh()
+    await checkpoint_async()
+
+    # close the idle connections and stop the processes until the next run
+    await close_shared_clients()
+    shutdown_process_pool()
+
+
+# pylint: disable=too-many-arguments
+async def run_once(output_file: str, private: bool, instance_urls: list, selected_fetcher_names: list,
+                   profile_file: str = None, shard: tuple = None, resume: bool = False):
+    """
+    Fetch all the instances, and write the output.
+
+    The progress is saved in a checkpoint (see checkpoint.RunCheckpoint) until the output is written:
+    if `resume` is True, an interrupted run continues where it has stopped.
+    """
+    # the fetchers stop after RUN_BUDGET seconds
+    set_run_budget(RUN_BUDGET)
+
+    # select fetchers
+    selected_fetchers = list(
+        filter(lambda f: f.name in selected_fetcher_names, FETCHERS))
+
+    # initialize fetchers
+    await initialize_fetcher(selected_fetchers)
+
+    # cache statistics and profile of this run only
+    reset_statistics()
+    reset_run_profile()
+
+    # fetch instance list, or resume the previous run
+    checkpoint = RunCheckpoint(get_run_checkpoint_file_name(), {
+        'private': private,
+        'instance_urls': instance_urls,
+        'shard': shard,
+    })
+    searx_stats_result = checkpoint.load() if resume else None
+    if searx_stats_result is None:
+        searx_stats_result = await load_instances(private, instance_urls, shard)
+
+    # fetch
+    await fetch(searx_stats_result, selected_fetchers, checkpoint)
+
+    await write_result(searx_stats_result, output_file, profile_file)
+    checkpoint.remove()
+    return searx_stats_result
+
+
+# pylint: disable=too-many-arguments
+async def run_server(output_file: str, private: bool, instance_urls: list, selected_fetcher_names: list,
+                     profile_file: str = None, shard: tuple = None, resume: bool = False):
+    """
+    Run all the fetchers once, then run each fetcher again after its interval (see REFRESH_INTERVALS),
+    and write the output after each refresh.
+
+    The values of the fetchers which are not refreshed come from the previous output (see
+    SearxStatisticsResult.write), so basic can reload the instance list without running the other fetchers.
+    """
+    selected_fetchers = list(
+        filter(lambda f: f.name in selected_fetcher_names, FETCHERS))
+    schedule = RefreshSchedule({fetcher.name: REFRESH_INTERVALS[fetcher.name] for fetcher in selected_fetchers})
+
+    start_time = time.time()
+    searx_stats_result = await run_once(output_file, private, instance_urls, selected_fetcher_names,
+                                        profile_file=profile_file, shard=shard, resume=resume)
+    schedule.done([fetcher.name for fetcher in selected_fetchers], start_time)
 
-async def run_server(*args, **kwargs):
-    await run_once(*args, **kwargs)
     while True:
-        print('\n💤 Sleep until next run\n')
-        await asyncio.sleep(24 * 3600)
-        await run_once(*args, **kwargs)
+        sleep_time = schedule.get_sleep_time()
+        print('\n💤 Sleep {0:.0f}s until the next refresh\n'.format(sleep_time))
+        await asyncio.sleep(sleep_time)
+
+        start_time = time.time()
+        due_names = schedule.get_due(start_time)
+        due_fetchers = [fetcher for fetcher in selected_fetchers if fetcher.name in due_names]
+        fetchers = await get_outdated_fetchers(searx_stats_result, due_fetchers)
+        schedule.done(due_names, start_time)
+        if not fetchers:
+            continue
+        print('\n🔄 Refresh {0}\n'.format(', '.join(fetcher.name for fetcher in fetchers)))
+
+        set_run_budget(RUN_BUDGET)
+        reset_statistics()
+        reset_run_profile()
+        if any(fetcher.name == 'basic' for fetcher in fetchers):
+            previous_forks = searx_stats_result.forks
+            searx_stats_result = await load_instances(private, instance_urls, shard)
+            for fork in previous_forks:
+                if fork not in searx_stats_result.forks:
+                    searx_stats_result.forks.append(fork)
+        await refresh(searx_stats_result, fetchers)
+        searx_stats_result.metadata['refresh'] = {
+            name: int(refresh_time) for name, refresh_time in schedule.last_times.items()
+        }
+        await write_result(searx_stats_result, output_file, profile_file)
 
 
 def erase_memoize(fetcher_name_list: list):
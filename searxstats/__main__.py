@@ -3,18 +3,21 @@ import asyncio
 import os
 import sys
 
-from .common.memoize import bind_to_file_name
+from .common.memoize import bind_to_file_name, checkpoint_periodically, compact
 from .config import (
-    CACHE_DIRECTORY, DATABASE_URL, MMDB_FILENAME, SEARXINSTANCES_GIT_REPOSITORY,
+    CACHE_DIRECTORY, CACHE_CHECKPOINT_INTERVAL, DATABASE_URL, MMDB_FILENAME, SEARXINSTANCES_GIT_REPOSITORY,
     set_cache_directory, set_database_url, get_cache_file_name)
 from .fetcher import FETCHERS
+from .shard import parse_shard, merge_files
 from . import initialize, run_once, run_server, erase_memoize
 
 
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-locals
 def run(server_mode: bool, output_file_name: str, user_cache_directory: str, database_url: str,
-        instance_urls: list, private: bool, selected_fetcher_names: list, update_fetcher_memoize_list: list):
+        instance_urls: list, private: bool, selected_fetcher_names: list, update_fetcher_memoize_list: list,
+        checkpoint_interval: int, compact_cache: bool, profile_file_name: str = None, shard: tuple = None,
+        resume: bool = False):
 
     if not os.access(user_cache_directory, os.W_OK):
         sys.exit('[FATAL ERROR] need write access to {}'.format(user_cache_directory))
@@ -27,7 +30,11 @@ def run(server_mode: bool, output_file_name: str, user_cache_directory: str, dat
     server_emoji_str = '🤖' if server_mode else '⚡'
     print('{0} {1} {2}'.format(server_emoji_str, private_str, server_mode_str))
     print('{0:15} : {1}'.format('Output file', output_file_name))
+    print('{0:15} : {1}'.format('Profile file', profile_file_name or ''))
+    print('{0:15} : {1}'.format('Shard', '{0}/{1}'.format(*shard) if shard else 'no'))
     print('{0:15} : {1}'.format('Cache directory', user_cache_directory))
+    print('{0:15} : {1}'.format('Checkpoint', '{}s'.format(checkpoint_interval) if checkpoint_interval else 'no'))
+    print('{0:15} : {1}'.format('Resume', 'yes' if resume else 'no'))
     print('{0:15} : {1}'.format('Database URL', database_url))
     print('{0:15} : {1}'.format('MMDB filename', MMDB_FILENAME or ''))
     if server_mode:
@@ -55,11 +62,21 @@ def run(server_mode: bool, output_file_name: str, user_cache_directory: str, dat
     # load cache
     bind_to_file_name(get_cache_file_name())
 
+    # compact the cache offline
+    if compact_cache:
+        print('\n{0} cache entries removed'.format(compact()))
+        return
+
     # erase cache entries to update
     erase_memoize(update_fetcher_memoize_list)
 
+    # save the cache periodically
+    if checkpoint_interval > 0:
+        loop.create_task(checkpoint_periodically(checkpoint_interval))
+
     # run
-    loop.run_until_complete(run_function(output_file_name, private, instance_urls, selected_fetcher_names))
+    loop.run_until_complete(run_function(output_file_name, private, instance_urls, selected_fetcher_names,
+                                         profile_file=profile_file_name, shard=shard, resume=resume))
 
 
 def main():
@@ -68,6 +85,18 @@ def main():
                         type=str, nargs='?', dest='output_file_name',
                         help='JSON output file name',
                         default='html/data/instances.json')
+    parser.add_argument('--profile',
+                        type=str, nargs='?', dest='profile_file_name',
+                        help='JSON file name where the time spent by each fetcher and instance is written',
+                        default=None)
+    parser.add_argument('--shard',
+                        type=parse_shard, nargs='?', dest='shard',
+                        help='Check only the instances of the shard i/N (1 <= i <= N), see --merge',
+                        default=None)
+    parser.add_argument('--merge',
+                        type=str, nargs='+', dest='merge_file_names', metavar='SHARD_OUTPUT',
+                        help='Merge the output files of the shards into the output file, then exit',
+                        default=None)
     parser.add_argument('--private',
                         action='store_true', dest='private',
                         help='In private execution mode, fetch data even if the website is not a SearXNG instance',
@@ -80,9 +109,21 @@ def main():
                         type=str, nargs='?', dest='database_url',
                         help='Database URL',
                         default=DATABASE_URL)
+    parser.add_argument('--checkpoint-interval',
+                        type=int, nargs='?', dest='checkpoint_interval',
+                        help='Save the cache every CHECKPOINT_INTERVAL seconds, 0 to disable',
+                        default=CACHE_CHECKPOINT_INTERVAL)
+    parser.add_argument('--resume',
+                        action='store_true', dest='resume',
+                        help='Continue the interrupted run with the same arguments, skip the work already done',
+                        default=False)
+    parser.add_argument('--compact-cache',
+                        action='store_true', dest='compact_cache',
+                        help='Remove the expired and obsolete entries from the cache, then exit',
+                        default=False)
     parser.add_argument('--server', '-s',
                         action='store_true', dest='server_mode',
-                        help='Server mode, automatic check every day',
+                        help='Server mode, each fetcher runs again periodically (see REFRESH_INTERVALS)',
                         default=False)
     parser.add_argument('--all',
                         action='store_true', dest='all',
@@ -117,7 +158,9 @@ def main():
             selected_fetcher_names.add(fetcher_name)
             update_fetcher_memoize_list.add(fetcher_name)
 
-    if len(args.instance_urls) == 0 and args.private:
+    if args.merge_file_names:
+        merge_files(args.output_file_name, args.merge_file_names)
+    elif len(args.instance_urls) == 0 and args.private:
         print('Missing URLs')
     else:
         run(args.server_mode,
@@ -127,7 +170,12 @@ def main():
             args.instance_urls,
             args.private,
             list(selected_fetcher_names),
-            list(update_fetcher_memoize_list))
+            list(update_fetcher_memoize_list),
+            args.checkpoint_interval,
+            args.compact_cache,
+            args.profile_file_name,
+            args.shard,
+            args.resume)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import tempfile
+
+from .model import SearxStatisticsResult
+from .config import RUN_CHECKPOINT_INTERVAL
+
+
+class RunCheckpoint:
+    """
+    Progress of a run saved in `file_name`: the SearxStatisticsResult, the names of the fetchers which are done,
+    and for each fetcher the instances which are done (see fetcher.run_fetchers).
+
+    `arguments` describes the run (instance list, private, shard): a run is resumed only with the same arguments.
+    """
+
+    __slots__ = 'file_name', 'arguments', 'completed', 'instances_done', 'interval', 'last_save_time'
+
+    def __init__(self, file_name, arguments, interval=RUN_CHECKPOINT_INTERVAL):
+        self.file_name = file_name
+        # JSON round trip: tuples become lists, as in the saved file
+        self.arguments = json.loads(json.dumps(arguments))
+        self.completed = set()
+        # fetcher name --> set of URLs
+        self.instances_done = {}
+        self.interval = interval
+        self.last_save_time = time.time()
+
+    def load(self):
+        """
+        Return the SearxStatisticsResult of the saved run, None if there is no run to resume
+        """
+        try:
+            with open(self.file_name) as input_file:
+                content = json.load(input_file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if content.get('arguments') != self.arguments:
+            print('⚠️ {0}: the arguments of the saved run are different, start from the beginning'
+                  .format(self.file_name))
+            return None
+        self.completed = set(content['completed'])
+        self.instances_done = {name: set(urls) for name, urls in content['instances_done'].items()}
+        print('♻️  Resume the run: {0} done'.format(', '.join(sorted(self.completed)) or 'no fetcher'))
+        return SearxStatisticsResult.from_dict(content['result'], private=content['private'])
+
+    def is_completed(self, name):
+        return name in self.completed
+
+    def get_instances_done(self, name):
+        return self.instances_done.get(name, set())
+
+    def instance_done(self, name, url, searx_stats_result: SearxStatisticsResult):
+        self.instances_done.setdefault(name, set()).add(url)
+        if time.time() - self.last_save_time >= self.interval:
+            self.save(searx_stats_result)
+
+    def fetcher_done(self, name, searx_stats_result: SearxStatisticsResult):
+        self.completed.add(name)
+        self.instances_done.pop(name, None)
+        self.save(searx_stats_result)
+
+    def save(self, searx_stats_result: SearxStatisticsResult):
+        self.last_save_time = time.time()
+        try:
+            # the fetchers running in a thread may modify the result during the dump,
+            # or store a value which is not serializable yet: the next checkpoint will be saved
+            content = json.dumps({
+                'arguments': self.arguments,
+                'private': searx_stats_result.private,
+                'completed': sorted(self.completed),
+                'instances_done': {name: sorted(urls) for name, urls in self.instances_done.items()},
+                'result': searx_stats_result.to_dict(),
+            }, ensure_ascii=False)
+        except (RuntimeError, TypeError, ValueError) as ex:
+            print('⚠️ checkpoint skipped: {0}'.format(ex))
+            return
+        # write to a temporary file then rename it: a crash during the write keeps the previous checkpoint
+        output_fd, output_file_name = tempfile.mkstemp(dir=os.path.dirname(self.file_name) or '.',
+                                                       prefix='.searxstats-checkpoint-', suffix='.tmp')
+        try:
+            with os.fdopen(output_fd, 'w') as output_file:
+                output_file.write(content)
+            os.replace(output_file_name, self.file_name)
+        except OSError as ex:
+            print(ex)
+            if os.path.exists(output_file_name):
+                os.remove(output_file_name)
+
+    def remove(self):
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
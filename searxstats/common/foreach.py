@@ -1,8 +1,110 @@
 import inspect
 import asyncio
+import threading
+import contextvars
 
 from .utils import create_task
 
+try:
+    ExceptionGroup
+except NameError:  # Python 3.10
+    from exceptiongroup import ExceptionGroup  # pylint: disable=redefined-builtin, import-error
+
+
+# AdaptiveLimit.name --> AdaptiveLimit.to_dict(), see get_concurrency_statistics
+CONCURRENCY_STATISTICS = {}
+
+# loop time when all the calls to for_each / iter_each must end, see set_run_budget
+RUN_DEADLINE = contextvars.ContextVar('RUN_DEADLINE', default=None)
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit between `floor` and `ceiling`, adjusted with AIMD after each window of calls:
+    * the limit is divided by 2 when the error rate is more than `max_error_rate`,
+      or when the p95 latency is more than `latency_factor` times the best p95 latency seen so far,
+    * otherwise the limit is doubled until the first decrease (slow start), then increased by one.
+
+    The errors are the exceptions, and the results where `is_error(result)` is True (for example a timeout).
+    """
+
+    __slots__ = 'name', 'floor', 'ceiling', 'limit', 'is_error', 'max_error_rate', 'latency_factor', \
+        'slow_start', 'best_p95', 'latencies', 'errors', 'max_limit', 'adjustments', 'lock'
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, floor, ceiling, name=None, is_error=None, max_error_rate=0.1, latency_factor=2):
+        assert 1 <= floor <= ceiling
+        self.name = name
+        self.floor = floor
+        self.ceiling = ceiling
+        self.limit = floor
+        self.is_error = is_error
+        self.max_error_rate = max_error_rate
+        self.latency_factor = latency_factor
+        self.slow_start = True
+        self.best_p95 = None
+        self.latencies = []
+        self.errors = 0
+        self.max_limit = floor
+        self.adjustments = 0
+        self.lock = threading.Lock()
+
+    def report(self, latency, error):
+        with self.lock:
+            self.latencies.append(latency)
+            if error:
+                self.errors += 1
+            # one window: as many calls as the limit
+            if len(self.latencies) < max(self.limit, 4):
+                return
+            latencies = sorted(self.latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            error_rate = self.errors / len(latencies)
+            if error_rate > self.max_error_rate or \
+               (self.best_p95 is not None and p95 > self.best_p95 * self.latency_factor):
+                self.limit = max(self.floor, self.limit // 2)
+                self.slow_start = False
+            elif self.slow_start:
+                self.limit = min(self.ceiling, self.limit * 2)
+            else:
+                self.limit = min(self.ceiling, self.limit + 1)
+            if error_rate <= self.max_error_rate:
+                self.best_p95 = p95 if self.best_p95 is None else min(self.best_p95, p95)
+            self.max_limit = max(self.max_limit, self.limit)
+            self.adjustments += 1
+            self.latencies = []
+            self.errors = 0
+
+    def report_task(self, task, latency):
+        is_error = task.exception() is not None or (self.is_error is not None and self.is_error(task.result()))
+        self.report(latency, is_error)
+
+    def publish(self):
+        """
+        Print the concurrency, and store it for get_concurrency_statistics
+        """
+        if self.name is None:
+            return
+        CONCURRENCY_STATISTICS[self.name] = self.to_dict()
+        print('⚙️  {0}: concurrency {1} (max {2}, between {3} and {4})'.format(
+            self.name, self.limit, self.max_limit, self.floor, self.ceiling))
+
+    def to_dict(self):
+        return {
+            'limit': self.limit,
+            'max_limit': self.max_limit,
+            'floor': self.floor,
+            'ceiling': self.ceiling,
+            'adjustments': self.adjustments,
+        }
+
+    def __repr__(self):
+        return 'AdaptiveLimit({0}, {1})'.format(self.floor, self.ceiling)
+
+
+def get_concurrency_statistics():
+    return dict(CONCURRENCY_STATISTICS)
+
 
 async def _for_each_coroutine(iterator, function, *args):
     for item in iterator:
@@ -74,21 +176,207 @@ async def _for_each_parallel(iterator, function, *args,
         raise errors.pop()
 
 
+def _get_arguments(item):
+    if isinstance(item, (list, tuple)):
+        return item
+    return [item]
+
+
 def _create_list_iterator(iterator):
     """
     helper to be able to call function(*item) later
     """
     for item in iterator:
-        if isinstance(item, (list, tuple)):
-            yield item
-        else:
-            yield [item]
+        yield _get_arguments(item)
+
+
+def set_run_budget(seconds):
+    """
+    All the calls to for_each and iter_each in the current context must end in `seconds`
+    (None: no limit)
+    """
+    RUN_DEADLINE.set(asyncio.get_running_loop().time() + seconds if seconds is not None else None)
+
+
+def _get_end_time(loop, deadline):
+    end_times = [RUN_DEADLINE.get()]
+    if deadline is not None:
+        end_times.append(loop.time() + deadline)
+    end_times = [end_time for end_time in end_times if end_time is not None]
+    return min(end_times) if end_times else None
+
+
+# pylint: disable=too-many-branches, too-many-locals, too-many-statements, too-many-arguments
+async def iter_each(iterator, function, *args,
+                    loop=None,
+                    executor=None,
+                    limit=0,
+                    timeout=None,
+                    deadline=None,
+                    on_timeout=None,
+                    return_exceptions=False,
+                    profile=None):
+    """
+    ```
+    async for item, result in iter_each(iterator, function, *args):
+        ...
+    ```
+    `result` is the value returned by `function(*args, *item)`,
+    the results are yield as soon as the calls are done, not in the order of `iterator`.
+
+    When a call raises an exception, the other calls continue:
+    at the end, an ExceptionGroup with all the exceptions is raised.
+    When `return_exceptions` is True, the exceptions are yield as results instead.
+
+    `iterator` can be an asynchronous iterator: the items are read as the calls are started,
+    so the items can be produced while the previous calls are running.
+
+    `profile` (a common.profile.FetchProfile) records the queue wait and the duration of each call.
+
+    `loop`, `executor` and `limit` are the same as in `for_each`, except that the default `limit` is 0.
+
+    A call lasting more than `timeout` seconds is cancelled, and `on_timeout(*args, *item)` is called.
+    After `deadline` seconds (or at the end of the run budget, see set_run_budget),
+    all the calls in progress are cancelled, and `on_timeout` is called for them and for the items not started.
+    A function running in a thread can't be interrupted: its result is ignored.
+    A call cancelled by something else is also reported to `on_timeout`.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    adaptive_limit = limit if isinstance(limit, AdaptiveLimit) else None
+    end_time = _get_end_time(loop, deadline)
+    is_async_iterator = hasattr(iterator, '__aiter__')
+    item_iterator = aiter(iterator) if is_async_iterator else iter(iterator)
+    iterator_exhausted = False
+    # asynchronous iterator: task reading the next item
+    next_item_task = None
+    # task --> (item, start time)
+    tasks = {}
+    errors = []
+
+    def can_start_task():
+        if adaptive_limit is not None:
+            return len(tasks) < adaptive_limit.limit
+        return limit is None or limit <= 0 or len(tasks) < limit
+
+    def get_wait_timeout():
+        expire_times = []
+        if timeout is not None and tasks:
+            expire_times.append(min(start_time for _, start_time in tasks.values()) + timeout)
+        if end_time is not None:
+            expire_times.append(end_time)
+        return max(0, min(expire_times) - loop.time()) if expire_times else None
+
+    def profile_item_done(item, error=False, timed_out=False):
+        if profile is not None:
+            profile.item_done(_get_arguments(item)[0], error=error, timeout=timed_out)
+
+    def call_on_timeout(item):
+        profile_item_done(item, timed_out=True)
+        if on_timeout is not None:
+            on_timeout(*args, *_get_arguments(item))
+
+    async def call_on_timeout_not_started():
+        nonlocal next_item_task
+        if not is_async_iterator:
+            for item in item_iterator:
+                call_on_timeout(item)
+            return
+        try:
+            if next_item_task is not None:
+                item = await next_item_task
+                next_item_task = None
+                call_on_timeout(item)
+            async for item in item_iterator:
+                call_on_timeout(item)
+        except StopAsyncIteration:
+            pass
+
+    def start_task(item):
+        if profile is not None:
+            profile.item_start(_get_arguments(item)[0])
+        task = create_task(loop, executor, function, *args, *_get_arguments(item))
+        tasks[task] = (item, loop.time())
+
+    try:
+        while True:
+            if is_async_iterator:
+                if not iterator_exhausted and next_item_task is None and can_start_task():
+                    next_item_task = asyncio.ensure_future(anext(item_iterator))
+            else:
+                while not iterator_exhausted and can_start_task():
+                    try:
+                        item = next(item_iterator)
+                    except StopIteration:
+                        iterator_exhausted = True
+                    else:
+                        start_task(item)
+            waited_tasks = set(tasks.keys())
+            if next_item_task is not None:
+                waited_tasks.add(next_item_task)
+            if len(waited_tasks) == 0:
+                break
+            done, _ = await asyncio.wait(waited_tasks, timeout=get_wait_timeout(),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_item_task in done:
+                done.remove(next_item_task)
+                try:
+                    start_task(next_item_task.result())
+                except StopAsyncIteration:
+                    iterator_exhausted = True
+                next_item_task = None
+            for task in done:
+                item, start_time = tasks.pop(task)
+                if task.cancelled():
+                    # not cancelled here (see below), but the item is not done either: same as a timeout
+                    if adaptive_limit is not None:
+                        adaptive_limit.report(loop.time() - start_time, True)
+                    call_on_timeout(item)
+                    continue
+                if adaptive_limit is not None:
+                    adaptive_limit.report_task(task, loop.time() - start_time)
+                profile_item_done(item, error=task.exception() is not None)
+                if task.exception() is not None:
+                    if return_exceptions:
+                        yield item, task.exception()
+                    else:
+                        errors.append(task.exception())
+                    continue
+                yield item, task.result()
+            # cancel the calls after their timeout or after the deadline
+            now = loop.time()
+            deadline_reached = end_time is not None and now >= end_time
+            for task, (item, start_time) in list(tasks.items()):
+                if deadline_reached or (timeout is not None and now - start_time >= timeout):
+                    del tasks[task]
+                    task.cancel()
+                    if adaptive_limit is not None:
+                        adaptive_limit.report(now - start_time, True)
+                    call_on_timeout(item)
+            if deadline_reached:
+                await call_on_timeout_not_started()
+                break
+    finally:
+        # the caller has stopped the iteration
+        for task in tasks:
+            task.cancel()
+        if next_item_task is not None:
+            next_item_task.cancel()
+        if adaptive_limit is not None:
+            adaptive_limit.publish()
+    if errors:
+        raise ExceptionGroup(f'{len(errors)} call(s) to {function.__name__} failed', errors)
 
 
 async def for_each(iterator, function, *args,
                    loop=None,
                    executor=None,
-                   limit=1):
+                   limit=1,
+                   group_errors=False,
+                   timeout=None,
+                   deadline=None,
+                   on_timeout=None,
+                   profile=None):
     """
     If `function` is a coroutine and `limit`is 1, equivalent of
     ```
@@ -111,6 +399,16 @@ async def for_each(iterator, function, *args,
     When `limit` is different from 1, and `function` raises an exception multiple times,
     `for_each` may not raise the first exception.
 
+    When `group_errors` is True, an exception doesn't stop the other calls:
+    all the exceptions are raised at the end in an ExceptionGroup (see iter_each).
+
+    `limit` can be an AdaptiveLimit: the limit is adjusted according to the latency and the errors of the calls.
+    In this case, an exception doesn't stop the other calls either, but only the first exception is raised
+    when `group_errors` is False.
+
+    `timeout`, `deadline`, `on_timeout` and `profile`: see iter_each. The same applies when a run budget is set,
+    and when `iterator` is an asynchronous iterator.
+
     External links to other implementations:
     - https://paco.readthedocs.io/en/latest/api.html#paco.each :
       no support for executor
@@ -122,6 +420,20 @@ async def for_each(iterator, function, *args,
     if loop is None:
         loop = asyncio.get_event_loop()
 
+    has_timeout = timeout is not None or deadline is not None or RUN_DEADLINE.get() is not None
+    use_iter_each = group_errors or profile is not None or hasattr(iterator, '__aiter__')
+    if use_iter_each or has_timeout or isinstance(limit, AdaptiveLimit):
+        try:
+            async for _ in iter_each(iterator, function, *args, loop=loop, executor=executor, limit=limit,
+                                     timeout=timeout, deadline=deadline, on_timeout=on_timeout,
+                                     profile=profile):
+                pass
+        except ExceptionGroup as ex:
+            if group_errors:
+                raise
+            raise ex.exceptions[0] from None
+        return
+
     iterator = _create_list_iterator(iterator)
 
     if limit == 1:
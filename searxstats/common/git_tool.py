@@ -40,3 +40,21 @@ def get_repository(directory, url):
         repo.git.clean('-xdf')
 
     return repo
+
+
+def get_local_head(directory):
+    """
+    Return the commit of HEAD in the repository `directory`, None if there is no repository
+    """
+    try:
+        return git.Repo(directory).head.commit.hexsha
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def get_remote_head(url):
+    """
+    Return the commit of HEAD in the remote repository `url`, without cloning it
+    """
+    output = git.cmd.Git().ls_remote(url, 'HEAD')
+    return output.split()[0] if output else None
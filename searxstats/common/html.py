@@ -1,22 +1,5 @@
-import asyncio
-import concurrent.futures
-
 from lxml import html
 
-FROMSTRING_THREADPOOL = concurrent.futures.ThreadPoolExecutor(max_workers=8)
-
-
-for i in range(0, 8):
-    FROMSTRING_THREADPOOL.submit(lambda: None)
-
-
-async def html_fromstring(content, *args):
-    if len(content) < 128:
-        return html.fromstring(content, *args)
-    else:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(FROMSTRING_THREADPOOL, html.fromstring, content, *args)
-
 
 def extract_text(xpath_results):
     if isinstance(xpath_results, list):
@@ -1,15 +1,27 @@
 import ssl
 import asyncio
-from contextlib import asynccontextmanager
+import collections
+import datetime
+import random
+import email.utils
+import http.cookiejar
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
 from urllib.parse import urlparse
 from enum import Enum
 
 import httpx
+import httpcore
 
 from .utils import exception_to_str
 from .memoize import Memoize
 from .ssl_info import SSL_CONTEXT
-from ..config import TOR_SOCKS_PROXY_HOST, TOR_SOCKS_PROXY_PORT
+from .resolver import DNS_CACHE, CachedDnsNetworkBackend
+from .tor import TOR_CIRCUIT_POOL
+from ..config import TOR_SOCKS_PROXY_HOST, TOR_SOCKS_PROXY_PORT, \
+    HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS, HTTP_POOL_KEEPALIVE_EXPIRY, \
+    HOST_MAX_CONCURRENCY, HOST_MIN_INTERVAL, HOST_DEFAULT_BACKOFF, HOST_MAX_BACKOFF, HTTP_MAX_BODY_SIZE
 
 
 class NetworkType(Enum):
@@ -34,11 +46,87 @@ def get_network_type(url):
     return NetworkType.NORMAL
 
 
-@asynccontextmanager
-async def new_client(*args, **kwargs):
+# NetworkType or (NetworkType.TOR, circuit index) --> (event loop, httpx.AsyncClient), see shared_client
+SHARED_CLIENTS = {}
+# shared clients of the renewed Tor circuits, closed by close_shared_clients
+RETIRED_CLIENTS = []
+
+
+# httpcore exception --> httpx exception with the same name
+HTTPCORE_EXCEPTIONS = {
+    getattr(httpcore, name): getattr(httpx, name)
+    for name in ('ConnectTimeout', 'ReadTimeout', 'WriteTimeout', 'PoolTimeout', 'TimeoutException',
+                 'ConnectError', 'ReadError', 'WriteError', 'NetworkError', 'ProxyError', 'UnsupportedProtocol',
+                 'LocalProtocolError', 'RemoteProtocolError', 'ProtocolError')
+}
+
+
+@contextmanager
+def _map_httpcore_exceptions():
+    try:
+        yield
+    except Exception as ex:
+        for exception_class in type(ex).__mro__:
+            if exception_class in HTTPCORE_EXCEPTIONS:
+                raise HTTPCORE_EXCEPTIONS[exception_class](str(ex)) from ex
+        raise
+
+
+class CachedDnsResponseStream(httpx.AsyncByteStream):
+
+    __slots__ = ('stream', )
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    async def __aiter__(self):
+        with _map_httpcore_exceptions():
+            async for part in self.stream:
+                yield part
+
+    async def aclose(self):
+        if hasattr(self.stream, 'aclose'):
+            with _map_httpcore_exceptions():
+                await self.stream.aclose()
+
+
+class CachedDnsTransport(httpx.AsyncBaseTransport):
     """
-    Create a new httpx.AsyncClient
+    Transport without proxy: the host names are resolved with DNS_CACHE (see CachedDnsNetworkBackend)
+
+    Same as httpx.AsyncHTTPTransport, built on the public API of httpcore.
     """
+
+    __slots__ = ('pool', )
+
+    def __init__(self, limits=httpx.Limits()):
+        self.pool = httpcore.AsyncConnectionPool(ssl_context=SSL_CONTEXT,
+                                                 max_connections=limits.max_connections,
+                                                 max_keepalive_connections=limits.max_keepalive_connections,
+                                                 keepalive_expiry=limits.keepalive_expiry,
+                                                 http1=True, http2=True,
+                                                 network_backend=CachedDnsNetworkBackend(DNS_CACHE))
+
+    async def handle_async_request(self, request):  # pylint: disable=redefined-outer-name
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(scheme=request.url.raw_scheme, host=request.url.raw_host, port=request.url.port,
+                             target=request.url.raw_path),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _map_httpcore_exceptions():
+            core_response = await self.pool.handle_async_request(core_request)
+        return httpx.Response(status_code=core_response.status, headers=core_response.headers,
+                              stream=CachedDnsResponseStream(core_response.stream),
+                              extensions=core_response.extensions)
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+
+def _create_client(*args, tor_circuit=None, **kwargs):
     network_type = NetworkType.NORMAL
     if 'network_type' in kwargs:
         if kwargs['network_type']:
@@ -47,11 +135,80 @@ async def new_client(*args, **kwargs):
             if proxy:
                 kwargs['proxy'] = proxy
         del kwargs['network_type']
-    async with httpx.AsyncClient(*args, **kwargs, verify=SSL_CONTEXT, http2=True, follow_redirects=True) as session:
-        session._network_type = network_type  # pylint: disable=protected-access
+    if tor_circuit is not None:
+        kwargs['proxy'] = tor_circuit.get_proxy_url()
+    if 'proxy' not in kwargs:
+        kwargs['transport'] = CachedDnsTransport(kwargs.pop('limits', httpx.Limits()))
+    client = httpx.AsyncClient(*args, **kwargs, verify=SSL_CONTEXT, http2=True, follow_redirects=True)
+    # pylint: disable=protected-access
+    client._network_type = network_type
+    client._tor_circuit = tor_circuit
+    client._tor_username = tor_circuit.username if tor_circuit is not None else None
+    return client
+
+
+def _get_tor_circuit(network_type, host):
+    if network_type == NetworkType.TOR and host is not None:
+        return TOR_CIRCUIT_POOL.assign(host)
+    return None
+
+
+@asynccontextmanager
+async def new_client(*args, host=None, **kwargs):
+    """
+    Create a new httpx.AsyncClient
+
+    The connections are closed at the end: use it to measure cold connections,
+    or to keep the cookies between requests. Otherwise see shared_client.
+
+    With network_type=NetworkType.TOR, `host` selects the Tor circuit (see TorCircuitPool).
+    """
+    tor_circuit = _get_tor_circuit(kwargs.get('network_type'), host)
+    async with _create_client(*args, tor_circuit=tor_circuit, **kwargs) as session:
         yield session
 
 
+@asynccontextmanager
+async def shared_client(network_type=NetworkType.NORMAL, host=None):
+    """
+    Borrow the long-lived httpx.AsyncClient of `network_type`
+
+    The connections are kept alive and reused by all the fetchers,
+    the cookies are never stored. Set the timeout of each request.
+
+    With network_type=NetworkType.TOR, there is one client per Tor circuit:
+    `host` selects the circuit (see TorCircuitPool).
+    """
+    loop = asyncio.get_running_loop()
+    tor_circuit = _get_tor_circuit(network_type, host)
+    key = (network_type, tor_circuit.index) if tor_circuit is not None else network_type
+    client_loop, client = SHARED_CLIENTS.get(key, (None, None))
+    # pylint: disable=protected-access
+    if client is not None and client_loop is loop and tor_circuit is not None \
+       and client._tor_username != tor_circuit.username:
+        # the circuit has been renewed
+        RETIRED_CLIENTS.append((loop, client))
+        client = None
+    if client is None or client.is_closed or client_loop is not loop:
+        limits = httpx.Limits(max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                              max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS,
+                              keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY)
+        no_cookie_jar = http.cookiejar.CookieJar(policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        client = _create_client(network_type=network_type, limits=limits, cookies=no_cookie_jar,
+                                tor_circuit=tor_circuit)
+        SHARED_CLIENTS[key] = (loop, client)
+    yield client
+
+
+async def close_shared_clients():
+    loop = asyncio.get_running_loop()
+    for client_loop, client in list(SHARED_CLIENTS.values()) + RETIRED_CLIENTS:
+        if client_loop is loop:
+            await client.aclose()
+    SHARED_CLIENTS.clear()
+    RETIRED_CLIENTS.clear()
+
+
 async def _request_unsafe(*args, **kwargs):
     try:
         async with new_client(verify=False) as unsafe_session:
@@ -61,8 +218,127 @@ async def _request_unsafe(*args, **kwargs):
     return None
 
 
-# pylint: disable=too-many-branches
-async def request(method, *args, **kwargs):
+class HostScheduler:
+    """
+    Politeness rules shared by all the requests to the same host:
+    * at most `max_concurrency` requests at the same time,
+    * at least `min_interval` seconds between the start of two requests,
+    * no request until the end of a backoff (HTTP 429 / 503 with Retry-After).
+    """
+
+    __slots__ = 'max_concurrency', 'min_interval', 'max_backoff', 'semaphores', 'next_times'
+
+    def __init__(self, max_concurrency, min_interval, max_backoff):
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.max_backoff = max_backoff
+        # host --> asyncio.Semaphore
+        self.semaphores = {}
+        # host --> loop time when the next request can start
+        self.next_times = {}
+
+    @asynccontextmanager
+    async def slot(self, host):
+        if host is None:
+            yield
+            return
+        semaphore = self.semaphores.get(host)
+        if semaphore is None:
+            semaphore = self.semaphores[host] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            while True:
+                # the next time can be updated by a backoff while sleeping: check again
+                now = loop.time()
+                next_time = self.next_times.get(host, now)
+                if next_time <= now:
+                    break
+                await asyncio.sleep(next_time - now)
+            self.next_times[host] = now + self.min_interval
+            yield
+
+    def backoff(self, host, delay):
+        if host is None:
+            return
+        next_time = asyncio.get_running_loop().time() + min(delay, self.max_backoff)
+        self.next_times[host] = max(self.next_times.get(host, next_time), next_time)
+
+
+# event loop --> HostScheduler
+HOST_SCHEDULERS = weakref.WeakKeyDictionary()
+
+
+def get_host_scheduler():
+    loop = asyncio.get_running_loop()
+    host_scheduler = HOST_SCHEDULERS.get(loop)
+    if host_scheduler is None:
+        host_scheduler = HOST_SCHEDULERS[loop] = HostScheduler(HOST_MAX_CONCURRENCY, HOST_MIN_INTERVAL,
+                                                               HOST_MAX_BACKOFF)
+    return host_scheduler
+
+
+def get_retry_after(response):
+    """
+    Return the delay in seconds from the Retry-After header, or None
+    """
+    retry_after = response.headers.get('retry-after')
+    if retry_after is None:
+        return None
+    try:
+        return max(0, int(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+    return max(0, (retry_date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    # error class ('connect', 'read', 'protocol', 'network') --> maximum number of retries
+    budget: dict
+    # delay before the first retry in seconds, doubled for each retry of the same error class, with jitter
+    backoff: float = 0.5
+    # no retry starts after `deadline` seconds since the first request
+    deadline: float = 30
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy(budget={'connect': 2, 'read': 1, 'protocol': 1, 'network': 1})
+# retry only when the connection has failed: the response time of the request is the time of one full attempt
+CONNECT_RETRY_POLICY = RetryPolicy(budget={'connect': 2})
+
+
+class LatencyTracker:
+    """
+    Latency of the last successful requests
+    """
+
+    __slots__ = ('latencies', )
+
+    def __init__(self, size=500):
+        self.latencies = collections.deque(maxlen=size)
+
+    def add(self, latency):
+        self.latencies.append(latency)
+
+    def percentile(self, percent, min_count=20):
+        """
+        Return None if there are less than `min_count` latencies
+        """
+        if len(self.latencies) < min_count:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+
+LATENCY_TRACKER = LatencyTracker()
+
+
+async def request(method, *args, retry: RetryPolicy = None, hedge=None, session=None, **kwargs):
     """
     response, error = session.get(*args, **kwargs)
 
@@ -70,23 +346,131 @@ async def request(method, *args, **kwargs):
     HTTP status code different from 200 is an error.
 
     Doesn't trigger an exception.
+
+    The requests follow the politeness rules of the host (see HostScheduler).
+
+    `retry` is a RetryPolicy: by default, one request only.
+
+    `hedge`: if there is no response after `hedge` seconds, send a second request
+    and use the first response. If `hedge` is True, wait the p95 latency of the previous requests.
+
+    `session` is the httpx.AsyncClient of `method`, if `method` is not a method of the client.
+    """
+    url = kwargs.get('url', args[0] if len(args) > 0 else None)
+    host = get_host(str(url)) if url is not None else None
+    if session is None:
+        session = getattr(method, '__self__', None)
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    retry_counts = {}
+    while True:
+        if hedge:
+            response, error, error_class = await _hedged_request(hedge, method, host, session, *args, **kwargs)
+        else:
+            response, error, error_class = await _scheduled_request(method, host, session, *args, **kwargs)
+        if retry is None or error_class is None:
+            break
+        retry_count = retry_counts.get(error_class, 0)
+        if retry_count >= retry.budget.get(error_class, 0):
+            break
+        delay = retry.backoff * (2 ** retry_count) * random.uniform(0.5, 1.5)
+        if loop.time() + delay - start_time > retry.deadline:
+            break
+        retry_counts[error_class] = retry_count + 1
+        await asyncio.sleep(delay)
+    return response, error
+
+
+# pylint: disable=too-many-arguments
+async def _hedged_request(hedge, method, host, session, *args, **kwargs):
+    hedge_delay = LATENCY_TRACKER.percentile(95) if hedge is True else hedge
+    first_task = asyncio.ensure_future(_scheduled_request(method, host, session, *args, **kwargs))
+    if hedge_delay is None:
+        return await first_task
+    try:
+        done, _ = await asyncio.wait({first_task}, timeout=hedge_delay)
+    except BaseException:
+        # cancelled: the request must not keep the slot of the host
+        first_task.cancel()
+        raise
+    if done:
+        return first_task.result()
+    pending = {first_task, asyncio.ensure_future(_scheduled_request(method, host, session, *args, **kwargs))}
+    try:
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                # use an error only if there is no other request in progress
+                if result[1] is None or not pending:
+                    return result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _scheduled_request(method, host, session, *args, **kwargs):
+    host_scheduler = get_host_scheduler()
+    tor_circuit = getattr(session, '_tor_circuit', None)
+    async with host_scheduler.slot(host):
+        if tor_circuit is None:
+            response, error, error_class = await _request(method, *args, **kwargs)
+        else:
+            TOR_CIRCUIT_POOL.start(tor_circuit)
+            try:
+                response, error, error_class = await _request(method, *args, **kwargs)
+            except BaseException:
+                # cancelled (see _hedged_request): not an error of the circuit
+                TOR_CIRCUIT_POOL.cancel(tor_circuit)
+                raise
+            latency = response.elapsed.total_seconds() if response is not None else None
+            TOR_CIRCUIT_POOL.report(tor_circuit, session._tor_username, latency)  # pylint: disable=protected-access
+    if response is not None:
+        if error is None:
+            LATENCY_TRACKER.add(response.elapsed.total_seconds())
+        elif response.status_code in (429, 503):
+            retry_after = get_retry_after(response)
+            if retry_after is not None or response.status_code == 429:
+                host_scheduler.backoff(host, retry_after if retry_after is not None else HOST_DEFAULT_BACKOFF)
+    return response, error, error_class
+
+
+def _is_caused_by(ex, exception_class):
+    while ex is not None:
+        if isinstance(ex, exception_class):
+            return True
+        ex = ex.__cause__ or ex.__context__
+    return False
+
+
+# pylint: disable=too-many-branches, too-many-statements
+async def _request(method, *args, **kwargs):
+    """
+    Return response, error, error_class
+
+    error_class is the RetryPolicy error class, None if the request must not be retried.
     """
     response = None
     error = None
+    error_class = None
     try:
         response = await method(*args, **kwargs)
     except httpx.ConnectTimeout:
         error = 'Connection timed out'
+        error_class = 'connect'
     except asyncio.TimeoutError:
         error = 'Connection timed out (asyncio)'
+        error_class = 'connect'
     except httpx.ReadTimeout:
         error = 'Read timeout'
+        error_class = 'read'
     except httpx.DecodingError:
         error = 'Decoding error'
     except httpx.TooManyRedirects:
         error = 'Redirect loop error'
     except httpx.ProtocolError:
         error = 'Protocol error'
+        error_class = 'protocol'
     except httpx.NetworkError as ex:
         # args[0] is the wrapped exception
         wrapped_ex = ex.args[0]
@@ -94,6 +478,9 @@ async def request(method, *args, **kwargs):
             error = 'Connection refused'
         else:  # socket.gaierror, ssl.SSLError, h11._util.RemoteProtocolError
             error = exception_to_str(wrapped_ex)
+            # the TLS and certificate errors happen again on retry
+            if not _is_caused_by(ex, ssl.SSLError):
+                error_class = 'network'
     except httpx.ProxyError as ex:
         error = exception_to_str(ex)
         session = getattr(method, '__self__', None)
@@ -113,8 +500,62 @@ async def request(method, *args, **kwargs):
     else:
         if response.status_code != 200:
             error = 'HTTP status code ' + str(response.status_code)
-    return response, error
+    return response, error, error_class
+
+
+def is_timeout_error(error):
+    """
+    True if `error`, an error message returned by `request`, is a timeout
+    """
+    return error in ('Connection timed out', 'Connection timed out (asyncio)', 'Read timeout')
 
 
 async def get(session, *args, **kwargs):
     return await request(session.get, *args, **kwargs)
+
+
+async def read_until(response, until=None, max_size=HTTP_MAX_BODY_SIZE):
+    """
+    Read the body of a streamed response by chunks,
+    stop when until(content) is True or when the body is larger than max_size.
+
+    response.content and response.text are set to the read part of the body.
+
+    Return True if the body is complete or if until(content) is True.
+    """
+    content = bytearray()
+    complete = True
+    async for chunk in response.aiter_bytes():
+        content.extend(chunk)
+        if len(content) > max_size:
+            del content[max_size:]
+            complete = False
+            break
+        if until is not None and until(content):
+            break
+    # pylint: disable=protected-access
+    response._content = bytes(content)
+    return complete or (until is not None and until(content))
+
+
+async def get_stream(session, url, *args, until=None, max_size=HTTP_MAX_BODY_SIZE, **kwargs):
+    """
+    response, error = get_stream(session, url, until=lambda content: b'</head>' in content)
+
+    Same as get, except that at most `max_size` bytes of the body are read,
+    and the reading stops as soon as `until(content)` is True.
+
+    Without `until`, a body larger than `max_size` is an error.
+    """
+    complete = True
+
+    async def stream_get(*args, **kwargs):
+        nonlocal complete
+        async with session.stream('GET', *args, **kwargs) as response:
+            complete = await read_until(response, until, max_size)
+        return response
+
+    response, error = await request(stream_get, url, *args, session=session, **kwargs)
+    if error is None and not complete:
+        error = 'Response too large'
+    return response, error
@@ -1,8 +1,17 @@
 import time
+import asyncio
 import atexit
+import collections
+import concurrent.futures
 import inspect
 import copy
+import os
 import os.path
+import pickle
+import sqlite3
+import tempfile
+import threading
+from types import MappingProxyType
 import yaml
 try:
     from yaml import CLoader as Loader, CDumper as Dumper
@@ -16,6 +25,96 @@ class NotCachedValueClass():
 
 NOT_CACHED_VALUE = NotCachedValueClass()
 
+# Default maximum number of entries per function for MemoizeToDisk
+DEFAULT_MAX_ENTRIES = 10000
+
+# Default maximum number of entries per function for Memoize
+DEFAULT_MEMOIZE_MAXSIZE = 4096
+
+# Maximum number of frozen values kept in memory per function for MemoizeToDisk(frozen=True)
+DEFAULT_FROZEN_MAXSIZE = 1024
+
+
+class MemoizeStatistics:
+    """
+    Cache usage of one memoized function
+    """
+
+    __slots__ = 'hits', 'misses', 'expired', 'stale', 'rejected', 'miss_time', 'lock'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+            # misses because the value has expired (included in misses)
+            self.expired = 0
+            # expired values returned while they are refreshed in the background
+            self.stale = 0
+            # results not stored because validate_result returned False
+            self.rejected = 0
+            # time spent in the wrapped function on a miss, in seconds
+            self.miss_time = 0.0
+
+    def add_hit(self):
+        with self.lock:
+            self.hits += 1
+
+    def add_expired(self):
+        with self.lock:
+            self.expired += 1
+
+    def add_stale(self):
+        with self.lock:
+            self.stale += 1
+
+    def add_miss(self, duration, rejected):
+        with self.lock:
+            self.misses += 1
+            self.miss_time += duration
+            if rejected:
+                self.rejected += 1
+
+    def to_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'stale': self.stale,
+            'rejected': self.rejected,
+            'miss_time': round(self.miss_time, 3),
+        }
+
+
+# storage key ('module.function') --> MemoizeStatistics
+MEMOIZE_STATISTICS = {}
+
+# refresh of the stale values (see stale_time)
+REFRESH_THREADPOOL = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+BACKGROUND_REFRESH = set()
+
+
+def add_background_refresh(future):
+    BACKGROUND_REFRESH.add(future)
+
+    def on_done(future):
+        BACKGROUND_REFRESH.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print('Background refresh error', future.exception())
+
+    future.add_done_callback(on_done)
+
+
+async def wait_background_refresh():
+    """
+    Wait until the stale values are refreshed
+    """
+    while BACKGROUND_REFRESH:
+        await asyncio.wait([asyncio.wrap_future(future) for future in list(BACKGROUND_REFRESH)])
+
 
 class CacheStorage:
 
@@ -30,6 +129,19 @@ class CacheStorage:
     def put(self, args, value):
         raise ValueError('Not Implemented')
 
+    # pylint: disable=no-self-use, unused-argument
+    def put_failure(self, args, value):
+        """
+        Store a value rejected by validate_result (see negative_expire_time)
+        """
+
+    # pylint: disable=no-self-use, unused-argument
+    def get_stale(self, args, stale_time):
+        """
+        Return the value if it has expired less than `stale_time` seconds ago
+        """
+        return NOT_CACHED_VALUE
+
 
 class SimpleCacheStorage(CacheStorage):
 
@@ -44,54 +156,261 @@ class SimpleCacheStorage(CacheStorage):
         self.data[args] = value
 
 
+class LRUCacheStorage(CacheStorage):
+    """
+    Keep at most `maxsize` values, the least recently used value is removed first.
+
+    Thread safe.
+    """
+
+    def __init__(self, maxsize):
+        super(LRUCacheStorage, self).__init__()
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, args):
+        with self.lock:
+            value = self.data.get(args, NOT_CACHED_VALUE)
+            if value is not NOT_CACHED_VALUE:
+                self.data.move_to_end(args)
+            return value
+
+    def put(self, args, value):
+        with self.lock:
+            self.data[args] = value
+            self.data.move_to_end(args)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def freeze(value):
+    """
+    Return a read-only version of value:
+    dict are replaced by MappingProxyType, list by tuple, set by frozenset.
+    """
+    if isinstance(value, MappingProxyType):
+        return value
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+
+def unfreeze(value):
+    """
+    Return a mutable copy of value (see freeze).
+
+    The tuples are kept as tuples, except the tuples created by freeze from a list:
+    they can't be distinguished and are converted to lists.
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: unfreeze(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [unfreeze(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return set(value)
+    return value
+
+
 class ExpireCacheStorage(CacheStorage):
+    """
+    By default, get and put return a deep copy of the value.
+
+    If `frozen` is True, the values are frozen once (see freeze),
+    then get returns the same read-only object without any copy.
+    The frozen values are kept in `frozen_values`, a LRUCacheStorage.
+
+    put_failure stores a value which expires after `negative_expire_time` seconds,
+    this time is doubled after each consecutive failure (up to `expire_time`).
+    """
 
-    __slots__ = 'data', 'expire_time'
+    __slots__ = 'data', 'expire_time', 'negative_expire_time', 'frozen', 'frozen_values', 'statistics'
 
-    def __init__(self, data, expire_time):
+    # pylint: disable=too-many-arguments
+    def __init__(self, data, expire_time, frozen=False, negative_expire_time=None, frozen_values=None):
         super(ExpireCacheStorage, self).__init__()
         self.data = data
         self.expire_time = expire_time
+        self.negative_expire_time = negative_expire_time
+        self.frozen = frozen
+        # args --> (timestamp, expire_time, frozen value)
+        if frozen_values is None and frozen:
+            frozen_values = LRUCacheStorage(DEFAULT_FROZEN_MAXSIZE)
+        self.frozen_values = frozen_values
+        # MemoizeStatistics to count the expired values, set by MemoizeToDisk
+        self.statistics = None
+
+    def _get_expire_time(self, raw_data):
+        failures = raw_data.get('f', 0)
+        if failures == 0 or self.negative_expire_time is None:
+            return self.expire_time
+        negative_expire_time = self.negative_expire_time * 2 ** min(failures - 1, 16)
+        if self.expire_time is not None:
+            return min(negative_expire_time, self.expire_time)
+        return negative_expire_time
+
+    @staticmethod
+    def _is_expired(timestamp, expire_time):
+        return expire_time is not None and (time.time() - timestamp) > expire_time
 
     def get(self, args):
+        if self.frozen:
+            frozen_value = self.frozen_values.get(args)
+            if frozen_value is not NOT_CACHED_VALUE and not self._is_expired(frozen_value[0], frozen_value[1]):
+                return frozen_value[2]
         raw_data = self.data.get(args, None)
         if raw_data is None:
             return NOT_CACHED_VALUE
         timestamp = raw_data['t']
         value = raw_data['v']
-        if self.expire_time is not None and (time.time() - timestamp) > self.expire_time:
+        expire_time = self._get_expire_time(raw_data)
+        if self._is_expired(timestamp, expire_time):
+            if self.statistics is not None:
+                self.statistics.add_expired()
             return NOT_CACHED_VALUE
+        if self.frozen:
+            value = freeze(value)
+            self.frozen_values.put(args, (timestamp, expire_time, value))
+            return value
         return copy.deepcopy(value)
 
+    def get_stale(self, args, stale_time):
+        raw_data = self.data.get(args, None)
+        # the failures are not returned as stale values
+        if raw_data is None or raw_data.get('f', 0) > 0 or self.expire_time is None:
+            return NOT_CACHED_VALUE
+        if (time.time() - raw_data['t']) > self.expire_time + stale_time:
+            return NOT_CACHED_VALUE
+        if self.frozen:
+            return freeze(raw_data['v'])
+        return copy.deepcopy(raw_data['v'])
+
     def put(self, args, value):
-        self.data[args] = {
-            't': time.time(),
-            'v': copy.deepcopy(value)
-        }
+        self._put(args, value, 0)
+
+    def put_failure(self, args, value):
+        if self.negative_expire_time is None:
+            return
+        previous_raw_data = self.data.get(args, None) or {}
+        self._put(args, value, previous_raw_data.get('f', 0) + 1)
 
+    def _put(self, args, value, failures):
+        timestamp = time.time()
+        if self.frozen:
+            value = freeze(value)
+            raw_data = {
+                't': timestamp,
+                # the persisted value is a plain copy: MappingProxyType can't be serialized
+                'v': unfreeze(value)
+            }
+        else:
+            raw_data = {
+                't': timestamp,
+                'v': copy.deepcopy(value)
+            }
+        if failures > 0:
+            raw_data['f'] = failures
+        if self.frozen:
+            self.frozen_values.put(args, (timestamp, self._get_expire_time(raw_data), value))
+        self.data[args] = raw_data
 
-class FileStorageBackend():
 
-    __slots__ = 'file_name', 'storage'
+def compact_entries(entries, expire_time, max_entries, now=None):
+    """
+    Remove from `entries` (the content of an ExpireCacheStorage)
+    the expired entries and the oldest entries above `max_entries`.
+
+    Return the number of removed entries.
+    """
+    if now is None:
+        now = time.time()
+    removed_keys = []
+    kept_items = []
+    for args, raw_data in list(entries.items()):
+        if expire_time is not None and (now - raw_data['t']) > expire_time:
+            removed_keys.append(args)
+        else:
+            kept_items.append((raw_data['t'], args))
+    if max_entries is not None and len(kept_items) > max_entries:
+        kept_items.sort(key=lambda item: item[0], reverse=True)
+        removed_keys.extend(args for _, args in kept_items[max_entries:])
+    for args in removed_keys:
+        entries.pop(args, None)
+    return len(removed_keys)
+
+
+class StorageBackend():
+    """
+    Base class of the storage backends.
+
+    `policies` maps a storage key to (expire_time, max_entries):
+    MemoizeToDisk registers each decorated function, so the expired entries can be dropped
+    even if the function is not called during the run.
+
+    `frozen_values` maps a storage key to the frozen values of ExpireCacheStorage:
+    they are dropped with the entries (see erase_by_name and compact).
+    """
+
+    __slots__ = 'policies', 'frozen_values'
 
     def __init__(self):
+        self.policies = {}
+        self.frozen_values = {}
+
+    def register(self, key, expire_time=None, max_entries=None):
+        self.policies[key] = (expire_time, max_entries)
+
+    def get_frozen_values(self, key, frozen):
+        if not frozen:
+            return None
+        if key not in self.frozen_values:
+            self.frozen_values[key] = LRUCacheStorage(DEFAULT_FROZEN_MAXSIZE)
+        return self.frozen_values[key]
+
+    def clear_frozen_values(self, name_start=''):
+        for key, frozen_values in list(self.frozen_values.items()):
+            if key.startswith(name_start):
+                frozen_values.clear()
+
+    def compact(self, drop_unknown=False):
+        raise ValueError('Not Implemented')
+
+
+class FileStorageBackend(StorageBackend):
+
+    __slots__ = 'file_name', 'storage', 'lock'
+
+    def __init__(self):
+        super().__init__()
         self.file_name = None
         self.storage = None
+        self.lock = threading.Lock()
 
     def bind_to_file(self, file_name):
         self.file_name = file_name
         self.storage = self._load_cache()
+        self.compact()
         atexit.register(self._write_cache)
 
     def nobinding(self):
         self.storage = {}
 
-    def get_cache_storage(self, key, expire_time=None):
+    def get_cache_storage(self, key, expire_time=None, frozen=False, negative_expire_time=None):
         if self.storage is None:
             raise ValueError('FileStorageBackend is not bound to a file')
         if key not in self.storage:
             self.storage[key] = {}
-        return ExpireCacheStorage(self.storage[key], expire_time=expire_time)
+        return ExpireCacheStorage(self.storage[key], expire_time=expire_time, frozen=frozen,
+                                  negative_expire_time=negative_expire_time,
+                                  frozen_values=self.get_frozen_values(key, frozen))
 
     def _load_cache(self):
         if self.file_name is not None:
@@ -114,30 +433,296 @@ class FileStorageBackend():
     def _write_cache(self):
         if self.file_name is not None:
             print('\nSaving cache {}'.format(self.file_name))
-            try:
-                with open(self.file_name, "w") as output_file:
-                    output_content = yaml.dump(self.storage, Dumper=Dumper)
-                    output_file.write(output_content)
-            except Exception as ex:
-                print(ex)
+            self.compact()
+            # the other threads may add entries while the cache is dumped: work on a snapshot
+            snapshot = {key: dict(value) for key, value in list(self.storage.items())}
+            with self.lock:
+                # write to a temporary file then rename it:
+                # a crash during the write never replaces a valid cache with a truncated one
+                output_fd, output_file_name = tempfile.mkstemp(dir=os.path.dirname(self.file_name) or '.',
+                                                               prefix='.searxstats-cache-', suffix='.tmp')
+                try:
+                    with os.fdopen(output_fd, "w") as output_file:
+                        output_content = yaml.dump(snapshot, Dumper=Dumper)
+                        output_file.write(output_content)
+                    os.replace(output_file_name, self.file_name)
+                except Exception as ex:
+                    print(ex)
+                    if os.path.exists(output_file_name):
+                        os.remove(output_file_name)
+
+    def checkpoint(self):
+        self._write_cache()
+
+    def compact(self, drop_unknown=False):
+        if self.storage is None:
+            raise ValueError('FileStorageBackend is not bound to a file')
+        self.clear_frozen_values()
+        removed_count = 0
+        for key, entries in list(self.storage.items()):
+            if key in self.policies:
+                expire_time, max_entries = self.policies[key]
+                removed_count += compact_entries(entries, expire_time, max_entries)
+            elif drop_unknown:
+                removed_count += len(entries)
+                del self.storage[key]
+        return removed_count
 
     def erase_by_name(self, name_start):
         if self.storage is None:
             raise ValueError('FileStorageBackend is not bound to a file')
+        self.clear_frozen_values(name_start)
         for key in self.storage:
             if key.startswith(name_start):
                 self.storage[key] = {}
 
 
+class SqliteCacheData():
+    """
+    dict-like view of one namespace of a SqliteStorageBackend.
+
+    Only `get` and `__setitem__` are implemented: this is what ExpireCacheStorage uses.
+    Each entry is read and written on demand.
+    """
+
+    __slots__ = 'backend', 'name'
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def get(self, args, default=None):
+        return self.backend.read_entry(self.name, args, default)
+
+    def __setitem__(self, args, raw_data):
+        self.backend.write_entry(self.name, args, raw_data)
+
+
+class SqliteStorageBackend(StorageBackend):
+    """
+    Store each entry in a row of a SQLite table keyed by (function key, argument key).
+
+    Contrary to FileStorageBackend, nothing is loaded at startup and nothing is written at exit:
+    the entries are read lazily and written one by one.
+    """
+
+    __slots__ = 'file_name', 'connection', 'lock'
+
+    def __init__(self):
+        super().__init__()
+        self.file_name = None
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def bind_to_file(self, file_name, yaml_file_name=None):
+        self.file_name = file_name
+        migrate = yaml_file_name is not None and os.path.exists(yaml_file_name) and not os.path.exists(file_name)
+        self._connect(file_name)
+        if migrate:
+            self._migrate_from_yaml(yaml_file_name)
+        self.compact()
+        atexit.register(self.close)
+
+    def nobinding(self):
+        self.file_name = None
+        self._connect(':memory:')
+
+    def _connect(self, file_name):
+        self.connection = sqlite3.connect(file_name, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            if file_name != ':memory:':
+                self.connection.execute('PRAGMA journal_mode=WAL')
+                self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS memoize ('
+                                    'name TEXT NOT NULL, '
+                                    'key TEXT NOT NULL, '
+                                    'timestamp REAL NOT NULL, '
+                                    'value BLOB NOT NULL, '
+                                    'failures INTEGER NOT NULL DEFAULT 0, '
+                                    'PRIMARY KEY (name, key))')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(memoize)')]
+            if 'failures' not in columns:
+                self.connection.execute('ALTER TABLE memoize ADD COLUMN failures INTEGER NOT NULL DEFAULT 0')
+
+    def _migrate_from_yaml(self, yaml_file_name):
+        yaml_backend = FileStorageBackend()
+        yaml_backend.file_name = yaml_file_name
+        content = yaml_backend._load_cache()  # pylint: disable=protected-access
+        print('Migrate cache {} to {}'.format(yaml_file_name, self.file_name))
+        rows = []
+        for name, entries in content.items():
+            for args, raw_data in (entries or {}).items():
+                rows.append((name, self._key_to_str(args), raw_data['t'], self._dumps(raw_data['v']),
+                             raw_data.get('f', 0)))
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany('INSERT OR REPLACE INTO memoize VALUES (?, ?, ?, ?, ?)', rows)
+            self.connection.execute('COMMIT')
+
+    @staticmethod
+    def _key_to_str(args):
+        return repr(args)
+
+    @staticmethod
+    def _dumps(value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _check_binding(self):
+        if self.connection is None:
+            raise ValueError('SqliteStorageBackend is not bound to a file')
+
+    def get_cache_storage(self, key, expire_time=None, frozen=False, negative_expire_time=None):
+        self._check_binding()
+        return ExpireCacheStorage(SqliteCacheData(self, key), expire_time=expire_time, frozen=frozen,
+                                  negative_expire_time=negative_expire_time,
+                                  frozen_values=self.get_frozen_values(key, frozen))
+
+    def read_entry(self, name, args, default=None):
+        with self.lock:
+            row = self.connection.execute('SELECT timestamp, value, failures FROM memoize WHERE name=? AND key=?',
+                                          (name, self._key_to_str(args))).fetchone()
+        if row is None:
+            return default
+        try:
+            value = pickle.loads(row[1])
+        except Exception:
+            # the value can't be loaded anymore (for example a class has been renamed)
+            return default
+        raw_data = {'t': row[0], 'v': value}
+        if row[2] > 0:
+            raw_data['f'] = row[2]
+        return raw_data
+
+    def write_entry(self, name, args, raw_data):
+        value = self._dumps(raw_data['v'])
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO memoize VALUES (?, ?, ?, ?, ?)',
+                                    (name, self._key_to_str(args), raw_data['t'], value, raw_data.get('f', 0)))
+
+    def erase_by_name(self, name_start):
+        self._check_binding()
+        self.clear_frozen_values(name_start)
+        with self.lock:
+            self.connection.execute('DELETE FROM memoize WHERE substr(name, 1, ?) = ?',
+                                    (len(name_start), name_start))
+
+    def checkpoint(self):
+        # each entry is already committed: move the WAL content to the database file
+        if self.connection is not None:
+            self.compact()
+            with self.lock:
+                self.connection.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def compact(self, drop_unknown=False):
+        self._check_binding()
+        self.clear_frozen_values()
+        now = time.time()
+        removed_count = 0
+        with self.lock:
+            self.connection.execute('BEGIN')
+            for key, (expire_time, max_entries) in self.policies.items():
+                if expire_time is not None:
+                    removed_count += self.connection.execute(
+                        'DELETE FROM memoize WHERE name=? AND timestamp < ?', (key, now - expire_time)).rowcount
+                if max_entries is not None:
+                    removed_count += self.connection.execute(
+                        'DELETE FROM memoize WHERE name=? AND key NOT IN '
+                        '(SELECT key FROM memoize WHERE name=? ORDER BY timestamp DESC LIMIT ?)',
+                        (key, key, max_entries)).rowcount
+            if drop_unknown:
+                placeholders = ', '.join('?' * len(self.policies))
+                removed_count += self.connection.execute(
+                    'DELETE FROM memoize WHERE name NOT IN ({})'.format(placeholders),
+                    tuple(self.policies.keys())).rowcount
+            self.connection.execute('COMMIT')
+        return removed_count
+
+    def vacuum(self):
+        self._check_binding()
+        with self.lock:
+            self.connection.execute('VACUUM')
+
+    def close(self):
+        if self.connection is not None:
+            self.compact()
+            with self.lock:
+                self.connection.close()
+                self.connection = None
+
+
+class DefaultStorageBackend(StorageBackend):
+    """
+    The storage backend used by default by MemoizeToDisk.
+
+    MemoizeToDisk gets its storage backend when the function is decorated,
+    but the backend is selected later by bind_to_file_name: all calls are forwarded to `backend`.
+    """
+
+    __slots__ = ('backend', )
+
+    def __init__(self):
+        super().__init__()
+        self.backend = None
+
+    def bind_to_file(self, file_name):
+        if file_name.endswith(('.yaml', '.yml')):
+            backend = FileStorageBackend()
+            backend.policies = self.policies
+            backend.bind_to_file(file_name)
+        else:
+            backend = SqliteStorageBackend()
+            backend.policies = self.policies
+            backend.bind_to_file(file_name, os.path.splitext(file_name)[0] + '.yaml')
+        self.backend = backend
+
+    def nobinding(self):
+        backend = FileStorageBackend()
+        backend.policies = self.policies
+        backend.nobinding()
+        self.backend = backend
+
+    def get_cache_storage(self, key, expire_time=None, frozen=False, negative_expire_time=None):
+        if self.backend is None:
+            raise ValueError('DefaultStorageBackend is not bound to a file')
+        return self.backend.get_cache_storage(key, expire_time=expire_time, frozen=frozen,
+                                              negative_expire_time=negative_expire_time)
+
+    def erase_by_name(self, name_start):
+        if self.backend is None:
+            raise ValueError('DefaultStorageBackend is not bound to a file')
+        self.backend.erase_by_name(name_start)
+
+    def checkpoint(self):
+        if self.backend is not None:
+            self.backend.checkpoint()
+
+    def compact(self, drop_unknown=False):
+        if self.backend is None:
+            raise ValueError('DefaultStorageBackend is not bound to a file')
+        return self.backend.compact(drop_unknown=drop_unknown)
+
+    def vacuum(self):
+        if isinstance(self.backend, SqliteStorageBackend):
+            self.backend.vacuum()
+
+
 class BaseMemoize:
 
-    __slots__ = 'func_key', 'validate_result', '_func', '_storage'
+    __slots__ = ('func_key', 'validate_result', 'frozen', 'stale_time', 'statistics',
+                 '_func', '_storage', '_in_flight', '_in_flight_lock')
 
-    def __init__(self, storage, func_key=None, validate_result=None):
+    # pylint: disable=too-many-arguments
+    def __init__(self, storage, func_key=None, validate_result=None, frozen=False, stale_time=None):
         self.func_key = func_key
         self.validate_result = validate_result
+        self.frozen = frozen
+        self.stale_time = stale_time
+        self.statistics = None
         self._func = None
         self._storage = storage
+        # cached_key --> future of the call in progress for this key
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
 
     @property
     def storage(self):
@@ -147,8 +732,15 @@ class BaseMemoize:
     def func(self):
         return self._func
 
-    def __call__(self, func):
+    @property
+    def storage_key(self):
+        # Perhaps add ','.join(list(inspect.signature(f).parameters.keys()))
+        return self._func.__module__ + '.' + self._func.__name__
+
+    def __call__(self, func):  # pylint: disable=too-many-statements
         self._func = func
+        self.statistics = MEMOIZE_STATISTICS.setdefault(self.storage_key, MemoizeStatistics())
+        statistics = self.statistics
 
         def func_key_simple(*args, **kwargs):
             if len(kwargs.values()) > 0:
@@ -162,33 +754,134 @@ class BaseMemoize:
         func_key = self.func_key if self.func_key is not None else func_key_simple
         validate_result_func = self.validate_result if self.validate_result is not None else validate_result_true
 
+        def store_result(storage, cached_key, result, start_time):
+            valid = validate_result_func(result)
+            statistics.add_miss(time.perf_counter() - start_time, not valid)
+            if self.frozen:
+                # the caller gets the same read-only value on a cache miss and on a cache hit
+                result = freeze(result)
+            if valid:
+                storage.put(cached_key, result)
+            elif get_stale(storage, cached_key) == NOT_CACHED_VALUE:
+                # a stale value is more useful than the failure: keep it
+                storage.put_failure(cached_key, result)
+            return result
+
+        def copy_result(result):
+            return result if self.frozen else copy.deepcopy(result)
+
+        def get_stale(storage, cached_key):
+            if self.stale_time is None:
+                return NOT_CACHED_VALUE
+            return storage.get_stale(cached_key, self.stale_time)
+
         # function
+        def call_f(storage, cached_key, future, args, kwargs):
+            try:
+                start_time = time.perf_counter()
+                result = store_result(storage, cached_key, func(*args, **kwargs), start_time)
+            except BaseException as ex:
+                future.set_exception(ex)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                with self._in_flight_lock:
+                    del self._in_flight[cached_key]
+
         def wrapped_f(*args, **kwargs):
             storage = self.storage
             cached_key = func_key(*args, **kwargs)
             cached_value = storage.get(cached_key)
             if cached_value != NOT_CACHED_VALUE:
                 # use cache value
+                statistics.add_hit()
                 return cached_value
             # empty cache or expired value
-            result = func(*args, **kwargs)
-            if validate_result_func(result):
-                storage.put(cached_key, result)
-            return result
+            stale_value = get_stale(storage, cached_key)
+            with self._in_flight_lock:
+                future = self._in_flight.get(cached_key)
+                leader = future is None
+                if leader:
+                    future = concurrent.futures.Future()
+                    self._in_flight[cached_key] = future
+            if stale_value != NOT_CACHED_VALUE:
+                # return the stale value now, and refresh it in the background
+                statistics.add_stale()
+                if leader:
+                    refresh = REFRESH_THREADPOOL.submit(call_f, storage, cached_key, future, args, kwargs)
+                    add_background_refresh(refresh)
+                return stale_value
+            if not leader:
+                # another thread is calling func with the same key: wait for its result
+                statistics.add_hit()
+                return copy_result(future.result())
+            return call_f(storage, cached_key, future, args, kwargs)
 
         # coroutine
+        async def call_async_f(storage, cached_key, future, args, kwargs):
+            try:
+                start_time = time.perf_counter()
+                result = store_result(storage, cached_key, await func(*args, **kwargs), start_time)
+            except asyncio.CancelledError:
+                # the waiting tasks call func again (see wait_async_f)
+                future.cancel()
+                raise
+            except BaseException as ex:
+                future.set_exception(ex)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                del self._in_flight[cached_key]
+
+        async def wait_async_f(cached_key, future):
+            """
+            Wait for the result of the task calling func with the same key.
+            Return NOT_CACHED_VALUE if the other task has been cancelled: the caller has to call func.
+            """
+            while future is not None:
+                try:
+                    # shield: cancelling this task must not cancel the other one
+                    return copy_result(await asyncio.shield(future))
+                except asyncio.CancelledError:
+                    if not future.cancelled():
+                        # this task is cancelled
+                        raise
+                # the other task has been cancelled, and has removed its future from _in_flight:
+                # wait for a newer call, if any
+                future = self._in_flight.get(cached_key)
+            return NOT_CACHED_VALUE
+
         async def wrapped_async_f(*args, **kwargs):
             storage = self.storage
             cached_key = func_key(*args, **kwargs)
             cached_value = storage.get(cached_key)
             if cached_value != NOT_CACHED_VALUE:
                 # use cache value
+                statistics.add_hit()
                 return cached_value
             # empty cache or expired value
-            result = await func(*args, **kwargs)
-            if validate_result_func(result):
-                storage.put(cached_key, result)
-            return result
+            future = self._in_flight.get(cached_key)
+            stale_value = get_stale(storage, cached_key)
+            if stale_value != NOT_CACHED_VALUE:
+                # return the stale value now, and refresh it in the background
+                statistics.add_stale()
+                if future is None:
+                    future = self._create_async_future(cached_key)
+                    refresh = asyncio.ensure_future(call_async_f(storage, cached_key, future, args, kwargs))
+                    add_background_refresh(refresh)
+                return stale_value
+            if future is not None:
+                # another task is calling func with the same key: wait for its result
+                result = await wait_async_f(cached_key, future)
+                if result != NOT_CACHED_VALUE:
+                    statistics.add_hit()
+                    return result
+            future = self._create_async_future(cached_key)
+            return await call_async_f(storage, cached_key, future, args, kwargs)
 
         if inspect.iscoroutinefunction(func):
             wrapped = wrapped_async_f
@@ -200,8 +893,15 @@ class BaseMemoize:
         wrapped.__doc__ = self.func.__doc__
         return wrapped
 
+    def _create_async_future(self, cached_key):
+        future = asyncio.get_event_loop().create_future()
+        # the exception is raised in the first task: don't warn if there is no other task
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[cached_key] = future
+        return future
+
 
-DEFAULT_STORAGE_BACKEND = FileStorageBackend()
+DEFAULT_STORAGE_BACKEND = DefaultStorageBackend()
 
 
 def bind_to_file_name(file_name):
@@ -216,26 +916,114 @@ def erase_by_name(name_start):
     DEFAULT_STORAGE_BACKEND.erase_by_name(name_start)
 
 
+def checkpoint():
+    DEFAULT_STORAGE_BACKEND.checkpoint()
+
+
+def compact():
+    """
+    Drop the expired entries, the oldest entries above the limit of each function,
+    and the entries of the functions which don't exist anymore.
+
+    Return the number of removed entries.
+    """
+    removed_count = DEFAULT_STORAGE_BACKEND.compact(drop_unknown=True)
+    DEFAULT_STORAGE_BACKEND.vacuum()
+    return removed_count
+
+
+def reset_statistics():
+    for statistics in MEMOIZE_STATISTICS.values():
+        statistics.reset()
+
+
+def get_statistics():
+    """
+    Return the cache usage of each memoized function called at least once
+    """
+    return {
+        key: statistics.to_dict()
+        for key, statistics in sorted(MEMOIZE_STATISTICS.items())
+        if statistics.hits > 0 or statistics.misses > 0
+    }
+
+
+def print_statistics():
+    print('\n{0:60} {1:>6} {2:>6} {3:>7} {4:>6} {5:>8} {6:>10}'.format(
+        'Memoize', 'hits', 'misses', 'expired', 'stale', 'rejected', 'miss time'))
+    for key, statistics in get_statistics().items():
+        print('{0:60} {1[hits]:6} {1[misses]:6} {1[expired]:7} {1[stale]:6} {1[rejected]:8} {1[miss_time]:10.3f}'
+              .format(key, statistics))
+
+
+async def checkpoint_async():
+    """
+    Save the cache without blocking the event loop
+    """
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, checkpoint)
+
+
+async def checkpoint_periodically(interval):
+    """
+    Save the cache every `interval` seconds, forever
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await checkpoint_async()
+
+
 class MemoizeToDisk(BaseMemoize):
 
-    __slots__ = 'storage_backend', 'expire_time'
+    __slots__ = 'storage_backend', 'expire_time', 'max_entries', 'negative_expire_time'
 
+    # pylint: disable=too-many-arguments
     def __init__(self, func_key=None, validate_result=None,
-                 storage_backend=DEFAULT_STORAGE_BACKEND, expire_time=24*3600):
-        super().__init__(None, func_key=func_key, validate_result=validate_result)
+                 storage_backend=DEFAULT_STORAGE_BACKEND, expire_time=24*3600, max_entries=DEFAULT_MAX_ENTRIES,
+                 frozen=False, stale_time=None, negative_expire_time=None):
+        """
+        If `frozen` is True, the decorated function returns a read-only value (see freeze)
+        which is not copied on each cache hit. Use unfreeze to get a mutable copy.
+
+        If `stale_time` is set, a value expired less than `stale_time` seconds ago is returned immediately,
+        and the function is called in the background to refresh the value (see wait_background_refresh).
+        The function must not depend on arguments which are not valid after the call (session, driver...).
+
+        If `negative_expire_time` is set, the results rejected by `validate_result` are cached too,
+        during `negative_expire_time` seconds, doubled after each consecutive rejected result.
+        """
+        super().__init__(None, func_key=func_key, validate_result=validate_result, frozen=frozen,
+                         stale_time=stale_time)
         self.storage_backend = storage_backend
         self.expire_time = expire_time
+        self.max_entries = max_entries
+        self.negative_expire_time = negative_expire_time
+
+    def __call__(self, func):
+        wrapped = super().__call__(func)
+        # keep the stale values until the end of the grace period
+        expire_time = self.expire_time
+        if expire_time is not None and self.stale_time is not None:
+            expire_time += self.stale_time
+        self.storage_backend.register(self.storage_key, expire_time=expire_time, max_entries=self.max_entries)
+        return wrapped
 
     @property
     def storage(self):
         if self._storage is None:
-            # Perhaps add ','.join(list(inspect.signature(f).parameters.keys()))
-            storage_key = self._func.__module__ + '.' + self._func.__name__
-            self._storage = self.storage_backend.get_cache_storage(storage_key, expire_time=self.expire_time)
+            storage = self.storage_backend.get_cache_storage(self.storage_key, expire_time=self.expire_time,
+                                                             frozen=self.frozen,
+                                                             negative_expire_time=self.negative_expire_time)
+            storage.statistics = self.statistics
+            self._storage = storage
         return self._storage
 
 
 class Memoize(BaseMemoize):
+    """
+    Memoize in memory, at most `maxsize` values (None for no limit)
+    """
 
-    def __init__(self, func_key=None, validate_result=None):
-        super().__init__(SimpleCacheStorage(), func_key=func_key, validate_result=validate_result)
+    def __init__(self, func_key=None, validate_result=None, maxsize=DEFAULT_MEMOIZE_MAXSIZE):
+        storage = SimpleCacheStorage() if maxsize is None else LRUCacheStorage(maxsize)
+        super().__init__(storage, func_key=func_key, validate_result=validate_result)
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+import multiprocessing
+import concurrent.futures
+
+from ..config import PROCESS_POOL_MAX_WORKERS
+
+
+# created on the first use, see get_process_pool
+PROCESS_POOL = None
+PROCESS_POOL_LOCK = threading.Lock()
+
+
+def get_process_pool():
+    """
+    Process pool shared by all the fetchers for the CPU bound work (HTML parsing, hashes).
+
+    The function and its arguments are pickled: the function must be defined at the module level,
+    the arguments and the result should be small (text, hashes, tuples), not lxml documents.
+    The processes are spawned: they don't inherit the threads and the event loop of this process.
+    """
+    global PROCESS_POOL  # pylint: disable=global-statement
+    with PROCESS_POOL_LOCK:
+        if PROCESS_POOL is None:
+            PROCESS_POOL = concurrent.futures.ProcessPoolExecutor(max_workers=PROCESS_POOL_MAX_WORKERS,
+                                                                  mp_context=multiprocessing.get_context('spawn'))
+        return PROCESS_POOL
+
+
+def shutdown_process_pool():
+    global PROCESS_POOL  # pylint: disable=global-statement
+    with PROCESS_POOL_LOCK:
+        if PROCESS_POOL is not None:
+            PROCESS_POOL.shutdown(wait=True, cancel_futures=True)
+            PROCESS_POOL = None
+
+
+async def run_in_process(function, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), function, *args)
@@ -0,0 +1,141 @@
+import json
+import time
+import threading
+
+
+# FetchProfile.name --> FetchProfile, see get_fetch_profile
+FETCH_PROFILES = {}
+# time.time() when the run has started, see reset_run_profile
+RUN_START_TIME = [None]
+
+
+def _summarize(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'mean': round(sum(values) / len(values), 3),
+        'p50': round(values[len(values) // 2], 3),
+        'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        'max': round(values[-1], 3),
+    }
+
+
+class FetchProfile:
+    """
+    Where the time of a fetcher goes:
+    * `start_time` and `end_time` of the fetcher: the time before the start is the wait for the dependencies,
+    * for each item (an instance URL): the time waiting for a free slot since the item is ready (queue wait),
+      and the duration of the call.
+
+    The items are identified by their first value: for the fetchers, the instance URL.
+    """
+
+    __slots__ = 'name', 'created_time', 'start_time', 'end_time', 'ready_times', 'start_times', 'queue_waits', \
+        'durations', 'errors', 'timeouts', 'lock'
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.created_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        # item key --> time.time()
+        self.ready_times = {}
+        self.start_times = {}
+        # item key --> seconds
+        self.queue_waits = {}
+        self.durations = {}
+        self.errors = 0
+        self.timeouts = 0
+
+    def start(self):
+        self.start_time = time.time()
+
+    def stop(self):
+        self.end_time = time.time()
+
+    def item_ready(self, key):
+        with self.lock:
+            self.ready_times[key] = time.time()
+
+    def item_start(self, key):
+        now = time.time()
+        with self.lock:
+            ready_time = self.ready_times.pop(key, self.start_time or now)
+            self.queue_waits[key] = now - ready_time
+            self.start_times[key] = now
+
+    def item_done(self, key, error=False, timeout=False):
+        now = time.time()
+        with self.lock:
+            start_time = self.start_times.pop(key, None)
+            if start_time is not None:
+                self.durations[key] = now - start_time
+            if error:
+                self.errors += 1
+            if timeout:
+                self.timeouts += 1
+
+    def to_dict(self):
+        run_start_time = RUN_START_TIME[0] or self.created_time
+        with self.lock:
+            return {
+                'start': round(self.start_time - run_start_time, 3) if self.start_time else None,
+                'end': round(self.end_time - run_start_time, 3) if self.end_time else None,
+                'wall_time': round(self.end_time - self.start_time, 3) if self.start_time and self.end_time
+                else None,
+                'items': len(self.durations),
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'queue_wait': _summarize(list(self.queue_waits.values())),
+                'duration': _summarize(list(self.durations.values())),
+            }
+
+    def get_slowest(self, count):
+        with self.lock:
+            slowest = sorted(self.durations.items(), key=lambda item: item[1], reverse=True)[:count]
+        return [{'fetcher': self.name, 'url': key, 'duration': round(duration, 3)} for key, duration in slowest]
+
+
+def get_fetch_profile(name):
+    profile = FETCH_PROFILES.get(name)
+    if profile is None:
+        profile = FETCH_PROFILES[name] = FetchProfile(name)
+    return profile
+
+
+def reset_run_profile():
+    RUN_START_TIME[0] = time.time()
+    FETCH_PROFILES.clear()
+
+
+def get_run_profile(slowest_count=10):
+    """
+    Return the wall time of the run, the profile of each fetcher,
+    and the `slowest_count` slowest calls among all the fetchers
+    """
+    slowest = []
+    for profile in FETCH_PROFILES.values():
+        slowest.extend(profile.get_slowest(slowest_count))
+    slowest.sort(key=lambda item: item['duration'], reverse=True)
+    return {
+        'wall_time': round(time.time() - RUN_START_TIME[0], 3) if RUN_START_TIME[0] else None,
+        'fetchers': {name: profile.to_dict() for name, profile in sorted(FETCH_PROFILES.items())},
+        'slowest': slowest[:slowest_count],
+    }
+
+
+def print_run_profile(run_profile):
+    print('\n{0:20} {1:>10} {2:>10} {3:>7} {4:>12} {5:>12}'.format(
+        'Fetcher', 'start', 'wall time', 'items', 'p95 wait', 'p95 call'))
+    for name, profile in run_profile['fetchers'].items():
+        queue_wait = (profile['queue_wait'] or {}).get('p95')
+        duration = (profile['duration'] or {}).get('p95')
+        print('{0:20} {1!s:>10} {2!s:>10} {3:7} {4!s:>12} {5!s:>12}'.format(
+            name, profile['start'], profile['wall_time'], profile['items'], queue_wait, duration))
+
+
+def write_run_profile(run_profile, output_file_name):
+    with open(output_file_name, 'w') as output_file:
+        json.dump(run_profile, output_file, indent=2)
@@ -0,0 +1,220 @@
+import time
+import socket
+import asyncio
+import ipaddress
+import threading
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+import httpcore
+
+from .utils import exception_to_str
+from ..config import DNS_CACHE_MIN_TTL, DNS_TIMEOUT, NEGATIVE_CACHE_EXPIRE_TIME
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def read_hosts_file(file_name='/etc/hosts'):
+    """
+    Return the host names declared in the hosts file
+    """
+    names = set()
+    try:
+        with open(file_name) as hosts_file:
+            for line in hosts_file:
+                names.update(name.lower() for name in line.split('#')[0].split()[1:])
+    except OSError:
+        pass
+    return names
+
+
+class DnsCache:
+    """
+    Process wide DNS cache:
+    * the answers are kept during their TTL, at least `min_ttl` seconds,
+    * the queries don't block a thread (dns.asyncresolver),
+    * there is at most one query at the same time for a given (host, field).
+
+    The names which are not in the DNS (`localhost`, the names of /etc/hosts, mDNS)
+    are resolved with getaddrinfo.
+
+    The answers can be read from any thread with `get`.
+    """
+
+    __slots__ = 'min_ttl', 'negative_ttl', 'timeout', 'local_names', 'entries', 'in_flight', 'lock'
+
+    def __init__(self, min_ttl=DNS_CACHE_MIN_TTL, negative_ttl=NEGATIVE_CACHE_EXPIRE_TIME, timeout=DNS_TIMEOUT,
+                 local_names=None):
+        self.min_ttl = min_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.local_names = read_hosts_file() if local_names is None else local_names
+        # (host, field) --> (expire timestamp, addresses, error)
+        self.entries = {}
+        # (host, field) --> (event loop, asyncio.Future)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def get(self, host, field):
+        """
+        Return (addresses, error) or None if the answer is not cached
+        """
+        with self.lock:
+            entry = self.entries.get((host, field))
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.entries[(host, field)]
+                return None
+            return entry[1], entry[2]
+
+    def put(self, host, field, addresses, error, ttl=None):
+        if ttl is None:
+            ttl = self.min_ttl if addresses else self.negative_ttl
+        with self.lock:
+            self.entries[(host, field)] = (time.time() + ttl, list(addresses), error)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    async def resolve_field(self, host, field):
+        """
+        Return (addresses, error): addresses is a list of string, empty if there is an error.
+
+        No exception.
+        """
+        loop = asyncio.get_running_loop()
+        key = (host, field)
+        while True:
+            result = self.get(host, field)
+            if result is not None:
+                return result
+            future_loop, future = self.in_flight.get(key, (None, None))
+            if future is None or future_loop is not loop:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # this task is cancelled
+                    raise
+            # the task sending the query has been cancelled: query again
+        future = loop.create_future()
+        self.in_flight[key] = (loop, future)
+        try:
+            addresses, error, ttl = await self._query(host, field)
+            self.put(host, field, addresses, error, ttl)
+            future.set_result((addresses, error))
+        except asyncio.CancelledError:
+            # the waiting tasks send the query again
+            future.cancel()
+            raise
+        except BaseException as ex:
+            future.set_exception(ex)
+            # mark the exception as retrieved: it is raised below
+            future.exception()
+            raise
+        finally:
+            if self.in_flight.get(key, (None, None))[1] is future:
+                del self.in_flight[key]
+        return addresses, error
+
+    async def resolve(self, host):
+        """
+        Return the IPv4 and IPv6 addresses of host, the IPv4 addresses first.
+
+        Raise socket.gaierror if there is no address.
+        """
+        if is_ip_address(host):
+            return [host]
+        (addresses_a, error_a), (addresses_aaaa, _) = await asyncio.gather(self.resolve_field(host, 'A'),
+                                                                           self.resolve_field(host, 'AAAA'))
+        addresses = addresses_a + addresses_aaaa
+        if len(addresses) == 0:
+            raise socket.gaierror(socket.EAI_NONAME, error_a or 'Name or service not known')
+        return addresses
+
+    def is_local_name(self, host):
+        host = host.lower().rstrip('.')
+        return '.' not in host or host.endswith(('.localhost', '.local')) or host in self.local_names
+
+    async def _query(self, host, field):
+        if self.is_local_name(host):
+            return await self._getaddrinfo(host, field), None, None
+        addresses = []
+        error = None
+        ttl = None
+        try:
+            resolver = dns.asyncresolver.Resolver()
+            resolver.lifetime = self.timeout
+            answer = await resolver.resolve(host, field, search=True)
+            addresses = [str(rdata) for rdata in answer]
+            ttl = max(answer.expiration - time.time(), self.min_ttl)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.NoNameservers):
+            pass
+        except dns.exception.Timeout:
+            error = 'Timeout'
+        except Exception as ex:
+            error = exception_to_str(ex)
+        return addresses, error, ttl
+
+    @staticmethod
+    async def _getaddrinfo(host, field):
+        family = socket.AF_INET if field == 'A' else socket.AF_INET6
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, None, family=family,
+                                                                 type=socket.SOCK_STREAM)
+        except OSError:
+            return []
+        addresses = []
+        for info in infos:
+            if info[4][0] not in addresses:
+                addresses.append(info[4][0])
+        return addresses
+
+
+DNS_CACHE = DnsCache()
+
+
+class CachedDnsNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    httpcore network backend: the host names are resolved with DNS_CACHE.
+
+    TLS is not affected: the server name is still the one in the URL.
+    """
+
+    __slots__ = 'backend', 'dns_cache'
+
+    def __init__(self, dns_cache=DNS_CACHE):
+        self.backend = httpcore.AnyIOBackend()
+        self.dns_cache = dns_cache
+
+    # pylint: disable=too-many-arguments
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = await self.dns_cache.resolve(host)
+        except socket.gaierror as ex:
+            raise httpcore.ConnectError(ex) from ex
+        last_exception = None
+        for address in addresses:
+            try:
+                return await self.backend.connect_tcp(address, port, timeout=timeout,
+                                                      local_address=local_address,
+                                                      socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as ex:
+                last_exception = ex
+        raise last_exception
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
@@ -0,0 +1,34 @@
+import time
+
+
+class RefreshSchedule:
+    """
+    Next refresh time of each name (a fetcher name), according to `intervals`: name --> seconds.
+
+    At the beginning, all the names are due.
+    """
+
+    __slots__ = 'intervals', 'next_times', 'last_times'
+
+    def __init__(self, intervals, now=None):
+        now = time.time() if now is None else now
+        self.intervals = dict(intervals)
+        self.next_times = {name: now for name in self.intervals}
+        # name --> timestamp of the last refresh
+        self.last_times = {}
+
+    def get_due(self, now=None):
+        now = time.time() if now is None else now
+        return [name for name, next_time in self.next_times.items() if next_time <= now]
+
+    def done(self, names, now=None):
+        now = time.time() if now is None else now
+        for name in names:
+            self.next_times[name] = now + self.intervals[name]
+            self.last_times[name] = now
+
+    def get_sleep_time(self, now=None):
+        now = time.time() if now is None else now
+        if not self.next_times:
+            return None
+        return max(0, min(self.next_times.values()) - now)
@@ -1,6 +1,9 @@
+import copy
 import hashlib
 import ssl
-from typing import Dict
+
+from .memoize import LRUCacheStorage, NOT_CACHED_VALUE
+from ..config import SSL_INFO_MAXSIZE
 
 
 def set_or_concat_value(obj, key, value):
@@ -44,34 +47,44 @@ def update_obj_with_bin(cert_obj, cert_bin):
         cert_obj['subject']['altName'] = subject['altName']
 
 
-SSL_CONTEXT = ssl.create_default_context()
+def get_ssl_object_info(ssl_object):
+    cert_dict = ssl_object.getpeercert(binary_form=False)
+    cert_bin = ssl_object.getpeercert(binary_form=True)
+    cert_obj = cert_to_obj(cert_dict)
+    if cert_bin is not None and 'sha256' not in cert_obj:
+        update_obj_with_bin(cert_obj, cert_bin)
+    return {
+        'version': ssl_object.version(),
+        'certificate': cert_obj,
+    }
 
-_SSL_OBJECTS: Dict[str, ssl.SSLObject] = {}
 
-_wrap_bio = SSL_CONTEXT.wrap_bio
+# hostname --> TLS information of the last handshake, see get_ssl_object_info
+SSL_INFOS = LRUCacheStorage(SSL_INFO_MAXSIZE)
 
 
-def patched_wrap_bio(incoming: ssl.MemoryBIO, outgoing: ssl.MemoryBIO, server_hostname: str, **kwargs) -> ssl.SSLObject:
-    global _SSL_OBJECTS  # pylint: disable=global-statement
-    ssl_object = _wrap_bio(incoming, outgoing, server_hostname=server_hostname, **kwargs)
-    _SSL_OBJECTS[server_hostname.decode()] = ssl_object
-    return ssl_object
+class CapturingSSLObject(ssl.SSLObject):
+    """
+    Store the TLS information in SSL_INFOS when the handshake completes:
+    the SSLObject itself is not kept.
+    """
 
+    def do_handshake(self):
+        super().do_handshake()
+        # no exception: the handshake is complete
+        if self.server_hostname:
+            SSL_INFOS.put(self.server_hostname, get_ssl_object_info(self))
 
-SSL_CONTEXT.wrap_bio = patched_wrap_bio
+
+SSL_CONTEXT = ssl.create_default_context()
+SSL_CONTEXT.sslobject_class = CapturingSSLObject
 
 
 def get_ssl_info(hostname):
-    global _SSL_OBJECTS  # pylint: disable=global-statement
-    ssl_object = _SSL_OBJECTS.get(hostname)
-    if ssl_object:
-        cert_dict = ssl_object.getpeercert(binary_form=False)
-        cert_bin = ssl_object.getpeercert(binary_form=True)
-        cert_obj = cert_to_obj(cert_dict)
-        if cert_bin is not None and 'sha256' not in cert_obj:
-            update_obj_with_bin(cert_obj, cert_bin)
-        return {
-            'version': ssl_object.version(),
-            'certificate': cert_obj,
-        }
-    return {}
+    """
+    Return a copy of the TLS information of hostname: the caller can modify it (see cryptcheck_backend)
+    """
+    ssl_info = SSL_INFOS.get(hostname)
+    if ssl_info is NOT_CACHED_VALUE:
+        return {}
+    return copy.deepcopy(ssl_info)
@@ -0,0 +1,119 @@
+import secrets
+import statistics
+import threading
+import collections
+
+from ..config import TOR_SOCKS_PROXY_HOST, TOR_SOCKS_PROXY_PORT, TOR_CIRCUIT_COUNT, TOR_CIRCUIT_STRATEGY, \
+    TOR_CIRCUIT_MAX_LATENCY, TOR_CIRCUIT_MAX_ERRORS
+
+
+class TorCircuit:
+    """
+    SOCKS credentials: Tor uses a different circuit for each username / password (IsolateSOCKSAuth).
+
+    `renew` changes the credentials, so Tor builds a new circuit.
+    """
+
+    __slots__ = 'index', 'proxy_host', 'proxy_port', 'username', 'password', 'hosts', 'in_flight', 'latencies', \
+        'errors'
+
+    def __init__(self, index, proxy_host=TOR_SOCKS_PROXY_HOST, proxy_port=TOR_SOCKS_PROXY_PORT):
+        self.index = index
+        self.proxy_host = proxy_host
+        self.proxy_port = proxy_port
+        self.hosts = set()
+        self.in_flight = 0
+        self.renew()
+
+    def renew(self):
+        self.username = 'searxstats-' + secrets.token_hex(8)
+        self.password = secrets.token_hex(8)
+        self.latencies = collections.deque(maxlen=10)
+        self.errors = 0
+
+    @property
+    def load(self):
+        return len(self.hosts) + self.in_flight
+
+    def get_proxy_url(self):
+        return f'socks5://{self.username}:{self.password}@{self.proxy_host}:{self.proxy_port}'
+
+
+class TorCircuitPool:
+    """
+    Assign a circuit to each onion host, either:
+    * `least-loaded`: the circuit with the least hosts and requests in progress,
+    * `round-robin`: the next circuit.
+
+    A host keeps the same circuit, except if the circuit is retired:
+    a circuit is retired after `max_errors` consecutive errors,
+    or when the median latency of the last requests is more than `max_latency` seconds.
+    """
+
+    __slots__ = 'circuits', 'strategy', 'max_latency', 'max_errors', 'min_samples', 'host_circuits', 'next_index', \
+        'lock'
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, size=TOR_CIRCUIT_COUNT, strategy=TOR_CIRCUIT_STRATEGY,
+                 max_latency=TOR_CIRCUIT_MAX_LATENCY, max_errors=TOR_CIRCUIT_MAX_ERRORS, min_samples=3,
+                 proxy_host=TOR_SOCKS_PROXY_HOST, proxy_port=TOR_SOCKS_PROXY_PORT):
+        assert strategy in ('least-loaded', 'round-robin')
+        self.circuits = [TorCircuit(index, proxy_host, proxy_port) for index in range(size)]
+        self.strategy = strategy
+        self.max_latency = max_latency
+        self.max_errors = max_errors
+        self.min_samples = min_samples
+        # host --> TorCircuit
+        self.host_circuits = {}
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def assign(self, host):
+        with self.lock:
+            circuit = self.host_circuits.get(host)
+            if circuit is None:
+                if self.strategy == 'round-robin':
+                    circuit = self.circuits[self.next_index]
+                    self.next_index = (self.next_index + 1) % len(self.circuits)
+                else:
+                    circuit = min(self.circuits, key=lambda c: c.load)
+                circuit.hosts.add(host)
+                self.host_circuits[host] = circuit
+            return circuit
+
+    def start(self, circuit):
+        with self.lock:
+            circuit.in_flight += 1
+
+    def cancel(self, circuit):
+        with self.lock:
+            circuit.in_flight -= 1
+
+    def report(self, circuit, username, latency=None):
+        """
+        Report the result of a request sent with the credentials `username`
+
+        `latency` is None if the request has failed.
+
+        Return True if the circuit has been retired.
+        """
+        with self.lock:
+            circuit.in_flight -= 1
+            if circuit.username != username:
+                # the circuit has been retired during the request
+                return False
+            if latency is None:
+                circuit.errors += 1
+            else:
+                circuit.errors = 0
+                circuit.latencies.append(latency)
+            if circuit.errors >= self.max_errors or (
+                    len(circuit.latencies) >= self.min_samples
+                    and statistics.median(circuit.latencies) > self.max_latency):
+                print('🧅 renew the Tor circuit {0}'.format(circuit.index))
+                circuit.renew()
+                return True
+            return False
+
+
+TOR_CIRCUIT_POOL = TorCircuitPool()
@@ -4,13 +4,101 @@ import hashlib
 # Tor
 TOR_SOCKS_PROXY_HOST = "127.0.0.1"
 TOR_SOCKS_PROXY_PORT = 9050
+# number of isolated circuits used in parallel for the onion instances
+TOR_CIRCUIT_COUNT = 8
+# assignment of a circuit to an onion host: 'least-loaded' or 'round-robin'
+TOR_CIRCUIT_STRATEGY = 'least-loaded'
+# a circuit is replaced when the median latency of its last requests is more than TOR_CIRCUIT_MAX_LATENCY seconds
+TOR_CIRCUIT_MAX_LATENCY = 10
+# or after TOR_CIRCUIT_MAX_ERRORS consecutive errors
+TOR_CIRCUIT_MAX_ERRORS = 3
 
 # Local cryptcheck-backend
 CRYPTCHECK_BACKEND = 'http://127.0.0.1:7000'
 
+# Fetcher.https-grade and Fetcher.csp-grade: once the grade has expired,
+# it is still used during GRADE_STALE_TIME seconds while a new grade is fetched in the background
+GRADE_STALE_TIME = 24*3600
+
+# Failed probes (DNS, whois, grades) are not retried before NEGATIVE_CACHE_EXPIRE_TIME seconds,
+# this time is doubled after each consecutive failure
+NEGATIVE_CACHE_EXPIRE_TIME = 10*60
+
 # Fetcher.external_resource: load page timeout, in seconds
 BROWSER_LOAD_TIMEOUT = 20
 
+# Connection pool of the HTTP clients shared by the fetchers
+HTTP_POOL_MAX_CONNECTIONS = 200
+HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS = 100
+# in seconds
+HTTP_POOL_KEEPALIVE_EXPIRY = 120
+
+# Politeness rules for each host, shared by all the fetchers:
+# maximum number of concurrent requests
+HOST_MAX_CONCURRENCY = 4
+# minimum interval between the start of two requests, in seconds
+HOST_MIN_INTERVAL = 0.25
+# pause after a HTTP 429 response without Retry-After header, in seconds
+HOST_DEFAULT_BACKOFF = 10
+# maximum pause, whatever the Retry-After header is, in seconds
+HOST_MAX_BACKOFF = 120
+
+# Concurrency of the fetchers: (floor, ceiling) of the adaptive limit, see common.foreach.AdaptiveLimit
+CONCURRENCY_LIMITS = {
+    'basic': (4, 64),
+    'network': (4, 32),
+    'selfreport': (4, 64),
+    'mozillaobs': (2, 8),
+    'cryptcheck_backend': (2, 16),
+}
+
+# Fixed concurrency of the timing fetcher: a call lasts about 15 minutes, mostly the pauses between the requests,
+# so its latency doesn't measure the load, and the adaptive limit would need several rounds to ramp up
+TIMING_CONCURRENCY = 150
+
+# Per instance timeout of the fetchers, in seconds: after this delay the instance is marked as timed out
+FETCH_TIMEOUTS = {
+    'basic': 120,
+    'network': 300,
+    'selfreport': 120,
+    'timing': 3600,
+    'mozillaobs': 600,
+    'cryptcheck_backend': 600,
+}
+# A run must end in RUN_BUDGET seconds (None: no limit), the instances not checked yet are marked as timed out
+RUN_BUDGET = 20*3600
+# Number of slowest calls in the run profile (metadata.run.slowest)
+RUN_PROFILE_SLOWEST_COUNT = 10
+
+# Server mode: each fetcher runs again after this interval, in seconds.
+# basic reloads the instance list, fetch_source runs only if there are new commits
+REFRESH_INTERVALS = {
+    'basic': 6*3600,
+    'fetch_source': 3600,
+    'html-grade': 24*3600,
+    'network': 24*3600,
+    'self-report': 6*3600,
+    'https-grade': 24*3600,
+    'csp-grade': 24*3600,
+    'timing': 4*3600,
+    'uptime': 3600,
+}
+
+# Maximum size of a page read by get_stream, in bytes
+HTTP_MAX_BODY_SIZE = 2*1024*1024
+
+# DNS cache shared by the HTTP clients and Fetcher.network:
+# the answers are kept during their TTL, at least DNS_CACHE_MIN_TTL seconds
+DNS_CACHE_MIN_TTL = 30
+# in seconds
+DNS_TIMEOUT = 5
+
+# TLS information (version, certificate) of at most SSL_INFO_MAXSIZE hosts are kept in memory
+SSL_INFO_MAXSIZE = 4096
+
+# Number of processes for the CPU bound work (None: one per CPU), see common/processpool.py
+PROCESS_POOL_MAX_WORKERS = None
+
 # Default headers for all HTTP requests
 DEFAULT_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:84.0) Gecko/20100101 Firefox/84.0',
@@ -37,7 +125,19 @@ DEFAULT_COOKIES = {
 CACHE_DIRECTORY = '/tmp'
 
 # File name of cache
-CACHE_FILE_NAME = 'searxstats-cache.yaml'
+# .yaml: the whole cache is loaded at startup and saved at exit
+# otherwise: SQLite database, an existing searxstats-cache.yaml is migrated on first load
+CACHE_FILE_NAME = 'searxstats-cache.db'
+
+# Save the cache every CACHE_CHECKPOINT_INTERVAL seconds (0 to disable)
+CACHE_CHECKPOINT_INTERVAL = 15 * 60
+
+# File name of the progress of the current run (see --resume), in the cache directory
+RUN_CHECKPOINT_FILE_NAME = 'searxstats-checkpoint.json'
+
+# Save the progress of the current run at most every RUN_CHECKPOINT_INTERVAL seconds while a fetcher runs,
+# and each time a fetcher ends
+RUN_CHECKPOINT_INTERVAL = 60
 
 # Database URL
 DATABASE_URL = 'sqlite:////tmp/searxstats.db'
@@ -73,6 +173,11 @@ def get_cache_file_name():
     return os.path.join(CACHE_DIRECTORY, CACHE_FILE_NAME)
 
 
+def get_run_checkpoint_file_name():
+    global CACHE_DIRECTORY, RUN_CHECKPOINT_FILE_NAME  # pylint: disable=global-statement
+    return os.path.join(CACHE_DIRECTORY, RUN_CHECKPOINT_FILE_NAME)
+
+
 def get_git_repository_path(url: str) -> str:
     global CACHE_DIRECTORY  # pylint: disable=global-statement
     url_hash = hashlib.sha256(url.encode()).hexdigest()
@@ -4,6 +4,7 @@ from sqlalchemy import select
 
 import searxstats.common.git_tool as git_tool
 from searxstats.common.utils import get_file_content_hash
+from searxstats.common.processpool import get_process_pool
 from searxstats.database import get_engine, new_session, Commit, Fork
 from searxstats.config import get_git_repository_path
 from searxstats.data.update import insert_commit
@@ -38,11 +39,10 @@ def get_content_list_per_commit_iterator(repo_directory, repo, commit_list):
     for commit in commit_list:
         repo.git.checkout(commit)
         # get hashes
-        content_for_commit = set()
-        for filename in get_filename_list(repo_directory):
-            content_hash = get_file_content_hash(filename)
-            content_for_commit.add(content_hash)
-            seen_content_hashes.add(content_hash)
+        # the hashes are computed in the process pool: only the file names and the hashes are copied
+        filename_list = get_filename_list(repo_directory)
+        content_for_commit = set(get_process_pool().map(get_file_content_hash, filename_list, chunksize=32))
+        seen_content_hashes.update(content_for_commit)
         # yield
         yield str(commit.hexsha), commit.authored_date, content_for_commit
         # output
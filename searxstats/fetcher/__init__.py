@@ -1,7 +1,8 @@
 import asyncio
 import concurrent.futures
 
-from searxstats.common.utils import wait_get_results
+from searxstats.common.profile import get_fetch_profile
+from searxstats.common.memoize import checkpoint_async
 from searxstats.model import SearxStatisticsResult, Fetcher
 
 from . import basic
@@ -15,7 +16,7 @@ from . import timing
 from . import uptime
 
 
-__all__ = ['FETCHERS', 'fetch']
+__all__ = ['FETCHERS', 'fetch', 'refresh', 'get_outdated_fetchers']
 
 
 TASK_THREADPOOL = concurrent.futures.ThreadPoolExecutor(max_workers=8)
@@ -23,41 +24,40 @@ FETCHERS = [
     Fetcher(basic,
             'basic',
             'Fetch basic information 🍰👽❌',
-            'mandatory.phase1',
             True),
     Fetcher(fetch_source,
             'fetch_source',
             'Fetch git sources',
-            'mandatory.phase2',
-            True),
+            True,
+            dependencies=['basic']),
     Fetcher(external_resources,
             'html-grade',
             'Load page with a browser and check the used external resources 🔗',
-            'browser'),
+            dependencies=['basic', 'fetch_source']),
     Fetcher(network,
             'network',
             'Fetch whois information 🌏',
-            'other'),
+            instance_dependencies=['basic']),
     Fetcher(selfreport,
             'self-report',
             'Fetch the /status and /config URLs 💡',
-            'other'),
+            instance_dependencies=['basic']),
     Fetcher(cryptcheck_backend,
             'https-grade',
             'Check the HTTPS / TLS grade 🔒',
-            'other'),
+            instance_dependencies=['basic']),
     Fetcher(mozillaobs,
             'csp-grade',
             'Check the CSP grade 📄',
-            'other'),
+            instance_dependencies=['basic']),
     Fetcher(timing,
             'timing',
             'Test the response time 🔎🐘🔍🏁❌',
-            'timing'),
+            instance_dependencies=['basic']),
     Fetcher(uptime,
             'uptime',
             'Uptime from uptime.searxng.org',
-            'uptime'),
+            dependencies=['basic']),
 ]
 
 
@@ -67,24 +67,144 @@ async def initialize(selected_fetchers: list):
         await fetcher.create_initialize_task(loop, TASK_THREADPOOL)
 
 
-async def fetch(searx_stats_result: SearxStatisticsResult, selected_fetchers: list):
-    # fetch using the selected fetchers
+async def _iter_queue(queue: asyncio.Queue):
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        yield item
+
+
+class _RunProgress:
+    """
+    Progress of run_fetchers saved in `checkpoint` (see checkpoint.RunCheckpoint), if any
+    """
+
+    __slots__ = 'checkpoint', 'searx_stats_result'
+
+    def __init__(self, checkpoint, searx_stats_result: SearxStatisticsResult):
+        self.checkpoint = checkpoint
+        self.searx_stats_result = searx_stats_result
+
+    def is_completed(self, name):
+        return self.checkpoint is not None and self.checkpoint.is_completed(name)
+
+    def get_instances_done(self, name, instance_fetch):
+        if self.checkpoint is None or not instance_fetch.resumable:
+            return None
+        return self.checkpoint.get_instances_done(name)
+
+    def instance_done(self, name, url):
+        if self.checkpoint is not None and not self.checkpoint.is_completed(name):
+            self.checkpoint.instance_done(name, url, self.searx_stats_result)
+
+    def fetcher_done(self, name):
+        if self.checkpoint is not None and not self.checkpoint.is_completed(name):
+            self.checkpoint.fetcher_done(name, self.searx_stats_result)
+
+
+async def run_fetchers(searx_stats_result: SearxStatisticsResult, fetchers: list, executor=None,
+                       checkpoint=None):
+    """
+    Run each fetcher as soon as its dependencies are met, instead of one group after the other:
+    * a fetcher starts when all its `dependencies` are done,
+    * a fetcher with `instance_dependencies` fetches an instance as soon as these dependencies
+      are done for this instance.
+
+    The dependencies which are not in `fetchers` are ignored.
+
+    `checkpoint` (see checkpoint.RunCheckpoint) records the progress:
+    the fetchers and the instances already done in a previous run are skipped.
+    """
     loop = asyncio.get_event_loop()
+    progress = _RunProgress(checkpoint, searx_stats_result)
+    names = {fetcher.name for fetcher in fetchers}
+    done_events = {fetcher.name: asyncio.Event() for fetcher in fetchers}
+    # fetcher name --> dependencies to wait for before the start
+    dependencies = {}
+    # fetcher name --> dependencies to wait for, for each instance
+    instance_dependencies = {}
+    # fetcher name --> fetchers waiting for the instances done by this fetcher
+    downstream_fetchers = {fetcher.name: [] for fetcher in fetchers}
+    # fetcher name --> asyncio.Queue of (url, detail), None when there is no more instance
+    queues = {}
+    # fetcher name --> url --> names of the instance dependencies done for this url
+    instance_done = {}
+
+    for fetcher in fetchers:
+        fetcher_dependencies = [name for name in fetcher.dependencies if name in names]
+        fetcher_instance_dependencies = [name for name in fetcher.instance_dependencies if name in names]
+        if fetcher.get_instance_fetch() is None:
+            fetcher_dependencies += fetcher_instance_dependencies
+            fetcher_instance_dependencies = []
+        dependencies[fetcher.name] = fetcher_dependencies
+        instance_dependencies[fetcher.name] = fetcher_instance_dependencies
+        if fetcher_instance_dependencies:
+            queues[fetcher.name] = asyncio.Queue()
+            instance_done[fetcher.name] = {}
+            for name in fetcher_instance_dependencies:
+                downstream_fetchers[name].append(fetcher.name)
+
+    def on_instance_done(name, url, detail):
+        progress.instance_done(name, url)
+        for downstream_name in downstream_fetchers[name]:
+            done = instance_done[downstream_name].setdefault(url, set())
+            expected_count = len(instance_dependencies[downstream_name])
+            if len(done) == expected_count:
+                # already queued (for example, an instance redirected to another one)
+                continue
+            done.add(name)
+            if len(done) == expected_count:
+                get_fetch_profile(downstream_name).item_ready(url)
+                queues[downstream_name].put_nowait((url, detail))
+
+    def on_fetcher_done(name):
+        done_events[name].set()
+        for downstream_name in downstream_fetchers[name]:
+            if all(done_events[dependency].is_set() for dependency in instance_dependencies[downstream_name]):
+                queues[downstream_name].put_nowait(None)
+
+    async def run_fetcher(fetcher):
+        try:
+            for name in dependencies[fetcher.name]:
+                await done_events[name].wait()
+            instance_fetch = fetcher.get_instance_fetch()
+            if progress.is_completed(fetcher.name):
+                # done in a previous run: the instances are ready for the downstream fetchers
+                for url, detail in list(searx_stats_result.instances.items()):
+                    on_instance_done(fetcher.name, url, detail)
+            elif instance_fetch is not None:
+                queue = queues.get(fetcher.name)
+                instances = _iter_queue(queue) if queue is not None else None
+                await fetcher.create_fetch_task(
+                    loop, executor, searx_stats_result, instances=instances,
+                    skip=progress.get_instances_done(fetcher.name, instance_fetch),
+                    on_instance_done=lambda url, detail: on_instance_done(fetcher.name, url, detail))
+            else:
+                await fetcher.create_fetch_task(loop, executor, searx_stats_result)
+            progress.fetcher_done(fetcher.name)
+        finally:
+            on_fetcher_done(fetcher.name)
+        await checkpoint_async()
+
+    await asyncio.gather(*[run_fetcher(fetcher) for fetcher in fetchers])
+
 
-    # create a task list from the selected fetchers
-    tasks_for_group = []
-    current_group_name = None
-    for fetcher in FETCHERS:
-        if fetcher in selected_fetchers or fetcher.mandatory:
-            # if fetcher is from a different group name, wait for the current tasks
-            if current_group_name != fetcher.group_name:
-                await wait_get_results(*tasks_for_group)
-                tasks_for_group = []
-
-            # add to the list
-            current_group_name = fetcher.group_name
-            task = fetcher.create_fetch_task(loop, TASK_THREADPOOL, searx_stats_result)
-            tasks_for_group.append(task)
-
-    # execute the last task list
-    await wait_get_results(*tasks_for_group)
+async def fetch(searx_stats_result: SearxStatisticsResult, selected_fetchers: list, checkpoint=None):
+    # fetch using the selected fetchers
+    fetchers = [fetcher for fetcher in FETCHERS if fetcher in selected_fetchers or fetcher.mandatory]
+    await run_fetchers(searx_stats_result, fetchers, TASK_THREADPOOL, checkpoint)
+
+
+async def refresh(searx_stats_result: SearxStatisticsResult, fetchers: list):
+    # fetch again using only these fetchers (server mode): the dependencies are already in searx_stats_result
+    await run_fetchers(searx_stats_result, fetchers, TASK_THREADPOOL)
+
+
+async def get_outdated_fetchers(searx_stats_result: SearxStatisticsResult, fetchers: list):
+    loop = asyncio.get_event_loop()
+    return [
+        fetcher
+        for fetcher in fetchers
+        if await fetcher.is_outdated(loop, TASK_THREADPOOL, searx_stats_result)
+    ]
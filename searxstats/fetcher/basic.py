@@ -3,15 +3,15 @@ import re
 import json
 import concurrent.futures
 from urllib.parse import urljoin
-from collections import OrderedDict
-from searxstats.model import SearxStatisticsResult
-from searxstats.common.foreach import for_each
+from searxstats.model import SearxStatisticsResult, InstanceFetch
+from searxstats.common.foreach import AdaptiveLimit
 from searxstats.common.utils import dict_merge
-from searxstats.common.http import new_client, get, get_host, get_network_type, NetworkType
+from searxstats.common.http import shared_client, get, get_stream, get_host, get_network_type, NetworkType,\
+    CONNECT_RETRY_POLICY, is_timeout_error
 from searxstats.common.ssl_info import get_ssl_info
 from searxstats.common.memoize import MemoizeToDisk
 from searxstats.common.response_time import ResponseTimeStats
-from searxstats.config import DEFAULT_HEADERS, SEARXNG_GIT_REPOSITORY
+from searxstats.config import DEFAULT_HEADERS, SEARXNG_GIT_REPOSITORY, CONCURRENCY_LIMITS, FETCH_TIMEOUTS
 
 
 # in a HTML page produced by SearXNG, regex to find the SearXNG version
@@ -89,9 +89,12 @@ async def fetch_one(instance_url: str, git_url: str, private: bool) -> dict:
         'git_url': git_url,
     }
     try:
-        async with new_client(network_type=network_type) as session:
-            response, error = await get(session, instance_url,
-                                        headers=DEFAULT_HEADERS, timeout=10)
+        async with shared_client(network_type=network_type, host=get_host(instance_url)) as session:
+            # the response time of this request is published as timing.initial:
+            # the whole page is read (at most HTTP_MAX_BODY_SIZE bytes),
+            # and the request is sent again only if the connection has failed (no response time)
+            response, error = await get_stream(session, instance_url, headers=DEFAULT_HEADERS, timeout=10,
+                                               retry=CONNECT_RETRY_POLICY)
             status_code = response.status_code if response is not None else None
             detail['http'] = {
                 'status_code': status_code,
@@ -119,7 +122,7 @@ async def fetch_one(instance_url: str, git_url: str, private: bool) -> dict:
                 response_time_stats.add_response(response)
                 detail['timing']['initial'] = response_time_stats.get()
     except concurrent.futures.TimeoutError:
-        # This exception occurs on new_client()
+        # This exception occurs on shared_client()
         error = 'Timeout error'
 
     if (detail['version'] is not None or private) and network_type == NetworkType.NORMAL:
@@ -159,29 +162,42 @@ async def fetch_one_display(url: str, git_url: str, private: bool) -> dict:
     return url, detail
 
 
-async def fetch(searx_stats_result: SearxStatisticsResult):
+def is_timeout(result):
+    return result is not None and (is_timeout_error(result[1]['error']) or result[1]['error'] == 'Timeout error')
 
-    url_to_deleted = []
-    url_to_update = OrderedDict()
 
-    # fetch and store the changes in url_to_deleted and url_to_add
-    # do not modify the searx_stats_result.instances to avoid
-    async def fetch_and_store_change(url: str, detail, *_, **__):
-        if 'version' not in detail:
-            r_url, r_detail = await fetch_one_display(url, detail['git_url'], searx_stats_result.private)
-            del detail['git_url']
-            dict_merge(r_detail, detail)
-            if r_url != url:
-                # r_url is the URL after following a HTTP redirect
-                # in this case the searx_stats_result.instances[url] must be deleted.
-                url_to_deleted.append(url)
-            url_to_update[r_url] = r_detail
+CONCURRENCY = AdaptiveLimit(*CONCURRENCY_LIMITS['basic'], name='basic', is_error=is_timeout)
 
-    instance_iterator = searx_stats_result.iter_instances(only_valid=False, valid_or_private=False)
-    await for_each(instance_iterator, fetch_and_store_change, limit=12)
 
-    # apply the changes
-    for url in url_to_deleted:
+async def fetch_instance(searx_stats_result: SearxStatisticsResult, url: str, detail):
+    if 'version' in detail:
+        return None
+    return await fetch_one_display(url, detail['git_url'], searx_stats_result.private)
+
+
+def set_timeout(_searx_stats_result: SearxStatisticsResult, url: str, detail):
+    if 'version' in detail:
+        return
+    print('⏱️  {0}: timeout'.format(url))
+    del detail['git_url']
+    detail['http'] = {'status_code': None, 'error': 'Timeout error'}
+    detail['version'] = None
+    detail['error'] = 'Timeout error'
+
+
+def store_result(searx_stats_result: SearxStatisticsResult, url: str, detail, result):
+    if result is None:
+        return url, detail
+    r_url, r_detail = result
+    del detail['git_url']
+    dict_merge(r_detail, detail)
+    if r_url != url:
+        # r_url is the URL after following a HTTP redirect
+        # in this case the searx_stats_result.instances[url] must be deleted.
         del searx_stats_result.instances[url]
-    for url, detail in url_to_update.items():
-        searx_stats_result.update_instance(url, detail)
+    searx_stats_result.update_instance(r_url, r_detail)
+    return r_url, searx_stats_result.get_instance(r_url)
+
+
+fetch = InstanceFetch(fetch_instance, store=store_result, valid_or_private=False, limit=CONCURRENCY,
+                      timeout=FETCH_TIMEOUTS['basic'], on_timeout=set_timeout)
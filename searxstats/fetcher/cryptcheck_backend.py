@@ -1,9 +1,11 @@
 # pylint: disable=invalid-name
 from searxstats.common.utils import exception_to_str
-from searxstats.common.http import new_client, get_host, NetworkType
+from searxstats.common.http import shared_client, get_host, NetworkType
 from searxstats.common.memoize import MemoizeToDisk
+from searxstats.common.foreach import AdaptiveLimit
 from searxstats.model import create_fetch
-from searxstats.config import CRYPTCHECK_BACKEND
+from searxstats.config import CRYPTCHECK_BACKEND, GRADE_STALE_TIME, NEGATIVE_CACHE_EXPIRE_TIME, CONCURRENCY_LIMITS, \
+    FETCH_TIMEOUTS
 
 
 API_ENDPOINT = CRYPTCHECK_BACKEND + '/https/{0}.json'
@@ -34,13 +36,14 @@ def validate_result(result):
     return True
 
 
-@MemoizeToDisk(validate_result=validate_result, expire_time=CACHE_EXPIRE_TIME)
+@MemoizeToDisk(validate_result=validate_result, expire_time=CACHE_EXPIRE_TIME, stale_time=GRADE_STALE_TIME,
+               negative_expire_time=NEGATIVE_CACHE_EXPIRE_TIME)
 async def analyze(host):
     user_url = USER_ENDPOINT.format(host)
     json = None
     try:
         # get the result from cryptcheck.fr
-        async with new_client() as session:
+        async with shared_client() as session:
             json = await get_existing_result(session, host)
 
         # get the ranks from the result
@@ -67,4 +70,6 @@ async def fetch_one(url: str) -> dict:
     return {'grade': grade, 'gradeUrl': grade_url}
 
 
-fetch = create_fetch(['tls'], fetch_one, valid_or_private=True, network_type=NetworkType.NORMAL, limit=8)
+fetch = create_fetch(['tls'], fetch_one, valid_or_private=True, network_type=NetworkType.NORMAL,
+                     limit=AdaptiveLimit(*CONCURRENCY_LIMITS['cryptcheck_backend'], name='cryptcheck_backend'),
+                     timeout=FETCH_TIMEOUTS['cryptcheck_backend'], timeout_result={'grade': '?'})
@@ -13,7 +13,7 @@ from searxstats.config import SEARXNG_GIT_REPOSITORY, \
                               get_geckodriver_file_name
 from searxstats.data import get_repositories_for_content_sha, is_wellknown_content_sha
 from searxstats.common.http import NetworkType
-from searxstats.common.memoize import MemoizeToDisk
+from searxstats.common.memoize import MemoizeToDisk, unfreeze
 from searxstats.model import SearxStatisticsResult
 
 
@@ -69,7 +69,7 @@ def fetch_resource_hashes_js_key(driver, url):
     return url
 
 
-@MemoizeToDisk(func_key=fetch_resource_hashes_js_key)
+@MemoizeToDisk(func_key=fetch_resource_hashes_js_key, frozen=True)
 def fetch_resource_hashes_js(driver, url):
     try:
         # load page
@@ -149,7 +149,8 @@ def replace_hash_by_hashref(result, hashes, forks):
 
 
 def fetch_resource_hashes(driver, url, resource_hashes, forks):
-    resources = fetch_resource_hashes_js(driver, url)
+    # replace_hash_by_hashref modifies resources
+    resources = unfreeze(fetch_resource_hashes_js(driver, url))
     replace_hash_by_hashref(resources, resource_hashes, forks)
     return resources
 
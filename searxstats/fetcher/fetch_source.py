@@ -1,9 +1,10 @@
 from urllib.parse import urlparse
 
 from searxstats.common.utils import exception_to_str
+from searxstats.common.git_tool import get_local_head, get_remote_head
 from searxstats.data import fetch_hashes_from_git_url
 from searxstats.model import SearxStatisticsResult
-from searxstats.config import SEARXNG_GIT_REPOSITORY
+from searxstats.config import SEARXNG_GIT_REPOSITORY, get_git_repository_path
 
 
 def normalize_git_url(git_url):
@@ -28,7 +29,9 @@ def iter_git_urls(searx_stats_result: SearxStatisticsResult):
 
 # pylint: disable=unsubscriptable-object, unsupported-delete-operation, unsupported-assignment-operation
 # pylint thinks that resource_desc is None
-async def fetch(searx_stats_result: SearxStatisticsResult):
+def fetch(searx_stats_result: SearxStatisticsResult):
+    # not a coroutine: the git commands, the database queries and the wait for the process pool
+    # run in a thread (see create_task), while the other fetchers use the event loop
     seen_git_url = set()
     for git_url in iter_git_urls(searx_stats_result):
         if git_url not in seen_git_url:
@@ -40,3 +43,22 @@ async def fetch(searx_stats_result: SearxStatisticsResult):
                 if git_url not in searx_stats_result.forks:
                     searx_stats_result.forks.append(git_url)
             seen_git_url.add(git_url)
+
+
+def is_outdated(searx_stats_result: SearxStatisticsResult):
+    """
+    True if at least one git repository has new commits (server mode)
+    """
+    for git_url in set(iter_git_urls(searx_stats_result)):
+        local_head = get_local_head(get_git_repository_path(git_url))
+        if local_head is None:
+            return True
+        try:
+            remote_head = get_remote_head(git_url)
+        except Exception as ex:
+            print(exception_to_str(ex))
+            continue
+        if remote_head != local_head:
+            print('New commits in {0}'.format(git_url))
+            return True
+    return False
@@ -1,8 +1,11 @@
 # pylint: disable=invalid-name
 from searxstats.common.utils import exception_to_str
-from searxstats.common.http import new_client, get_host, NetworkType
+from searxstats.common.http import shared_client, get_host, NetworkType
 from searxstats.common.memoize import MemoizeToDisk
+from searxstats.common.foreach import AdaptiveLimit
 from searxstats.model import create_fetch
+from searxstats.config import GRADE_STALE_TIME, NEGATIVE_CACHE_EXPIRE_TIME, CONCURRENCY_LIMITS, \
+    FETCH_TIMEOUTS
 
 
 USER_ENDPOINT = 'https://observatory.mozilla.org/analyze/{0}'
@@ -14,14 +17,15 @@ def validate_result(result):
     return True
 
 
-@MemoizeToDisk(validate_result=validate_result, expire_time=24*3600)
+@MemoizeToDisk(validate_result=validate_result, expire_time=24*3600, stale_time=GRADE_STALE_TIME,
+               negative_expire_time=NEGATIVE_CACHE_EXPIRE_TIME)
 async def analyze(url: str):
     host = get_host(url)
     grade_url = USER_ENDPOINT.format(host)
     grade = None
     score = None
     try:
-        async with new_client() as session:
+        async with shared_client() as session:
             response = await session.post(
                 'https://observatory-api.mdn.mozilla.net/api/v2/scan?host={0}'.format(host),
                 timeout=60)
@@ -41,4 +45,6 @@ async def fetch_one(url: str) -> dict:
     return {'grade': grade, 'gradeUrl': grade_url, 'score': score}
 
 
-fetch = create_fetch(['http'], fetch_one, valid_or_private=True, network_type=NetworkType.NORMAL, limit=4)
+fetch = create_fetch(['http'], fetch_one, valid_or_private=True, network_type=NetworkType.NORMAL,
+                     limit=AdaptiveLimit(*CONCURRENCY_LIMITS['mozillaobs'], name='mozillaobs'),
+                     timeout=FETCH_TIMEOUTS['mozillaobs'], timeout_result={'grade': None, 'score': None})
@@ -1,6 +1,7 @@
 # pylint: disable=invalid-name
 import typing
 import os
+import time
 import socket
 from enum import IntEnum
 
@@ -12,11 +13,12 @@ import geoip2.errors
 
 from searxstats.data.asn import ASN_PRIVACY
 from searxstats.common.utils import exception_to_str
-from searxstats.common.http import get_host, get, new_client, NetworkType
+from searxstats.common.http import get_host, get, shared_client, NetworkType
+from searxstats.common.resolver import DNS_CACHE
 from searxstats.common.memoize import MemoizeToDisk
-from searxstats.common.foreach import for_each
-from searxstats.config import MMDB_FILENAME
-from searxstats.model import SearxStatisticsResult, AsnPrivacy
+from searxstats.common.foreach import AdaptiveLimit
+from searxstats.config import MMDB_FILENAME, NEGATIVE_CACHE_EXPIRE_TIME, CONCURRENCY_LIMITS, FETCH_TIMEOUTS
+from searxstats.model import SearxStatisticsResult, AsnPrivacy, InstanceFetch
 
 try:
     import ldns
@@ -113,7 +115,8 @@ def dns_query(qname, field):
     return dns_answers, dns_error
 
 
-@MemoizeToDisk(expire_time=ONE_HOUR_IN_SECOND, validate_result=valid_if_no_error)
+@MemoizeToDisk(expire_time=ONE_HOUR_IN_SECOND, validate_result=valid_if_no_error,
+               negative_expire_time=NEGATIVE_CACHE_EXPIRE_TIME)
 def dns_query_field_dnspython(host: str, field: str):
     """
     string everywhere to allow @MemoizeToDisk
@@ -127,12 +130,23 @@ def dns_query_field_dnspython(host: str, field: str):
     list of string is the answers convert to string, empty list if there is an error
 
     error_msg is a text message that can be display to the user
+
+    The answers already resolved by the HTTP clients are read from DNS_CACHE.
     """
+    cached_answer = DNS_CACHE.get(host, field)
+    if cached_answer is not None:
+        addresses, dns_error = cached_answer
+        return addresses, dns_error, DnsSecResult.UNKNOW
     dns_answers, dns_error = dns_query(host, field)
-    return list(map(str, dns_answers or [])), dns_error, DnsSecResult.UNKNOW
+    addresses = list(map(str, dns_answers or []))
+    if dns_error is None:
+        ttl = max(dns_answers.expiration - time.time(), DNS_CACHE.min_ttl) if dns_answers else None
+        DNS_CACHE.put(host, field, addresses, dns_error, ttl)
+    return addresses, dns_error, DnsSecResult.UNKNOW
 
 
-@MemoizeToDisk(expire_time=ONE_HOUR_IN_SECOND, validate_result=valid_if_no_error)
+@MemoizeToDisk(expire_time=ONE_HOUR_IN_SECOND, validate_result=valid_if_no_error,
+               negative_expire_time=NEGATIVE_CACHE_EXPIRE_TIME)
 def dns_query_field_ldns(host: str, field: str):
     dns_answers = []
     dns_error = None
@@ -163,7 +177,8 @@ def dns_query_field_ldns(host: str, field: str):
     return dns_answers, dns_error, dnssec_result
 
 
-@MemoizeToDisk(expire_time=ONE_HOUR_IN_SECOND, validate_result=valid_if_no_error)
+@MemoizeToDisk(expire_time=ONE_HOUR_IN_SECOND, validate_result=valid_if_no_error,
+               negative_expire_time=NEGATIVE_CACHE_EXPIRE_TIME)
 def dns_query_reverse(address):
     """
     string everywhere to allow @MemoizeToDisk
@@ -199,7 +214,8 @@ def safe_upper(o):
     return o
 
 
-@MemoizeToDisk(expire_time=ONE_DAY_IN_SECOND, validate_result=valid_if_no_error)
+@MemoizeToDisk(expire_time=ONE_DAY_IN_SECOND, validate_result=valid_if_no_error,
+               negative_expire_time=NEGATIVE_CACHE_EXPIRE_TIME)
 def get_whois(address: str):
     whois_error = None
     result = None
@@ -236,7 +252,18 @@ def check_https_port(address: str):
         return False, exception_to_str(ex)
 
 
-def get_address_info(searx_stats_result: SearxStatisticsResult, address: str, field_type: str, https_port: bool):
+def add_cidr(cidrs: dict, asn_cidr: str, whois_info: dict):
+    if asn_cidr not in cidrs:
+        cidrs[asn_cidr] = whois_info
+    else:
+        if whois_info != cidrs[asn_cidr]:
+            print('different asn info\n', whois_info, '\n', cidrs[asn_cidr])
+
+
+def get_address_info(cidrs: dict, address: str, field_type: str, https_port: bool):
+    """
+    Return the information about `address`, the whois information is stored in `cidrs`
+    """
     reverse_dns, reverse_dns_error = dns_query_reverse(address)
     whois_info, whois_info_error = get_whois(address)
 
@@ -267,11 +294,7 @@ def get_address_info(searx_stats_result: SearxStatisticsResult, address: str, fi
 
         #
         result['asn_cidr'] = asn_cidr
-        if asn_cidr not in searx_stats_result.cidrs:
-            searx_stats_result.cidrs[asn_cidr] = whois_info
-        else:
-            if whois_info != searx_stats_result.cidrs[asn_cidr]:
-                print('different asn info\n', whois_info, '\n', searx_stats_result.cidrs[asn_cidr])
+        add_cidr(cidrs, asn_cidr, whois_info)
 
     if reverse_dns_error is not None:
         result['reverse_error'] = reverse_dns_error
@@ -291,14 +314,24 @@ def get_address_info(searx_stats_result: SearxStatisticsResult, address: str, fi
     return result
 
 
-def get_network_info(searx_stats_result: SearxStatisticsResult, host: str):
-    result = {
+def create_network_info(error=None):
+    return {
         'ips': {},
         'ipv6': False,
         'asn_privacy': AsnPrivacy.UNKNOWN.value,
-        'error': None,
+        'error': error,
     }
 
+
+def get_network_info(searx_stats_result: SearxStatisticsResult, host: str):
+    """
+    Return the network information of `host`, and the whois information of its CIDRs.
+
+    searx_stats_result is not modified: the call may continue in a thread after its timeout.
+    """
+    result = create_network_info()
+    cidrs = {}
+
     if searx_stats_result.metadata['ipv6']:
         field_type_list = ['A', 'AAAA']
     else:
@@ -315,27 +348,39 @@ def get_network_info(searx_stats_result: SearxStatisticsResult, host: str):
             result['error'] = error
         if addresses is not None:
             for address in addresses:
-                result['ips'][address] = get_address_info(searx_stats_result, address, field_type, True)
+                result['ips'][address] = get_address_info(cidrs, address, field_type, True)
                 if field_type == 'AAAA' and result['ips'][address]['https_port']:
                     # ipv6 support if at least one IPv6 address has the port 443 opened.
                     result['ipv6'] = True
                 asn_cidr = result['ips'][address].get('asn_cidr')
                 if asn_cidr is not None:
-                    asn_privacy = searx_stats_result.cidrs.get(asn_cidr, {}).get('asn_privacy', AsnPrivacy.GOOD.value)
+                    asn_privacy = cidrs.get(asn_cidr, {}).get('asn_privacy', AsnPrivacy.GOOD.value)
                     result['asn_privacy'] = min(asn_privacy, result['asn_privacy'])
-    return result
+    return result, cidrs
 
 
-def fetch_one(searx_stats_result: SearxStatisticsResult, url: str, detail):
+def fetch_one(searx_stats_result: SearxStatisticsResult, url: str, _detail):
     instance_host = get_host(url)
-    network_detail = get_network_info(searx_stats_result, instance_host)
-    detail['network'] = network_detail
+    network_detail, cidrs = get_network_info(searx_stats_result, instance_host)
     print('🌏 {0:30} {1}'.format(instance_host, network_detail.get('error') or ''))
+    return network_detail, cidrs
+
+
+def store_result(searx_stats_result: SearxStatisticsResult, url: str, detail, result):
+    network_detail, cidrs = result
+    detail['network'] = network_detail
+    for asn_cidr, whois_info in cidrs.items():
+        add_cidr(searx_stats_result.cidrs, asn_cidr, whois_info)
+    return url, detail
+
+
+def set_timeout(_searx_stats_result: SearxStatisticsResult, url: str, detail):
+    # the whois or DNS queries may continue in the thread: iter_each ignores the result (see store_result)
+    detail['network'] = create_network_info('Timeout')
+    print('🌏 {0:30} {1}'.format(get_host(url), 'Timeout'))
 
 
-async def _fetch_network(searx_stats_result: SearxStatisticsResult):
-    await for_each(searx_stats_result.iter_instances(valid_or_private=True, network_type=NetworkType.NORMAL),
-                   fetch_one, searx_stats_result, limit=12)
+CONCURRENCY = AdaptiveLimit(*CONCURRENCY_LIMITS['network'], name='network')
 
 
 async def _find_similar_instances(searx_stats_result: SearxStatisticsResult):
@@ -366,7 +411,7 @@ async def _find_similar_instances(searx_stats_result: SearxStatisticsResult):
 
 async def _check_connectivity(searx_stats_result: SearxStatisticsResult):
     async def get_ip(url):
-        async with new_client() as session:
+        async with shared_client() as session:
             response, error = await get(session, url, timeout=10.0)
         if error is None:
             return response.text, None
@@ -376,18 +421,18 @@ async def _check_connectivity(searx_stats_result: SearxStatisticsResult):
     ipv6, ipv6_error = await get_ip(URL_IPV6)
     searx_stats_result.metadata['ips'] = {}
     if ipv4:
-        searx_stats_result.metadata['ips'][ipv4] = get_address_info(searx_stats_result, ipv4, 'A', False)
+        searx_stats_result.metadata['ips'][ipv4] = get_address_info(searx_stats_result.cidrs, ipv4, 'A', False)
     else:
         print('⚠️ No IPv4 connectivity ', ipv4_error)
     if ipv6:
-        searx_stats_result.metadata['ips'][ipv6] = get_address_info(searx_stats_result, ipv6, 'AAAA', False)
+        searx_stats_result.metadata['ips'][ipv6] = get_address_info(searx_stats_result.cidrs, ipv6, 'AAAA',
+                                                                    False)
         searx_stats_result.metadata['ipv6'] = True
     else:
         searx_stats_result.metadata['ipv6'] = False
         print('⚠️ No IPv6 connectivity ', ipv6_error)
 
 
-async def fetch(searx_stats_result: SearxStatisticsResult):
-    await _check_connectivity(searx_stats_result)
-    await _fetch_network(searx_stats_result)
-    await _find_similar_instances(searx_stats_result)
+fetch = InstanceFetch(fetch_one, store=store_result, valid_or_private=True, network_type=NetworkType.NORMAL,
+                      limit=CONCURRENCY, timeout=FETCH_TIMEOUTS['network'], on_timeout=set_timeout,
+                      prepare=_check_connectivity, finalize=_find_similar_instances)
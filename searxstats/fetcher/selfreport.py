@@ -2,10 +2,11 @@
 import json
 from urllib.parse import urljoin
 from searxstats.common.utils import dict_merge
-from searxstats.common.foreach import for_each
-from searxstats.common.http import new_client, get, get_network_type
-from searxstats.common.memoize import MemoizeToDisk
-from searxstats.model import SearxStatisticsResult
+from searxstats.common.foreach import AdaptiveLimit
+from searxstats.common.http import shared_client, get, get_host, get_network_type
+from searxstats.common.memoize import MemoizeToDisk, unfreeze
+from searxstats.model import SearxStatisticsResult, InstanceFetch
+from searxstats.config import CONCURRENCY_LIMITS, FETCH_TIMEOUTS
 
 
 # pylint: disable=unused-argument
@@ -13,7 +14,7 @@ def only_instance_url(_, instance_url):
     return instance_url
 
 
-@MemoizeToDisk(func_key=only_instance_url)
+@MemoizeToDisk(func_key=only_instance_url, frozen=True)
 async def get_config(session, instance_url):
     result_engines = None
     response, error = await get(session, urljoin(instance_url, 'config'), timeout=5)
@@ -110,7 +111,7 @@ def set_engine_errors(searx_stats_result: SearxStatisticsResult, result_stats_er
 
 async def fetch_one(searx_stats_result: SearxStatisticsResult, url: str, detail):
     network_type = get_network_type(url)
-    async with new_client(network_type=network_type) as session:
+    async with shared_client(network_type=network_type, host=get_host(url)) as session:
         # /config
         result_engines = await get_config(session, url)
         # /stats/checker
@@ -138,6 +139,7 @@ async def fetch_one(searx_stats_result: SearxStatisticsResult, url: str, detail)
         if result_engines is not None:
             for engine_name, engine_detail in result_engines.items():
                 if engine_name not in searx_stats_result.engines:
+                    engine_detail = unfreeze(engine_detail)
                     engine_detail['stats'] = {
                         # sum of error_rate for all stat_count instance
                         # replace in finalize_stats by error_rate ( = total_error_rate / stats_count )
@@ -170,6 +172,22 @@ def finalize_stats(searx_stats_result: SearxStatisticsResult):
             del engine_stat['total_error_rate']
 
 
-async def fetch(searx_stats_result: SearxStatisticsResult):
-    await for_each(searx_stats_result.iter_instances(only_valid=True), fetch_one, searx_stats_result, limit=12)
-    finalize_stats(searx_stats_result)
+def set_timeout(_searx_stats_result: SearxStatisticsResult, url: str, detail):
+    print('💡 {0}: timeout'.format(url))
+    detail.setdefault('engines', dict())
+
+
+CONCURRENCY = AdaptiveLimit(*CONCURRENCY_LIMITS['selfreport'], name='selfreport')
+
+
+def reset_stats(searx_stats_result: SearxStatisticsResult):
+    # the engine statistics are computed from scratch, even if the fetcher runs again (server mode):
+    # the indexes in engine_errors are not valid anymore
+    searx_stats_result.engines = {}
+    searx_stats_result.engine_errors = []
+    for detail in searx_stats_result.instances.values():
+        detail.pop('engines', None)
+
+
+fetch = InstanceFetch(fetch_one, only_valid=True, limit=CONCURRENCY, timeout=FETCH_TIMEOUTS['selfreport'],
+                      on_timeout=set_timeout, prepare=reset_stats, finalize=finalize_stats, resumable=False)
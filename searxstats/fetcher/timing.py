@@ -5,15 +5,15 @@ import asyncio
 import random
 from urllib.parse import urljoin
 
-from lxml import etree
+from lxml import etree, html
 from searxstats.common.utils import exception_to_str
-from searxstats.common.html import extract_text, html_fromstring
-from searxstats.common.http import new_client, get, get_network_type, NetworkType
-from searxstats.common.foreach import for_each
+from searxstats.common.html import extract_text
+from searxstats.common.processpool import run_in_process
+from searxstats.common.http import new_client, get, get_stream, get_host, get_network_type, NetworkType
 from searxstats.common.memoize import MemoizeToDisk
 from searxstats.common.response_time import ResponseTimeStats
-from searxstats.config import DEFAULT_COOKIES, DEFAULT_HEADERS
-from searxstats.model import SearxStatisticsResult
+from searxstats.config import DEFAULT_COOKIES, DEFAULT_HEADERS, TIMING_CONCURRENCY, FETCH_TIMEOUTS
+from searxstats.model import SearxStatisticsResult, InstanceFetch
 
 
 @dataclass(frozen=True)
@@ -29,9 +29,8 @@ class CheckResult:
     def is_wikiengine(engine_name):
         return engine_name.startswith('wiki')
 
-    async def _check_html_result_page(self, engine_name, response):
+    def check_html_result_page(self, engine_name, document):
         result_count = 0
-        document = await html_fromstring(response.text)
         for result_element, engine_names in self._iter_meaningful_results(document):
             engine_names = [
                 extract_text(engine_element)
@@ -63,11 +62,7 @@ class CheckResult:
                 continue
             yield result_element, engine_names
 
-    async def check_google_result(self, response):
-        return await self._check_html_result_page('google cse', response)
-
-    async def check_search_result(self, response):
-        document = await html_fromstring(response.text)
+    def check_search_result_page(self, document):
         message = None
         result_element_list = self.results(document)
         alert_danger_list = self.alert_danger_main(document)
@@ -86,6 +81,14 @@ class CheckResult:
             return False, 'Only two results'
         return True, message
 
+    @staticmethod
+    async def check_google_result(response):
+        return await run_in_process(check_page, 'google cse', response.text)
+
+    @staticmethod
+    async def check_search_result(response):
+        return await run_in_process(check_page, None, response.text)
+
 
 CHECK_RESULT = CheckResult(
     results=etree.XPath("//div[@id='urls']//article"),
@@ -95,6 +98,19 @@ CHECK_RESULT = CheckResult(
 )
 
 
+def check_page(engine_name, text):
+    """
+    Parse and check a result page, in the process pool: the XPath objects and the document stay in the process,
+    only the text and the (valid, message) tuple are copied.
+
+    `engine_name`: all results must come from this engine, or None for a search with the default engines.
+    """
+    document = html.fromstring(text)
+    if engine_name is not None:
+        return CHECK_RESULT.check_html_result_page(engine_name, document)
+    return CHECK_RESULT.check_search_result_page(document)
+
+
 # pylint: disable=too-many-arguments, too-many-locals
 async def request_stat(client, url, count, between_a, and_b, check_results, **kwargs):
     error_count = 0
@@ -102,13 +118,12 @@ async def request_stat(client, url, count, between_a, and_b, check_results, **kw
     # loop
     for _ in range(0, count):
         await asyncio.sleep(random.randint(a=between_a, b=and_b))
-        response, error_msg = await get(client, url, **kwargs)
+        response, error_msg = await get_stream(client, url, **kwargs)
 
         # check error_msg
         if error_msg is not None:
             response_time_stats.add_error(error_msg)
         else:
-            await response.aread()
             # check response
             valid_response, error_msg = await check_results(response)
             if valid_response:
@@ -162,7 +177,8 @@ async def fetch_one(instance_url: str) -> dict:
     try:
         network_type = get_network_type(instance_url)
         timeout = 15 if network_type == NetworkType.NORMAL else 30
-        async with new_client(timeout=timeout, network_type=network_type) as client:
+        # not the shared client: measure a cold connection, and keep the cookie settings
+        async with new_client(timeout=timeout, network_type=network_type, host=get_host(instance_url)) as client:
             # check if cookie settings is supported
             # intended side effect: add one HTTP connection to the pool
             await get_cookie_settings(client, instance_url)
@@ -197,10 +213,14 @@ async def fetch_one(instance_url: str) -> dict:
     return timing
 
 
-async def fetch_and_set(instance_url: str, detail):
-    detail['timing'].update(await fetch_one(instance_url))
+async def fetch_detail(_searx_stats_result: SearxStatisticsResult, instance_url: str, _detail):
+    return await fetch_one(instance_url)
+
+
+def set_timeout(_searx_stats_result: SearxStatisticsResult, instance_url: str, detail):
+    print('❌ {0}: timeout'.format(instance_url))
+    detail['timing']['error'] = 'Timeout'
 
 
-async def fetch(searx_stats_result: SearxStatisticsResult):
-    await for_each(searx_stats_result.iter_instances(valid_or_private=True),
-                   fetch_and_set, limit=150)
+fetch = InstanceFetch(fetch_detail, keys=['timing'], valid_or_private=True, limit=TIMING_CONCURRENCY,
+                      timeout=FETCH_TIMEOUTS['timing'], on_timeout=set_timeout)
@@ -1,5 +1,5 @@
 # pylint: disable=invalid-name
-from searxstats.common.http import get, new_client, NetworkType
+from searxstats.common.http import get, shared_client, NetworkType
 from searxstats.model import SearxStatisticsResult
 
 UPTIME_URL = 'https://raw.githubusercontent.com/searxng/searx-instances-uptime/master/history/summary.json'
@@ -12,7 +12,7 @@ def percent_str_to_float(s):
 # pylint: disable=unsubscriptable-object, unsupported-delete-operation, unsupported-assignment-operation
 # pylint thinks that resource_desc is None
 async def fetch(searx_stats_result: SearxStatisticsResult):
-    async with new_client(network_type=NetworkType.NORMAL) as session:
+    async with shared_client(network_type=NetworkType.NORMAL) as session:
         response, error = await get(session, UPTIME_URL)
     if error:
         print(error)
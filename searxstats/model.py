@@ -7,11 +7,17 @@ import os
 from enum import Enum
 
 from .common.memoize import erase_by_name
+from .common.profile import get_fetch_profile
 from .common.utils import dict_update, create_task, print_exception_wrapper
-from .common.foreach import for_each
+from .common.foreach import iter_each
 from .common.http import get_network_type, NetworkType
 from .config import SEARXNG_GIT_REPOSITORY
 
+try:
+    ExceptionGroup
+except NameError:  # Python 3.10
+    from exceptiongroup import ExceptionGroup  # pylint: disable=redefined-builtin, import-error
+
 
 class AsnPrivacy(Enum):
     BAD = -1
@@ -70,18 +76,20 @@ class SearxStatisticsResult:
             elif isinstance(dst[key], dict) and isinstance(value, dict):
                 SearxStatisticsResult._merge_missing(dst[key], value)
 
-    def iter_instances(self, only_valid=False, valid_or_private=True, network_type=NetworkType):
+    def is_selected(self, url, detail, only_valid=False, valid_or_private=True, network_type=NetworkType):
         if isinstance(network_type, NetworkType):
             network_type = [network_type]
+        is_valid = self._is_valid_instance(detail)
+        if only_valid and not is_valid:
+            return False
+        if valid_or_private and not self.private and not is_valid:
+            return False
+        return get_network_type(url) in network_type
+
+    def iter_instances(self, only_valid=False, valid_or_private=True, network_type=NetworkType):
         for instance, detail in self.instances.items():
-            is_valid = self._is_valid_instance(detail)
-            if only_valid and not is_valid:
-                continue
-            if valid_or_private and not self.private and not is_valid:
-                continue
-            if get_network_type(instance) not in network_type:
-                continue
-            yield instance, detail
+            if self.is_selected(instance, detail, only_valid, valid_or_private, network_type):
+                yield instance, detail
 
     def get_instance(self, url):
         return self.instances[url]
@@ -107,33 +115,183 @@ class SearxStatisticsResult:
                 self.metadata['ips'] = (previous.get('metadata') or {}).get('ips') or {}
 
         with open(output_file_name, "w") as output_file:
-            json.dump({
-                'metadata': self.metadata,
-                'instances': self.instances,
-                'engines': self.engines,
-                'engine_errors': self.engine_errors,
-                'hashes': self.hashes,
-                'cidrs': self.cidrs,
-                'forks': self.forks,
-            }, output_file, ensure_ascii=False)
+            json.dump(self.to_dict(), output_file, ensure_ascii=False)
+
+    def to_dict(self):
+        return {
+            'metadata': self.metadata,
+            'instances': self.instances,
+            'engines': self.engines,
+            'engine_errors': self.engine_errors,
+            'hashes': self.hashes,
+            'cidrs': self.cidrs,
+            'forks': self.forks,
+        }
+
+    @staticmethod
+    def from_dict(content, private=False):
+        searx_stats_result = SearxStatisticsResult(private=private)
+        for name, value in content.items():
+            setattr(searx_stats_result, name, value)
+        return searx_stats_result
+
+
+class InstanceFetch:
+    """
+    Fetch the instances one by one: `function(searx_stats_result, url, detail)` is called
+    for each instance selected by `only_valid`, `valid_or_private` and `network_type` (see iter_instances).
+
+    The result is stored by `store(searx_stats_result, url, detail, result)`, which returns the (url, detail)
+    of the instance after the call (the URL may change after a HTTP redirect), or by default in detail[keys].
+
+    `prepare(searx_stats_result)` is called before the first instance, `finalize(searx_stats_result)` after
+    the last one. `limit` and `timeout`: see iter_each. `on_timeout(searx_stats_result, url, detail)`.
+
+    The instances are read from `instances`, an asynchronous iterator of (url, detail) (see fetcher.fetch),
+    or from searx_stats_result. `on_instance_done(url, detail)` is called for each instance, even if
+    the instance is not selected, or if the call has failed. `profile`: see iter_each.
+
+    The instances in `skip` are already fetched (resumed run): they are considered as done.
+    `resumable` is False if the fetcher can't skip instances, for example when `prepare` erases the previous
+    results.
+    """
+
+    __slots__ = 'function', 'keys', 'store', 'only_valid', 'valid_or_private', 'network_type', 'limit', \
+        'timeout', 'on_timeout', 'prepare', 'finalize', 'resumable'
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, function, keys=None, store=None, only_valid=False, valid_or_private=True,
+                 network_type=NetworkType, limit=1, timeout=None, on_timeout=None, prepare=None, finalize=None,
+                 resumable=True):
+        self.function = function
+        self.keys = keys
+        self.store = store
+        self.only_valid = only_valid
+        self.valid_or_private = valid_or_private
+        self.network_type = network_type
+        self.limit = limit
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.prepare = prepare
+        self.finalize = finalize
+        self.resumable = resumable
+
+    @staticmethod
+    async def _call(function, searx_stats_result):
+        if function is not None:
+            result = function(searx_stats_result)
+            if inspect.isawaitable(result):
+                await result
+
+    def _store(self, searx_stats_result, url, detail, result):
+        if self.store is not None:
+            return self.store(searx_stats_result, url, detail, result)
+        if self.keys is not None:
+            dict_update(detail, self.keys, result)
+        return url, detail
+
+    async def fetch(self, searx_stats_result: SearxStatisticsResult, instances=None, on_instance_done=None,
+                    profile=None, skip=None):
+        def instance_done(url, detail):
+            if on_instance_done is not None:
+                on_instance_done(url, detail)
+
+        async def iter_selected_instances():
+            if instances is None:
+                # copy: the store function may add or remove instances
+                async_instances = _iter_async(list(searx_stats_result.instances.items()))
+            else:
+                async_instances = instances
+            async for url, detail in async_instances:
+                if skip is not None and url in skip:
+                    instance_done(url, detail)
+                elif searx_stats_result.is_selected(url, detail, self.only_valid, self.valid_or_private,
+                                                    self.network_type):
+                    yield url, detail
+                else:
+                    instance_done(url, detail)
+
+        def set_timeout(_, url, detail):
+            if self.on_timeout is not None:
+                self.on_timeout(searx_stats_result, url, detail)
+            instance_done(url, detail)
+
+        await self._call(self.prepare, searx_stats_result)
+        errors = []
+        async for (url, detail), result in iter_each(iter_selected_instances(), self.function, searx_stats_result,
+                                                     limit=self.limit, timeout=self.timeout,
+                                                     on_timeout=set_timeout, return_exceptions=True,
+                                                     profile=profile):
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                url, detail = self._store(searx_stats_result, url, detail, result)
+            instance_done(url, detail)
+        await self._call(self.finalize, searx_stats_result)
+        if errors:
+            raise ExceptionGroup(f'{len(errors)} call(s) to {self.function.__name__} failed', errors)
+
+    def __repr__(self):
+        return 'InstanceFetch({0}, only_valid={1}, network_type={2}, limit={3})'.\
+            format(self.function.__name__, self.only_valid, self.network_type, self.limit)
+
+
+async def _iter_async(iterable):
+    for item in iterable:
+        yield item
 
 
 class Fetcher:
+    """
+    `dependencies`: names of the fetchers which must be done before this one starts.
 
-    __slots__ = 'name', 'help_message', 'fetch_module', 'group_name', 'mandatory'
+    `instance_dependencies`: names of the fetchers which must be done for an instance before this one
+    fetches the same instance (only if the module `fetch` is an InstanceFetch,
+    otherwise they are the same as `dependencies`).
+    """
+
+    __slots__ = 'name', 'help_message', 'fetch_module', 'mandatory', 'dependencies', 'instance_dependencies'
 
     # pylint: disable=too-many-arguments
-    def __init__(self, fetch_module, name, help_message, group_name=None, mandatory=False):
+    def __init__(self, fetch_module, name, help_message, mandatory=False, dependencies=(),
+                 instance_dependencies=()):
         self.fetch_module = fetch_module
         self.name = name
         self.help_message = help_message
-        self.group_name = group_name
         self.mandatory = mandatory
+        self.dependencies = tuple(dependencies)
+        self.instance_dependencies = tuple(instance_dependencies)
+
+    def get_instance_fetch(self):
+        instance_fetch = getattr(self.fetch_module, 'fetch', None)
+        if isinstance(instance_fetch, InstanceFetch):
+            return instance_fetch
+        return None
 
-    def create_fetch_task(self, loop, executor, searx_stats_result: SearxStatisticsResult):
-        fetch = self.get_function('fetch')
+    def create_fetch_task(self, loop, executor, searx_stats_result: SearxStatisticsResult, **kwargs):
+        """
+        `kwargs`: `instances`, `on_instance_done` and `skip` of InstanceFetch.fetch
+
+        The wall time of the fetcher, and the time spent on each instance are recorded
+        in the profile named after the fetcher (see common/profile.py).
+        """
+        profile = get_fetch_profile(self.name)
+        instance_fetch = self.get_instance_fetch()
+        if instance_fetch is not None:
+            fetch = instance_fetch.fetch
+            kwargs['profile'] = profile
+        else:
+            fetch = self.get_function('fetch')
         safe_fetch = print_exception_wrapper(fetch)
-        return create_task(loop, executor, safe_fetch, searx_stats_result)
+
+        async def profiled_fetch():
+            profile.start()
+            try:
+                return await create_task(loop, executor, safe_fetch, searx_stats_result, **kwargs)
+            finally:
+                profile.stop()
+
+        return loop.create_task(profiled_fetch())
 
     def create_initialize_task(self, loop, executor):
         initialize = self.get_function('initialize')
@@ -144,6 +302,15 @@ class Fetcher:
             pass
         return dummy()
 
+    async def is_outdated(self, loop, executor, searx_stats_result: SearxStatisticsResult):
+        """
+        False if the module function `is_outdated` says that a new fetch is useless (server mode)
+        """
+        is_outdated = self.get_function('is_outdated')
+        if is_outdated is None:
+            return True
+        return await create_task(loop, executor, is_outdated, searx_stats_result)
+
     def erase_memoize(self):
         erase_by_name(self.fetch_module.__name__)
 
@@ -156,28 +323,26 @@ class Fetcher:
 
 
 # pylint: disable=too-many-arguments
-def create_fetch(keys, fetch_one, only_valid=False, valid_or_private=True, network_type=NetworkType, limit=1):
+def create_fetch(keys, fetch_one, only_valid=False, valid_or_private=True, network_type=NetworkType, limit=1,
+                 timeout=None, timeout_result=None):
+    """
+    Return an InstanceFetch storing `fetch_one(url)` in detail[keys].
 
-    async def fetch_and_set_async(url, detail, *args, **kwargs):
-        result = await fetch_one(url, *args, **kwargs)
-        dict_update(detail, keys, result)
+    After `timeout` seconds, the call to fetch_one is cancelled, and `timeout_result` is set (if not None)
+    """
 
-    def fetch_and_set_function(url, detail, *args, **kwargs):
-        result = fetch_one(url, *args, **kwargs)
-        dict_update(detail, keys, result)
+    async def fetch_async(_, url, __):
+        return await fetch_one(url)
 
-    async def fetch(searx_stats_result: SearxStatisticsResult):
-        if inspect.iscoroutinefunction(fetch_one):
-            fetch_and_set = fetch_and_set_async
-        else:
-            fetch_and_set = fetch_and_set_function
-        instance_iterator = searx_stats_result.iter_instances(only_valid=only_valid,
-                                                              valid_or_private=valid_or_private,
-                                                              network_type=network_type)
-        await for_each(instance_iterator, fetch_and_set,
-                       limit=limit)
+    def fetch_function(_, url, __):
+        return fetch_one(url)
 
-    fetch.__name__ = 'fetch({}, {}, only_valid={}, network_type={}, limit={})'.\
-        format(str(keys), fetch_one.__name__, only_valid, network_type, limit)
+    def set_timeout(_, url, detail):
+        print('⏱️  {0}: {1} timeout'.format(url, fetch_one.__name__))
+        if timeout_result is not None:
+            dict_update(detail, keys, timeout_result)
 
-    return fetch
+    function = fetch_async if inspect.iscoroutinefunction(fetch_one) else fetch_function
+    function.__name__ = fetch_one.__name__
+    return InstanceFetch(function, keys=keys, only_valid=only_valid, valid_or_private=valid_or_private,
+                         network_type=network_type, limit=limit, timeout=timeout, on_timeout=set_timeout)
@@ -0,0 +1,243 @@
+import copy
+import json
+import hashlib
+import argparse
+
+from .fetcher.external_resources import result_hash_iterator
+from .config import SEARXNG_GIT_REPOSITORY
+
+
+def parse_shard(value: str):
+    """
+    argparse type of --shard: 'i/N' --> (i, N), with 1 <= i <= N
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError('expected i/N, for example 1/4') from ex
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('expected 1 <= i <= N')
+    return index, count
+
+
+def get_shard_index(url: str, count: int):
+    """
+    Shard of `url` between 1 and `count`: the same on all machines and all runs
+    """
+    return int(hashlib.sha256(url.encode()).hexdigest(), 16) % count + 1
+
+
+def select_shard(searx_stats_result, shard):
+    index, count = shard
+    searx_stats_result.instances = {
+        url: detail
+        for url, detail in searx_stats_result.instances.items()
+        if get_shard_index(url, count) == index
+    }
+    searx_stats_result.metadata['shard'] = '{0}/{1}'.format(index, count)
+
+
+def _get_shard_key(result):
+    shard = result.get('metadata', {}).get('shard')
+    return parse_shard(shard) if shard else (0, 0)
+
+
+def _merge_engine(merged_engines, name, engine):
+    if name not in merged_engines:
+        merged_engine = merged_engines[name] = copy.deepcopy(engine)
+        merged_engine['stats'] = {'instance_count': 0, 'stats_count': 0, 'total_error_rate': 0}
+
+
+def _add_engine_stats(merged_engines, detail):
+    # same as selfreport.fetch_one, from the engines of one merged instance
+    for name, engine_detail in (detail.get('engines') or {}).items():
+        if name not in merged_engines:
+            continue
+        merged_stats = merged_engines[name]['stats']
+        merged_stats['instance_count'] += 1
+        if engine_detail.get('error_rate') is not None:
+            merged_stats['stats_count'] += 1
+            merged_stats['total_error_rate'] += engine_detail['error_rate']
+
+
+def _finalize_engines(merged_engines):
+    # same as selfreport.finalize_stats
+    for engine in merged_engines.values():
+        stats = engine['stats']
+        if stats['stats_count'] == 0:
+            stats['error_rate'] = None
+        else:
+            stats['error_rate'] = round(stats['total_error_rate'] / stats['stats_count'], 1)
+        del stats['total_error_rate']
+
+
+class _IndexedTable:
+    """
+    List of values, each value has a unique key: the indexes of the merged output
+    """
+
+    __slots__ = 'values', 'indexes'
+
+    def __init__(self):
+        self.values = []
+        # key --> index in values
+        self.indexes = {}
+
+    def get_index(self, key, create_value):
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = len(self.values)
+            self.values.append(create_value())
+        return index
+
+
+def _get_hash_fork_urls(result, resource_hash):
+    """
+    None if the hash is a file of SearXNG or a well known file,
+    otherwise the set of the fork URLs containing the file (empty if the file is unknown)
+    """
+    if 'forks' in resource_hash:
+        return {result['forks'][i] for i in resource_hash['forks']}
+    if resource_hash.get('unknown'):
+        return set()
+    return None
+
+
+def _merge_hash_forks(results, forks):
+    """
+    Return hash --> the 'forks' or 'unknown' fields of the hash, with the indexes of the merged `forks`.
+
+    Each shard knows the commits of its own forks: the fork URLs of a hash are the union of the shards,
+    and a file known by SearXNG in one shard is known in the merged result.
+    """
+    # hash --> None or set of fork URLs, see _get_hash_fork_urls
+    hash_fork_urls = {}
+    for result in results:
+        for resource_hash in result.get('hashes', []):
+            fork_urls = _get_hash_fork_urls(result, resource_hash)
+            previous_fork_urls = hash_fork_urls.get(resource_hash['hash'], set())
+            if fork_urls is None or previous_fork_urls is None:
+                hash_fork_urls[resource_hash['hash']] = None
+            else:
+                hash_fork_urls[resource_hash['hash']] = previous_fork_urls | fork_urls
+    hash_forks = {}
+    for hash_value, fork_urls in hash_fork_urls.items():
+        if fork_urls is None:
+            hash_forks[hash_value] = {}
+        elif fork_urls:
+            hash_forks[hash_value] = {'forks': sorted(forks.index(url) for url in fork_urls)}
+        else:
+            hash_forks[hash_value] = {'unknown': True}
+    return hash_forks
+
+
+def _merge_instance(result, detail, hash_forks, hashes, engine_errors):
+    """
+    Copy of `detail` where the indexes refer to the merged `hashes`, `engine_errors` and `forks`
+    """
+    detail = copy.deepcopy(detail)
+    # hashRef --> hashes
+    hash_indexes = set()
+    for resource, _ in result_hash_iterator((detail.get('html') or {}).get('resources')):
+        if not isinstance(resource, dict) or resource.get('hashRef') is None:
+            continue
+        resource_hash = dict(result['hashes'][resource['hashRef']])
+        resource_hash.pop('forks', None)
+        resource_hash.pop('unknown', None)
+        resource_hash.update(hash_forks[resource_hash['hash']])
+        resource_hash['count'] = 0
+        resource['hashRef'] = hashes.get_index(resource_hash['hash'], lambda value=resource_hash: value)
+        hash_indexes.add(resource['hashRef'])
+    for index in hash_indexes:
+        hashes.values[index]['count'] += 1
+    # errors --> engine_errors
+    for engine in (detail.get('engines') or {}).values():
+        if engine.get('errors'):
+            engine['errors'] = [
+                engine_errors.get_index(json.dumps(result['engine_errors'][i], sort_keys=True),
+                                        lambda value=result['engine_errors'][i]: value)
+                for i in engine['errors']
+            ]
+    return detail
+
+
+def _merge_metadata(results):
+    metadata = copy.deepcopy(results[0].get('metadata', {})) if results else {}
+    for name in ('shard', 'run', 'memoize', 'concurrency'):
+        metadata.pop(name, None)
+    metadata['shards'] = []
+    for result in results:
+        result_metadata = result.get('metadata', {})
+        for ip, ip_detail in (result_metadata.get('ips') or {}).items():
+            metadata.setdefault('ips', {}).setdefault(ip, ip_detail)
+        if result_metadata.get('timestamp') is not None:
+            metadata['timestamp'] = min(metadata.get('timestamp', result_metadata['timestamp']),
+                                        result_metadata['timestamp'])
+        metadata['shards'].append({
+            'shard': result_metadata.get('shard'),
+            'timestamp': result_metadata.get('timestamp'),
+            'instances': len(result.get('instances', {})),
+        })
+    return metadata
+
+
+def merge_results(results: list):
+    """
+    Merge the outputs of the shards (the content of the instances.json files).
+
+    The result doesn't depend on the order of `results`:
+    * the instances are sorted by URL (if an URL is in several shards, the first shard wins),
+    * `hashes`, `engine_errors` and `forks` are rebuilt, and the indexes in the instances are updated,
+    * the forks of each hash are the union of the shards (see _merge_hash_forks),
+    * `engines.stats` is computed again from the engines of the merged instances, `cidrs` is the union.
+    """
+    results = sorted(results, key=_get_shard_key)
+    forks = {fork for result in results for fork in result.get('forks', [])} - {SEARXNG_GIT_REPOSITORY}
+    forks = [SEARXNG_GIT_REPOSITORY] + sorted(forks)
+
+    # url --> (result, detail)
+    instances = {}
+    for result in results:
+        for url, detail in result.get('instances', {}).items():
+            instances.setdefault(url, (result, detail))
+
+    engines = {}
+    cidrs = {}
+    for result in results:
+        for name, engine in result.get('engines', {}).items():
+            _merge_engine(engines, name, engine)
+        for cidr, cidr_detail in result.get('cidrs', {}).items():
+            cidrs.setdefault(cidr, cidr_detail)
+
+    hash_forks = _merge_hash_forks(results, forks)
+    hashes = _IndexedTable()
+    engine_errors = _IndexedTable()
+    merged_instances = {}
+    for url in sorted(instances):
+        result, detail = instances[url]
+        merged_instances[url] = _merge_instance(result, detail, hash_forks, hashes, engine_errors)
+        # the duplicated instances are not counted
+        _add_engine_stats(engines, detail)
+    _finalize_engines(engines)
+
+    return {
+        'metadata': _merge_metadata(results),
+        'instances': merged_instances,
+        'engines': {name: engines[name] for name in sorted(engines)},
+        'engine_errors': engine_errors.values,
+        'hashes': hashes.values,
+        'cidrs': {cidr: cidrs[cidr] for cidr in sorted(cidrs)},
+        'forks': forks,
+    }
+
+
+def merge_files(output_file_name: str, input_file_names: list):
+    results = []
+    for input_file_name in input_file_names:
+        with open(input_file_name) as input_file:
+            results.append(json.load(input_file))
+    merged_result = merge_results(results)
+    with open(output_file_name, 'w') as output_file:
+        json.dump(merged_result, output_file, ensure_ascii=False)
+    print('{0} instance(s) from {1} shard(s) merged into {2}'.format(
+        len(merged_result['instances']), len(results), output_file_name))
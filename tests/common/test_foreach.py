@@ -2,7 +2,8 @@ import asyncio
 import time
 import pytest
 
-from searxstats.common.foreach import for_each
+from searxstats.common.foreach import for_each, iter_each, AdaptiveLimit, get_concurrency_statistics, \
+    set_run_budget
 
 
 @pytest.mark.asyncio
@@ -116,3 +117,185 @@ async def test_for_each_huge_tuple():
     for i in [0, 501]:
         if i in output_value_set:
             raise ValueError(f'{i} found')
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('limit', [0, 2])
+async def test_iter_each(limit):
+    async def f_async(i, delay):
+        await asyncio.sleep(delay)
+        return i * 2
+
+    input_list = [(1, 0.3), (2, 0.1), (3, 0.2)]
+    results = [(item, result) async for item, result in iter_each(input_list, f_async, limit=limit)]
+    assert sorted(results) == [((1, 0.3), 2), ((2, 0.1), 4), ((3, 0.2), 6)]
+    if limit == 0:
+        # in the completion order
+        assert [result for _, result in results] == [4, 6, 2]
+
+
+@pytest.mark.asyncio
+async def test_iter_each_exception_group():
+    def f_func(i):
+        if i in ('B', 'D'):
+            raise ValueError(i)
+        return i
+
+    results = []
+    with pytest.raises(ExceptionGroup) as exc_info:
+        async for _, result in iter_each(['A', 'B', 'C', 'D'], f_func):
+            results.append(result)
+    assert sorted(results) == ['A', 'C']
+    assert sorted(str(ex) for ex in exc_info.value.exceptions) == ['B', 'D']
+
+    output_set = set()
+
+    async def f_async(i):
+        f_func(i)
+        output_set.add(i)
+
+    with pytest.raises(ExceptionGroup):
+        await for_each(['A', 'B', 'C', 'D'], f_async, limit=2, group_errors=True)
+    assert output_set == {'A', 'C'}
+
+
+def test_adaptive_limit():
+    limit = AdaptiveLimit(2, 16, name='test')
+
+    def report_window(latency, error=False):
+        for _ in range(max(limit.limit, 4)):
+            limit.report(latency, error)
+
+    # slow start
+    report_window(0.1)
+    assert limit.limit == 4
+    report_window(0.1)
+    assert limit.limit == 8
+    # the latency increases: multiplicative decrease
+    report_window(1)
+    assert limit.limit == 4
+    # additive increase
+    report_window(0.1)
+    assert limit.limit == 5
+    # errors: multiplicative decrease
+    report_window(0.1, True)
+    assert limit.limit == 2
+    report_window(0.1, True)
+    assert limit.limit == 2
+    assert limit.to_dict()['max_limit'] == 8
+
+
+@pytest.mark.asyncio
+async def test_for_each_adaptive_limit():
+    running = [0, 0]
+
+    async def f_async(_):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+
+    limit = AdaptiveLimit(1, 8, name='test_for_each_adaptive_limit')
+    await for_each(range(100), f_async, limit=limit)
+    assert limit.limit == 8
+    assert 1 < running[1] <= 8
+    assert get_concurrency_statistics()['test_for_each_adaptive_limit']['limit'] == 8
+
+
+@pytest.mark.asyncio
+async def test_for_each_timeout():
+    output_set = set()
+    timed_out = []
+
+    async def f_async(i, delay):
+        await asyncio.sleep(delay)
+        output_set.add(i)
+
+    def f_func(i, delay):
+        time.sleep(delay)
+        output_set.add(i)
+
+    input_list = [('A', 0.1), ('B', 1.5), ('C', 0.1)]
+    for function in (f_async, f_func):
+        output_set = set()
+        timed_out.clear()
+        start_time = time.time()
+        await for_each(input_list, function, limit=0, timeout=0.5,
+                       on_timeout=lambda i, delay: timed_out.append(i))
+        assert time.time() - start_time < 1
+        assert output_set == {'A', 'C'}
+        assert timed_out == ['B']
+
+
+@pytest.mark.asyncio
+async def test_for_each_deadline():
+    output_set = set()
+    timed_out = []
+
+    async def f_async(i, delay):
+        await asyncio.sleep(delay)
+        output_set.add(i)
+
+    input_list = [('A', 0.1), ('B', 5), ('C', 5), ('D', 0.1)]
+    await for_each(input_list, f_async, limit=2, deadline=0.5, on_timeout=lambda i, delay: timed_out.append(i))
+    # A and B are started, then C after A, D is never started
+    assert output_set == {'A'}
+    assert sorted(timed_out) == ['B', 'C', 'D']
+
+
+@pytest.mark.asyncio
+async def test_iter_each_cancelled():
+    timed_out = []
+
+    async def f_async(i):
+        if i == 'B':
+            # cancelled by something else than iter_each
+            raise asyncio.CancelledError()
+        return i
+
+    results = [result async for _, result in iter_each(['A', 'B'], f_async, on_timeout=timed_out.append)]
+    assert results == ['A']
+    assert timed_out == ['B']
+
+
+@pytest.mark.asyncio
+async def test_run_budget():
+    timed_out = []
+
+    async def f_async(_):
+        await asyncio.sleep(5)
+
+    async def run():
+        set_run_budget(0.2)
+        await for_each(['A', 'B'], f_async, limit=1, on_timeout=timed_out.append)
+
+    await asyncio.create_task(run())
+    assert timed_out == ['A', 'B']
+
+
+@pytest.mark.asyncio
+async def test_iter_each_async_iterator():
+    queue = asyncio.Queue()
+
+    async def iter_queue():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            yield item
+
+    async def f_async(i):
+        if i == 'B':
+            raise ValueError(i)
+        return i.lower()
+
+    results = []
+    queue.put_nowait('A')
+    async for item, result in iter_each(iter_queue(), f_async, limit=2, return_exceptions=True):
+        results.append((item, result))
+        if item == 'A':
+            # the items can be produced while iterating
+            queue.put_nowait('B')
+            queue.put_nowait(None)
+    assert results[0] == ('A', 'a')
+    assert results[1][0] == 'B' and isinstance(results[1][1], ValueError)
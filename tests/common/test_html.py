@@ -1,15 +1,13 @@
 # pylint: disable=unused-argument, redefined-outer-name
 from lxml import etree
-
-import pytest
+from lxml import html as lxml_html
 
 import searxstats.common.html as html
 
 
-@pytest.mark.asyncio
-async def test_html_fromstring():
+def test_extract_text():
     results_xpath = etree.XPath("//a[contains(@class,'result-default')]")
-    doc = await html.html_fromstring('<div><a href="http://localhost" class="result-default result">text</a></div>')
+    doc = lxml_html.fromstring('<div><a href="http://localhost" class="result-default result">text</a></div>')
 
     links = []
     for element in results_xpath(doc):
@@ -19,8 +17,7 @@ async def test_html_fromstring():
     assert links[0] == 'text'
 
 
-@pytest.mark.asyncio
-async def test_html_fromstring_long():
+def test_extract_text_long():
     results_xpath = etree.XPath("//div[@id='main_results']/div[contains(@class,'result-default')]/h4/a")
     text = """
 <!DOCTYPE html>
@@ -60,7 +57,7 @@ async def test_html_fromstring_long():
 </body>
 </html>
     """  # noqa
-    doc = await html.html_fromstring(text)
+    doc = lxml_html.fromstring(text)
 
     links = []
     for element in results_xpath(doc):
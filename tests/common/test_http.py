@@ -1,10 +1,24 @@
 # pylint: disable=unused-argument, redefined-outer-name
+import time
+import asyncio
+import httpx
 import pytest
 import pytest_httpserver
+import werkzeug
 
 import searxstats.common.http as http
 
 
+@pytest.fixture
+def threaded_httpserver():
+    # the slow requests must not block the other ones
+    server = pytest_httpserver.HTTPServer(threaded=True)
+    server.start()
+    yield server
+    server.clear()
+    server.stop()
+
+
 def test_get_host():
     assert http.get_host('https://en.wikipedia.org/wiki/Searx') == 'en.wikipedia.org'
     assert http.get_host('https://www.wikidata.org/wiki/Wikidata:Main_Page') == 'www.wikidata.org'
@@ -57,3 +71,199 @@ async def test_do_get_connection_refused(httpserver: pytest_httpserver.HTTPServe
 
     assert response is None
     assert isinstance(error, str)
+
+
+@pytest.mark.asyncio
+async def test_cached_dns_transport_errors(httpserver: pytest_httpserver.HTTPServer):
+    url = httpserver.url_for('/index.html')
+    httpserver.stop()
+    try:
+        # the httpcore exceptions are converted to the httpx exceptions
+        async with httpx.AsyncClient(transport=http.CachedDnsTransport()) as session:
+            with pytest.raises(httpx.ConnectError):
+                await session.get(url)
+    finally:
+        httpserver.start()
+
+
+@pytest.mark.asyncio
+async def test_shared_client(httpserver: pytest_httpserver.HTTPServer):
+    httpserver.expect_request('/index.html').\
+        respond_with_data('OK', content_type='text/html', headers={'Set-Cookie': 'a=b'})
+
+    async with http.shared_client() as session:
+        response, error = await http.get(session, httpserver.url_for('/index.html'))
+    async with http.shared_client() as other_session:
+        pass
+
+    assert other_session is session
+    assert response.text == 'OK'
+    assert error is None
+    # the cookies are not shared between the fetchers
+    assert len(session.cookies) == 0
+
+    await http.close_shared_clients()
+    assert session.is_closed
+
+
+@pytest.mark.asyncio
+async def test_host_scheduler():
+    host_scheduler = http.HostScheduler(2, 0.1, 60)
+    loop = asyncio.get_running_loop()
+    parallel = [0, 0]
+    start_times = []
+
+    async def one_request():
+        async with host_scheduler.slot('example.com'):
+            start_times.append(loop.time())
+            parallel[0] += 1
+            parallel[1] = max(parallel)
+            await asyncio.sleep(0.3)
+            parallel[0] -= 1
+
+    await asyncio.gather(*[one_request() for _ in range(4)])
+    assert parallel[1] == 2
+    start_times.sort()
+    for previous_time, next_time in zip(start_times, start_times[1:]):
+        assert next_time - previous_time >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_do_get_429(httpserver: pytest_httpserver.HTTPServer):
+    httpserver.expect_request('/429.html').\
+        respond_with_data('Too Many Requests', status=429, headers={'Retry-After': '1'})
+
+    async with http.new_client() as session:
+        response, error = await http.get(session, httpserver.url_for('/429.html'))
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        await http.get(session, httpserver.url_for('/429.html'))
+
+    assert response.status_code == 429
+    assert error == 'HTTP status code 429'
+    assert loop.time() - start_time >= 0.9
+
+
+@pytest.mark.asyncio
+async def test_do_get_retry(threaded_httpserver: pytest_httpserver.HTTPServer):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return werkzeug.Response('OK')
+
+    threaded_httpserver.expect_request('/retry.html').respond_with_handler(handler)
+    retry = http.RetryPolicy(budget={'read': 1}, backoff=0.01)
+
+    async with http.new_client() as session:
+        response, error = await http.get(session, threaded_httpserver.url_for('/retry.html'), timeout=0.2, retry=retry)
+
+    assert error is None
+    assert response.text == 'OK'
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_do_get_no_retry(threaded_httpserver: pytest_httpserver.HTTPServer):
+    threaded_httpserver.expect_request('/retry.html').respond_with_handler(lambda request: time.sleep(0.5))
+
+    async with http.new_client() as session:
+        response, error = await http.get(session, threaded_httpserver.url_for('/retry.html'), timeout=0.2)
+
+    assert response is None
+    assert error == 'Read timeout'
+
+
+@pytest.mark.asyncio
+async def test_do_get_hedge(threaded_httpserver: pytest_httpserver.HTTPServer):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            time.sleep(1)
+            return werkzeug.Response('slow')
+        return werkzeug.Response('fast')
+
+    threaded_httpserver.expect_request('/hedge.html').respond_with_handler(handler)
+
+    async with http.new_client() as session:
+        response, error = await http.get(session, threaded_httpserver.url_for('/hedge.html'), hedge=0.1)
+
+    assert error is None
+    assert response.text == 'fast'
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_do_get_hedge_cancelled(monkeypatch):
+    cancelled = []
+
+    async def scheduled_request(*args, **kwargs):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    monkeypatch.setattr(http, '_scheduled_request', scheduled_request)
+    task = asyncio.ensure_future(http.request(None, 'https://searx.example.org/', hedge=1))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+    # the request doesn't keep the slot of the host
+    assert cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_ssl_error_not_retried(httpserver: pytest_httpserver.HTTPServer):
+    httpserver.expect_request('/index.html').respond_with_data('OK')
+    url = httpserver.url_for('/index.html').replace('http://', 'https://')
+
+    async with http.new_client() as session:
+        response, error, error_class = await http._request(session.get, url)  # pylint: disable=protected-access
+
+    assert response is None
+    assert error is not None
+    assert error_class is None
+
+
+def test_latency_tracker():
+    tracker = http.LatencyTracker()
+    assert tracker.percentile(95) is None
+    for latency in range(1, 101):
+        tracker.add(latency)
+    assert tracker.percentile(95) == 96
+
+
+@pytest.mark.asyncio
+async def test_get_stream_until(httpserver: pytest_httpserver.HTTPServer):
+    body = '<html><head><title>t</title></head><body>' + 'x' * 100000 + '</body></html>'
+    httpserver.expect_request('/index.html').respond_with_data(body, content_type='text/html')
+
+    async with http.new_client() as session:
+        response, error = await http.get_stream(session, httpserver.url_for('/index.html'),
+                                                until=lambda content: b'</head>' in content)
+
+    assert error is None
+    assert '</head>' in response.text
+    assert len(response.content) < len(body)
+
+
+@pytest.mark.asyncio
+async def test_get_stream_max_size(httpserver: pytest_httpserver.HTTPServer):
+    httpserver.expect_request('/index.html').respond_with_data('x' * 1000, content_type='text/html')
+
+    async with http.new_client() as session:
+        response, error = await http.get_stream(session, httpserver.url_for('/index.html'), max_size=100)
+        assert error == 'Response too large'
+        assert response.text == 'x' * 100
+
+        response, error = await http.get_stream(session, httpserver.url_for('/index.html'), max_size=1000)
+        assert error is None
+        assert response.text == 'x' * 1000
+        assert response.elapsed is not None
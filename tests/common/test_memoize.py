@@ -0,0 +1,395 @@
+# pylint: disable=unused-argument, redefined-outer-name, protected-access
+import os
+import time
+import atexit
+import asyncio
+import concurrent.futures
+
+import yaml
+import pytest
+
+import searxstats.common.memoize as memoize
+
+
+def unbind(backend):
+    """
+    Close `backend` and remove the atexit handler registered by bind_to_file
+    """
+    if isinstance(backend, memoize.DefaultStorageBackend):
+        backend = backend.backend
+    if isinstance(backend, memoize.SqliteStorageBackend):
+        atexit.unregister(backend.close)
+        backend.close()
+    else:
+        atexit.unregister(backend._write_cache)
+        backend.file_name = None
+
+
+@pytest.fixture
+def bound_backends():
+    """
+    List of the backends to unbind after the test
+    """
+    backends = []
+    yield backends
+    for backend in backends:
+        unbind(backend)
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    backend = memoize.SqliteStorageBackend()
+    backend.bind_to_file(str(tmp_path / 'cache.db'))
+    yield backend
+    unbind(backend)
+
+
+def test_sqlite_storage(sqlite_backend):
+    storage = sqlite_backend.get_cache_storage('module.function')
+    assert storage.get(('a', 1)) == memoize.NOT_CACHED_VALUE
+
+    storage.put(('a', 1), {'value': ('x', None)})
+    assert storage.get(('a', 1)) == {'value': ('x', None)}
+    assert storage.get(('a', 2)) == memoize.NOT_CACHED_VALUE
+
+    other_storage = sqlite_backend.get_cache_storage('module.other')
+    assert other_storage.get(('a', 1)) == memoize.NOT_CACHED_VALUE
+
+
+def test_sqlite_storage_expire(sqlite_backend):
+    storage = sqlite_backend.get_cache_storage('module.function', expire_time=-1)
+    storage.put('a', 12)
+    assert storage.get('a') == memoize.NOT_CACHED_VALUE
+
+
+def test_sqlite_storage_persistence(tmp_path):
+    file_name = str(tmp_path / 'cache.db')
+    backend = memoize.SqliteStorageBackend()
+    backend.bind_to_file(file_name)
+    backend.get_cache_storage('module.function').put('a', [1, 2])
+    unbind(backend)
+
+    backend = memoize.SqliteStorageBackend()
+    backend.bind_to_file(file_name)
+    assert backend.get_cache_storage('module.function').get('a') == [1, 2]
+    unbind(backend)
+
+
+def test_sqlite_erase_by_name(sqlite_backend):
+    sqlite_backend.get_cache_storage('module.function').put('a', 1)
+    sqlite_backend.get_cache_storage('other.function').put('a', 2)
+    sqlite_backend.erase_by_name('module')
+    assert sqlite_backend.get_cache_storage('module.function').get('a') == memoize.NOT_CACHED_VALUE
+    assert sqlite_backend.get_cache_storage('other.function').get('a') == 2
+
+
+def test_sqlite_migrate_from_yaml(tmp_path, bound_backends):
+    yaml_file_name = str(tmp_path / 'cache.yaml')
+    with open(yaml_file_name, 'w') as output_file:
+        yaml.dump({'module.function': {('a', 'b'): {'t': 4102444800, 'v': ('c', None)}}}, output_file)
+
+    backend = memoize.DefaultStorageBackend()
+    backend.bind_to_file(str(tmp_path / 'cache.db'))
+    bound_backends.append(backend)
+    assert isinstance(backend.backend, memoize.SqliteStorageBackend)
+    assert backend.get_cache_storage('module.function').get(('a', 'b')) == ('c', None)
+
+
+def test_default_backend_yaml(tmp_path, bound_backends):
+    backend = memoize.DefaultStorageBackend()
+    backend.bind_to_file(str(tmp_path / 'cache.yaml'))
+    bound_backends.append(backend)
+    assert isinstance(backend.backend, memoize.FileStorageBackend)
+    assert not os.path.exists(str(tmp_path / 'cache.db'))
+
+
+def test_memoize_to_disk(sqlite_backend):
+    calls = []
+
+    @memoize.MemoizeToDisk(storage_backend=sqlite_backend)
+    def function(value):
+        calls.append(value)
+        return value * 2
+
+    assert function(2) == 4
+    assert function(2) == 4
+    assert calls == [2]
+
+
+def test_yaml_checkpoint(tmp_path, bound_backends):
+    file_name = str(tmp_path / 'cache.yaml')
+    backend = memoize.FileStorageBackend()
+    backend.bind_to_file(file_name)
+    bound_backends.append(backend)
+    backend.get_cache_storage('module.function').put('a', 1)
+    backend.checkpoint()
+    # no temporary file left
+    assert os.listdir(str(tmp_path)) == ['cache.yaml']
+
+    backend = memoize.FileStorageBackend()
+    backend.bind_to_file(file_name)
+    bound_backends.append(backend)
+    assert backend.get_cache_storage('module.function').get('a') == 1
+
+
+@pytest.mark.asyncio
+async def test_memoize_single_flight_async():
+    calls = []
+
+    @memoize.Memoize()
+    async def function(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return [value]
+
+    results = await asyncio.gather(*[function(1) for _ in range(5)], function(2))
+    assert results == [[1]] * 5 + [[2]]
+    assert calls == [1, 2]
+
+
+def test_memoize_single_flight_thread():
+    calls = []
+
+    @memoize.Memoize()
+    def function(value):
+        calls.append(value)
+        time.sleep(0.1)
+        return [value]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        results = list(executor.map(function, [1] * 5))
+    assert results == [[1]] * 5
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_memoize_single_flight_exception():
+    calls = []
+
+    @memoize.Memoize()
+    async def function(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        raise ValueError()
+
+    results = await asyncio.gather(function(1), function(1), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_memoize_single_flight_cancelled():
+    calls = []
+
+    @memoize.Memoize()
+    async def function(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return [value]
+
+    leader = asyncio.ensure_future(function(1))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(function(1))
+    await asyncio.sleep(0.05)
+    leader.cancel()
+    # the waiting task is not cancelled: it calls the function again
+    assert await waiter == [1]
+    assert leader.cancelled()
+    assert calls == [1, 1]
+
+
+def test_compact_entries():
+    entries = {
+        'expired': {'t': 0, 'v': 1},
+        'old': {'t': 90, 'v': 2},
+        'recent': {'t': 95, 'v': 3},
+        'new': {'t': 99, 'v': 4},
+    }
+    assert memoize.compact_entries(entries, 50, 2, now=100) == 2
+    assert set(entries.keys()) == {'recent', 'new'}
+
+
+@pytest.mark.parametrize('backend_class', [memoize.SqliteStorageBackend, memoize.FileStorageBackend])
+def test_compact(tmp_path, bound_backends, backend_class):
+    backend = backend_class()
+    backend.register('module.function', expire_time=3600, max_entries=2)
+    backend.bind_to_file(str(tmp_path / 'cache'))
+    bound_backends.append(backend)
+    storage = backend.get_cache_storage('module.function')
+    for i in range(0, 4):
+        storage.put(i, i)
+        time.sleep(0.01)
+    backend.get_cache_storage('module.removed').put('a', 1)
+
+    assert backend.compact() == 2
+    assert storage.get(0) == memoize.NOT_CACHED_VALUE
+    assert storage.get(3) == 3
+    assert backend.get_cache_storage('module.removed').get('a') == 1
+
+    assert backend.compact(drop_unknown=True) == 1
+    assert backend.get_cache_storage('module.removed').get('a') == memoize.NOT_CACHED_VALUE
+
+
+def test_freeze():
+    value = {'a': [1, {'b': 2}], 'c': {3}}
+    frozen = memoize.freeze(value)
+    with pytest.raises(TypeError):
+        frozen['a'] = None
+    assert frozen['a'] == (1, {'b': 2})
+    assert memoize.freeze(frozen) is frozen
+    assert memoize.unfreeze(frozen) == value
+
+
+def test_frozen_storage(sqlite_backend):
+    storage = sqlite_backend.get_cache_storage('module.function', frozen=True)
+    storage.put('a', {'b': [1]})
+    value = storage.get('a')
+    assert value == {'b': (1, )}
+    assert storage.get('a') is value
+
+    other_storage = sqlite_backend.get_cache_storage('module.function', frozen=True)
+    assert other_storage.get('a') == value
+
+
+def test_frozen_values_bounded(sqlite_backend, monkeypatch):
+    monkeypatch.setattr(memoize, 'DEFAULT_FROZEN_MAXSIZE', 2)
+    storage = sqlite_backend.get_cache_storage('module.bounded', frozen=True)
+    for key in ('a', 'b', 'c'):
+        storage.put(key, {'key': key})
+    assert len(storage.frozen_values.data) == 2
+    # the least recently used value is read again from the backend
+    assert storage.get('a') == {'key': 'a'}
+
+    value = storage.get('c')
+    sqlite_backend.compact()
+    assert len(storage.frozen_values.data) == 0
+    assert storage.get('c') is not value
+
+    sqlite_backend.erase_by_name('module.bounded')
+    assert storage.get('c') == memoize.NOT_CACHED_VALUE
+
+
+def test_memoize_to_disk_frozen(sqlite_backend):
+
+    @memoize.MemoizeToDisk(storage_backend=sqlite_backend, frozen=True)
+    def function(value):
+        return {'value': value}
+
+    result = function(2)
+    assert function(2) is result
+    with pytest.raises(TypeError):
+        result['value'] = 3
+
+
+def test_memoize_statistics(sqlite_backend):
+
+    @memoize.MemoizeToDisk(storage_backend=sqlite_backend, validate_result=lambda result: result > 0)
+    def function_with_statistics(value):
+        return value
+
+    function_with_statistics(1)
+    function_with_statistics(1)
+    function_with_statistics(0)
+    statistics = memoize.get_statistics()[__name__ + '.function_with_statistics']
+    assert statistics['hits'] == 1
+    assert statistics['misses'] == 2
+    assert statistics['rejected'] == 1
+    assert statistics['expired'] == 0
+
+    memoize.reset_statistics()
+    assert __name__ + '.function_with_statistics' not in memoize.get_statistics()
+
+
+@pytest.mark.asyncio
+async def test_memoize_stale_async(sqlite_backend):
+    calls = []
+
+    @memoize.MemoizeToDisk(storage_backend=sqlite_backend, expire_time=0.1, stale_time=60)
+    async def function_stale_async(value):
+        calls.append(value)
+        await asyncio.sleep(0.1)
+        return len(calls)
+
+    assert await function_stale_async(1) == 1
+    await asyncio.sleep(0.2)
+    # expired: the stale value is returned and refreshed in the background
+    assert await function_stale_async(1) == 1
+    assert await function_stale_async(1) == 1
+    await memoize.wait_background_refresh()
+    assert calls == [1, 1]
+    assert await function_stale_async(1) == 2
+
+
+def test_memoize_stale_thread(sqlite_backend):
+    calls = []
+
+    @memoize.MemoizeToDisk(storage_backend=sqlite_backend, expire_time=0.1, stale_time=60)
+    def function_stale_thread(value):
+        calls.append(value)
+        time.sleep(0.1)
+        return len(calls)
+
+    assert function_stale_thread(1) == 1
+    time.sleep(0.2)
+    assert function_stale_thread(1) == 1
+    concurrent.futures.wait(list(memoize.BACKGROUND_REFRESH))
+    assert calls == [1, 1]
+    assert function_stale_thread(1) == 2
+
+
+def test_negative_cache(sqlite_backend):
+    storage = sqlite_backend.get_cache_storage('module.function', expire_time=3600, negative_expire_time=0.1)
+    storage.put_failure('a', 'error')
+    assert storage.get('a') == 'error'
+    time.sleep(0.15)
+    assert storage.get('a') == memoize.NOT_CACHED_VALUE
+
+    # the second consecutive failure is cached twice longer
+    storage.put_failure('a', 'error')
+    time.sleep(0.15)
+    assert storage.get('a') == 'error'
+
+    storage.put('a', 'ok')
+    storage.put_failure('b', 'error')
+    assert storage.get('a') == 'ok'
+    assert sqlite_backend.read_entry('module.function', 'a') == {'t': pytest.approx(time.time(), abs=5), 'v': 'ok'}
+
+
+def test_memoize_to_disk_negative_cache(sqlite_backend):
+    calls = []
+
+    @memoize.MemoizeToDisk(storage_backend=sqlite_backend, validate_result=lambda result: result is not None,
+                           negative_expire_time=60)
+    def function_negative_cache(value):
+        calls.append(value)
+
+    function_negative_cache(1)
+    function_negative_cache(1)
+    assert calls == [1]
+
+
+def test_lru_storage():
+    storage = memoize.LRUCacheStorage(2)
+    storage.put('a', 1)
+    storage.put('b', 2)
+    assert storage.get('a') == 1
+    storage.put('c', 3)
+    # b is the least recently used
+    assert storage.get('b') == memoize.NOT_CACHED_VALUE
+    assert storage.get('a') == 1
+    assert storage.get('c') == 3
+
+
+def test_memoize_maxsize():
+    calls = []
+
+    @memoize.Memoize(maxsize=1)
+    def function_maxsize(value):
+        calls.append(value)
+        return value
+
+    function_maxsize(1)
+    function_maxsize(2)
+    function_maxsize(2)
+    function_maxsize(1)
+    assert calls == [1, 2, 1]
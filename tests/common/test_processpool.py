@@ -0,0 +1,37 @@
+# pylint: disable=unused-argument, redefined-outer-name
+import os
+import hashlib
+
+import pytest
+
+from searxstats.common.utils import get_file_content_hash
+from searxstats.common.processpool import run_in_process, get_process_pool, shutdown_process_pool
+from searxstats.fetcher.timing import check_page
+
+
+@pytest.fixture
+def process_pool():
+    yield get_process_pool()
+    shutdown_process_pool()
+
+
+@pytest.mark.asyncio
+async def test_run_in_process(tmp_path, process_pool):
+    file_name = str(tmp_path / 'file.js')
+    with open(file_name, 'wb') as output_file:
+        output_file.write(b'console.log("searxstats");')
+    content_hash = await run_in_process(get_file_content_hash, file_name)
+    assert content_hash == hashlib.sha256(b'console.log("searxstats");').hexdigest()
+    assert await run_in_process(os.getpid) != os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_check_page(process_pool):
+    article = '<article><div class="engines"><span>{0}</span></div></article>'
+    page = '<html><body><div id="urls">{0}</div></body></html>'
+    assert await run_in_process(check_page, 'google cse', page.format(article.format('google cse'))) == (True, None)
+    assert check_page('google cse', page.format(article.format('bing'))) == \
+        (False, 'A result is not from the google cse')
+    assert check_page(None, page.format(article.format('bing'))) == (False, 'Only one result')
+    assert check_page(None, page.format(article.format('wikipedia') * 3)) == \
+        (False, 'Only result(s) from wiki* engines')
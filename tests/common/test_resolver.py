@@ -0,0 +1,108 @@
+# pylint: disable=unused-argument, redefined-outer-name
+import socket
+import asyncio
+import pytest
+import pytest_httpserver
+
+import searxstats.common.http as http
+import searxstats.common.resolver as resolver
+
+
+def test_dns_cache_get_put():
+    dns_cache = resolver.DnsCache(min_ttl=60)
+    assert dns_cache.get('example.com', 'A') is None
+    dns_cache.put('example.com', 'A', ['93.184.216.34'], None)
+    assert dns_cache.get('example.com', 'A') == (['93.184.216.34'], None)
+    dns_cache.put('example.com', 'AAAA', [], None, ttl=-1)
+    assert dns_cache.get('example.com', 'AAAA') is None
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_single_query():
+    calls = []
+
+    class FakeDnsCache(resolver.DnsCache):
+
+        __slots__ = ()
+
+        async def _query(self, host, field):
+            calls.append((host, field))
+            await asyncio.sleep(0.1)
+            return ['127.0.0.1'], None, 60
+
+    dns_cache = FakeDnsCache()
+    results = await asyncio.gather(*[dns_cache.resolve_field('example.com', 'A') for _ in range(5)])
+    assert results == [(['127.0.0.1'], None)] * 5
+    assert await dns_cache.resolve('example.com') == ['127.0.0.1', '127.0.0.1']
+    assert calls == [('example.com', 'A'), ('example.com', 'AAAA')]
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_query_cancelled():
+    calls = []
+
+    class FakeDnsCache(resolver.DnsCache):
+
+        __slots__ = ()
+
+        async def _query(self, host, field):
+            calls.append((host, field))
+            await asyncio.sleep(0.1)
+            return ['127.0.0.1'], None, 60
+
+    dns_cache = FakeDnsCache()
+    first = asyncio.ensure_future(dns_cache.resolve_field('example.com', 'A'))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(dns_cache.resolve_field('example.com', 'A'))
+    await asyncio.sleep(0.05)
+    first.cancel()
+    # the waiting task is not cancelled: it sends the query again
+    assert await waiter == (['127.0.0.1'], None)
+    assert first.cancelled()
+    assert calls == [('example.com', 'A')] * 2
+
+
+def test_local_names(tmp_path):
+    hosts_file_name = str(tmp_path / 'hosts')
+    with open(hosts_file_name, 'w') as hosts_file:
+        hosts_file.write('127.0.0.1 localhost\n# 10.0.0.1 commented.example.com\n10.0.0.2 searx.lan searx # name\n')
+    dns_cache = resolver.DnsCache(local_names=resolver.read_hosts_file(hosts_file_name))
+    assert dns_cache.local_names == {'localhost', 'searx.lan', 'searx'}
+    assert dns_cache.is_local_name('localhost')
+    assert dns_cache.is_local_name('printer.local')
+    assert dns_cache.is_local_name('SEARX.LAN')
+    assert not dns_cache.is_local_name('commented.example.com')
+    assert not dns_cache.is_local_name('example.com')
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_localhost():
+    # not sent to the DNS
+    dns_cache = resolver.DnsCache(local_names=set())
+    addresses, error = await dns_cache.resolve_field('localhost', 'A')
+    assert error is None
+    assert '127.0.0.1' in addresses
+
+
+@pytest.mark.asyncio
+async def test_dns_cache_no_address():
+    dns_cache = resolver.DnsCache()
+    dns_cache.put('invalid.example.com', 'A', [], 'Timeout')
+    dns_cache.put('invalid.example.com', 'AAAA', [], None)
+    with pytest.raises(socket.gaierror):
+        await dns_cache.resolve('invalid.example.com')
+    assert await dns_cache.resolve('127.0.0.1') == ['127.0.0.1']
+
+
+@pytest.mark.asyncio
+async def test_client_dns_cache(httpserver: pytest_httpserver.HTTPServer):
+    httpserver.expect_request('/index.html').respond_with_data('OK')
+    resolver.DNS_CACHE.put('searxstats.invalid', 'A', ['127.0.0.1'], None)
+    resolver.DNS_CACHE.put('searxstats.invalid', 'AAAA', [], None)
+    url = httpserver.url_for('/index.html').replace('localhost', 'searxstats.invalid')
+
+    async with http.new_client() as session:
+        response, error = await http.get(session, url)
+
+    assert error is None
+    assert response.text == 'OK'
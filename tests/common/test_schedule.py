@@ -0,0 +1,32 @@
+import git
+
+from searxstats.common.schedule import RefreshSchedule
+from searxstats.common.git_tool import get_local_head, get_remote_head
+
+
+def test_refresh_schedule():
+    schedule = RefreshSchedule({'uptime': 3600, 'timing': 4 * 3600}, now=0)
+    assert schedule.get_due(now=0) == ['uptime', 'timing']
+
+    schedule.done(['uptime', 'timing'], now=10)
+    assert schedule.get_due(now=20) == []
+    assert schedule.get_sleep_time(now=20) == 3590
+
+    assert schedule.get_due(now=3610) == ['uptime']
+    schedule.done(['uptime'], now=3610)
+    assert schedule.last_times == {'uptime': 3610, 'timing': 10}
+    assert schedule.get_sleep_time(now=3610) == 3600
+    assert schedule.get_due(now=4 * 3600 + 10) == ['uptime', 'timing']
+
+
+def test_git_heads(tmp_path):
+    directory = str(tmp_path / 'repository')
+    repo = git.Repo.init(directory)
+    with open(str(tmp_path / 'repository' / 'file.txt'), 'w') as output_file:
+        output_file.write('searxstats')
+    repo.index.add(['file.txt'])
+    commit = repo.index.commit('first commit')
+
+    assert get_local_head(directory) == commit.hexsha
+    assert get_remote_head(directory) == commit.hexsha
+    assert get_local_head(str(tmp_path / 'not_a_repository')) is None
@@ -0,0 +1,24 @@
+import searxstats.common.ssl_info as ssl_info
+
+
+def test_cert_to_obj():
+    cert = {
+        'subject': ((('commonName', 'example.com'),),),
+        'issuer': ((('organizationName', 'CA'),), (('commonName', 'CA root'),)),
+        'notAfter': 'Jan  1 00:00:00 2030 GMT',
+        'subjectAltName': (('DNS', 'example.com'), ('DNS', 'www.example.com')),
+    }
+    assert ssl_info.cert_to_obj(cert) == {
+        'subject': {'commonName': 'example.com', 'altName': 'DNS:example.com, DNS:www.example.com'},
+        'issuer': {'organizationName': 'CA', 'commonName': 'CA root'},
+        'notAfter': 'Jan  1 00:00:00 2030 GMT',
+    }
+
+
+def test_get_ssl_info():
+    assert ssl_info.get_ssl_info('unknown.example.com') == {}
+    ssl_info.SSL_INFOS.put('known.example.com', {'version': 'TLSv1.3'})
+    assert ssl_info.get_ssl_info('known.example.com') == {'version': 'TLSv1.3'}
+    # the fetchers update the returned value (grade, gradeUrl): the stored value doesn't change
+    ssl_info.get_ssl_info('known.example.com')['grade'] = 'A'
+    assert ssl_info.get_ssl_info('known.example.com') == {'version': 'TLSv1.3'}
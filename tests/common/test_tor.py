@@ -0,0 +1,111 @@
+# pylint: disable=unused-argument, redefined-outer-name
+import socket
+import struct
+import asyncio
+import pytest
+import pytest_httpserver
+
+import searxstats.common.http as http
+import searxstats.common.tor as tor
+
+
+def test_assign_least_loaded():
+    pool = tor.TorCircuitPool(size=2)
+    circuit_a = pool.assign('a.onion')
+    circuit_b = pool.assign('b.onion')
+    assert circuit_a is not circuit_b
+    assert pool.assign('a.onion') is circuit_a
+    pool.start(circuit_b)
+    assert pool.assign('c.onion') is circuit_a
+
+
+def test_assign_round_robin():
+    pool = tor.TorCircuitPool(size=2, strategy='round-robin')
+    assert [pool.assign(host).index for host in ('a.onion', 'b.onion', 'c.onion')] == [0, 1, 0]
+
+
+def test_retire_circuit():
+    pool = tor.TorCircuitPool(size=1, max_latency=1, max_errors=2, min_samples=2)
+    circuit = pool.assign('a.onion')
+
+    def report(latency):
+        username = circuit.username
+        pool.start(circuit)
+        return pool.report(circuit, username, latency)
+
+    assert not report(None)
+    assert not report(0.1)
+    # the errors must be consecutive
+    assert not report(None)
+    username = circuit.username
+    assert report(None)
+    assert circuit.username != username
+    assert circuit.in_flight == 0
+
+    # slow circuit
+    assert not report(5)
+    assert report(5)
+
+
+async def socks5_server(credentials, target_port):
+    """
+    SOCKS5 stand-in: record the credentials, forward the connections to target_port
+    """
+
+    async def pipe(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(reader, writer):
+        _, method_count = await reader.readexactly(2)
+        await reader.readexactly(method_count)
+        # username / password authentication
+        writer.write(b'\x05\x02')
+        _, username_length = await reader.readexactly(2)
+        username = await reader.readexactly(username_length)
+        password_length, = await reader.readexactly(1)
+        await reader.readexactly(password_length)
+        credentials.append(username.decode())
+        writer.write(b'\x01\x00')
+        # CONNECT request with a domain name
+        _, _, _, address_type = await reader.readexactly(4)
+        assert address_type == 3
+        domain_length, = await reader.readexactly(1)
+        await reader.readexactly(domain_length + 2)
+        target_reader, target_writer = await asyncio.open_connection('127.0.0.1', target_port)
+        writer.write(b'\x05\x00\x00\x01' + socket.inet_aton('127.0.0.1') + struct.pack('!H', target_port))
+        await writer.drain()
+        await asyncio.gather(pipe(reader, target_writer), pipe(target_reader, writer), return_exceptions=True)
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+@pytest.mark.asyncio
+async def test_tor_stream_isolation(httpserver: pytest_httpserver.HTTPServer, monkeypatch):
+    httpserver.expect_request('/').respond_with_data('OK')
+    credentials = []
+    server = await socks5_server(credentials, httpserver.port)
+    proxy_port = server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(http, 'TOR_CIRCUIT_POOL', tor.TorCircuitPool(size=2, proxy_port=proxy_port))
+
+    try:
+        for host in ('a.onion', 'b.onion', 'a.onion'):
+            url = f'http://{host}:{httpserver.port}/'
+            async with http.shared_client(network_type=http.NetworkType.TOR, host=host) as session:
+                response, error = await http.get(session, url)
+            assert error is None
+            assert response.text == 'OK'
+    finally:
+        await http.close_shared_clients()
+        server.close()
+        await server.wait_closed()
+
+    # one circuit per host
+    assert credentials[0] != credentials[1]
+    assert credentials[0] == credentials[2]
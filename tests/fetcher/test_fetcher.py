@@ -0,0 +1,71 @@
+import types
+import asyncio
+
+import pytest
+
+from searxstats.model import SearxStatisticsResult, Fetcher, InstanceFetch
+from searxstats.fetcher import run_fetchers
+from searxstats.common.profile import reset_run_profile, get_run_profile
+
+
+def create_module(fetch):
+    module = types.ModuleType('test_module')
+    module.fetch = fetch
+    return module
+
+
+@pytest.mark.asyncio
+async def test_run_fetchers():
+    searx_stats_result = SearxStatisticsResult()
+    searx_stats_result.instances = {
+        'https://fast.example.org/': {},
+        'https://slow.example.org/': {},
+        'https://redirect.example.org/': {},
+    }
+    events = []
+
+    async def fetch_root(_, url, __):
+        await asyncio.sleep(1 if 'slow' in url else 0.1)
+        events.append(('root', url))
+        if 'redirect' in url:
+            return 'https://new.example.org/', {'version': '1.0.0'}
+        return url, {'version': '1.0.0'}
+
+    def store_root(searx_stats_result, url, _, result):
+        r_url, r_detail = result
+        del searx_stats_result.instances[url]
+        searx_stats_result.update_instance(r_url, r_detail)
+        return r_url, r_detail
+
+    async def fetch_child(_, url, __):
+        events.append(('child', url))
+        return {'child': True}
+
+    async def fetch_global(searx_stats_result):
+        events.append(('global', len(searx_stats_result.instances)))
+
+    fetchers = [
+        Fetcher(create_module(InstanceFetch(fetch_root, store=store_root, valid_or_private=False, limit=0)),
+                'root', ''),
+        Fetcher(create_module(InstanceFetch(fetch_child, keys=['child'], limit=0)),
+                'child', '', instance_dependencies=['root', 'unselected']),
+        Fetcher(create_module(fetch_global), 'global', '', dependencies=['child']),
+    ]
+    reset_run_profile()
+    await run_fetchers(searx_stats_result, fetchers)
+
+    # the fast instances are fetched by the child before the slow instance is fetched by the root
+    assert events.index(('child', 'https://fast.example.org/')) < events.index(('root', 'https://slow.example.org/'))
+    assert ('child', 'https://new.example.org/') in events
+    assert events[-1] == ('global', 3)
+    assert all(detail['child'] == {'child': True} for detail in searx_stats_result.instances.values())
+
+    run_profile = get_run_profile(slowest_count=2)
+    assert set(run_profile['fetchers'].keys()) == {'root', 'child', 'global'}
+    assert run_profile['fetchers']['root']['items'] == 3
+    assert run_profile['fetchers']['root']['duration']['max'] >= 1
+    assert run_profile['fetchers']['child']['items'] == 3
+    assert run_profile['fetchers']['global']['start'] >= 1
+    assert run_profile['slowest'][0]['fetcher'] == 'root'
+    assert run_profile['slowest'][0]['url'] == 'https://slow.example.org/'
+    assert len(run_profile['slowest']) == 2
@@ -0,0 +1,30 @@
+import time
+import asyncio
+
+import pytest
+
+from searxstats.model import SearxStatisticsResult, InstanceFetch
+from searxstats.fetcher import network
+
+
+@pytest.mark.asyncio
+async def test_fetch_timeout(monkeypatch):
+    def get_network_info(_searx_stats_result, host):
+        time.sleep(0.5 if host == 'slow.example.org' else 0)
+        return network.create_network_info(), {host: {'asn_privacy': 0}}
+
+    monkeypatch.setattr(network, 'get_network_info', get_network_info)
+    searx_stats_result = SearxStatisticsResult()
+    searx_stats_result.instances = {
+        'https://fast.example.org/': {},
+        'https://slow.example.org/': {},
+    }
+    fetch = InstanceFetch(network.fetch_one, store=network.store_result, valid_or_private=False, limit=0,
+                          timeout=0.2, on_timeout=network.set_timeout)
+    await fetch.fetch(searx_stats_result)
+    # the thread of the slow instance ends after the timeout: its result is ignored
+    await asyncio.sleep(0.5)
+
+    assert searx_stats_result.instances['https://fast.example.org/']['network']['error'] is None
+    assert searx_stats_result.instances['https://slow.example.org/']['network']['error'] == 'Timeout'
+    assert searx_stats_result.cidrs == {'fast.example.org': {'asn_privacy': 0}}
@@ -0,0 +1,82 @@
+import types
+
+import pytest
+
+from searxstats.model import SearxStatisticsResult, Fetcher, InstanceFetch
+from searxstats.fetcher import run_fetchers
+from searxstats.checkpoint import RunCheckpoint
+
+
+def create_module(fetch):
+    module = types.ModuleType('test_module')
+    module.fetch = fetch
+    return module
+
+
+def create_result():
+    searx_stats_result = SearxStatisticsResult()
+    searx_stats_result.instances = {
+        'https://a.example.org/': {},
+        'https://b.example.org/': {},
+    }
+    return searx_stats_result
+
+
+def test_save_load(tmp_path):
+    file_name = str(tmp_path / 'checkpoint.json')
+    searx_stats_result = create_result()
+    searx_stats_result.hashes.append({'hash': '1234', 'index': 0})
+    checkpoint = RunCheckpoint(file_name, {'private': False, 'instance_urls': []})
+    checkpoint.instance_done('child', 'https://a.example.org/', searx_stats_result)
+    checkpoint.fetcher_done('root', searx_stats_result)
+
+    checkpoint = RunCheckpoint(file_name, {'private': False, 'instance_urls': []})
+    resumed_result = checkpoint.load()
+    assert resumed_result.instances == searx_stats_result.instances
+    assert resumed_result.hashes == searx_stats_result.hashes
+    assert checkpoint.is_completed('root')
+    assert not checkpoint.is_completed('child')
+    assert checkpoint.get_instances_done('child') == {'https://a.example.org/'}
+
+    # an other run
+    assert RunCheckpoint(file_name, {'private': True, 'instance_urls': []}).load() is None
+
+    checkpoint.remove()
+    assert checkpoint.load() is None
+
+
+@pytest.mark.asyncio
+async def test_resume(tmp_path):
+    calls = []
+
+    async def fetch_root(_, url, __):
+        calls.append(('root', url))
+        return {'version': '1.0.0'}
+
+    async def fetch_child(_, url, __):
+        calls.append(('child', url))
+        return True
+
+    fetchers = [
+        Fetcher(create_module(InstanceFetch(fetch_root, keys=['root'], valid_or_private=False)), 'root', ''),
+        Fetcher(create_module(InstanceFetch(fetch_child, keys=['child'], valid_or_private=False)), 'child', '',
+                instance_dependencies=['root']),
+    ]
+
+    # the run has been interrupted after root, and after child has fetched one instance
+    searx_stats_result = create_result()
+    for detail in searx_stats_result.instances.values():
+        detail['root'] = {'version': '1.0.0'}
+    searx_stats_result.instances['https://a.example.org/']['child'] = True
+    checkpoint = RunCheckpoint(str(tmp_path / 'checkpoint.json'), {})
+    checkpoint.fetcher_done('root', searx_stats_result)
+    checkpoint.instance_done('child', 'https://a.example.org/', searx_stats_result)
+    checkpoint.save(searx_stats_result)
+
+    checkpoint = RunCheckpoint(str(tmp_path / 'checkpoint.json'), {})
+    searx_stats_result = checkpoint.load()
+    await run_fetchers(searx_stats_result, fetchers, checkpoint=checkpoint)
+
+    assert calls == [('child', 'https://b.example.org/')]
+    assert all(detail['child'] is True for detail in searx_stats_result.instances.values())
+    assert checkpoint.is_completed('child')
@@ -0,0 +1,99 @@
+import argparse
+
+import pytest
+
+from searxstats.shard import parse_shard, get_shard_index, merge_results
+from searxstats.config import SEARXNG_GIT_REPOSITORY
+
+
+FORK = 'https://github.com/example/searxng'
+
+
+def create_instance(engine_errors, error_rate):
+    return {
+        'html': {'resources': {'script': [{'url': 'a.js', 'hashRef': 0}, {'url': 'b.js', 'hashRef': 1}]}},
+        'engines': {'google': {'errors': [len(engine_errors) - 1], 'error_rate': error_rate}},
+    }
+
+
+def create_shard_result(shard, urls, hashes, forks, engine_errors, error_rate):
+    return {
+        'metadata': {'timestamp': 100 + shard, 'shard': f'{shard}/2', 'ips': {}},
+        'instances': {url: create_instance(engine_errors, error_rate) for url in urls},
+        'engines': {'google': {'stats': {'instance_count': len(urls), 'stats_count': len(urls),
+                                         'error_rate': error_rate}}},
+        'engine_errors': engine_errors,
+        'hashes': hashes,
+        'cidrs': {f'10.0.{shard}.0/24': {'asn_privacy': 0}},
+        'forks': forks,
+    }
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard('0/4')
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard('4')
+    assert get_shard_index('https://searx.example.org/', 4) == get_shard_index('https://searx.example.org/', 4)
+    assert {get_shard_index(f'https://{i}.example.org/', 4) for i in range(100)} == {1, 2, 3, 4}
+
+
+def test_merge_results():
+    shard_1 = create_shard_result(
+        1, ['https://b.example.org/'],
+        [{'hash': 'h1', 'count': 1}, {'hash': 'h2', 'count': 1, 'forks': [1]}],
+        [SEARXNG_GIT_REPOSITORY, FORK],
+        [{'filename': 'a.py'}, {'filename': 'b.py'}], 10)
+    # https://b.example.org/ is also in the second shard: it is dropped and not counted in engines.stats
+    shard_2 = create_shard_result(
+        2, ['https://a.example.org/', 'https://b.example.org/'],
+        [{'hash': 'h3', 'count': 1}, {'hash': 'h1', 'count': 1}],
+        [SEARXNG_GIT_REPOSITORY],
+        [{'filename': 'b.py'}], 20)
+
+    merged = merge_results([shard_1, shard_2])
+    assert merged == merge_results([shard_2, shard_1])
+
+    assert list(merged['instances'].keys()) == ['https://a.example.org/', 'https://b.example.org/']
+    assert merged['hashes'] == [{'hash': 'h3', 'count': 1}, {'hash': 'h1', 'count': 2},
+                                {'hash': 'h2', 'count': 1, 'forks': [1]}]
+    resources = merged['instances']['https://b.example.org/']['html']['resources']['script']
+    assert [merged['hashes'][resource['hashRef']]['hash'] for resource in resources] == ['h1', 'h2']
+    assert merged['forks'] == [SEARXNG_GIT_REPOSITORY, FORK]
+
+    assert merged['engine_errors'] == [{'filename': 'b.py'}]
+    assert merged['instances']['https://b.example.org/']['engines']['google']['errors'] == [0]
+    assert merged['engines']['google']['stats'] == {'instance_count': 2, 'stats_count': 2, 'error_rate': 15}
+    assert list(merged['cidrs'].keys()) == ['10.0.1.0/24', '10.0.2.0/24']
+    assert merged['metadata']['timestamp'] == 101
+    assert [shard['shard'] for shard in merged['metadata']['shards']] == ['1/2', '2/2']
+
+
+def test_merge_results_forks():
+    fork_2 = 'https://github.com/other/searxng'
+    # h1 is unknown in the first shard, and in a fork in the second shard
+    # h2 is in a fork of each shard
+    # h3 is in a fork of the first shard, and a SearXNG file in the second shard
+    shard_1 = create_shard_result(
+        1, ['https://a.example.org/'],
+        [{'hash': 'h1', 'count': 1, 'unknown': True}, {'hash': 'h2', 'count': 1, 'forks': [1]},
+         {'hash': 'h3', 'count': 1, 'forks': [1]}],
+        [SEARXNG_GIT_REPOSITORY, fork_2],
+        [{'filename': 'a.py'}], 10)
+    shard_2 = create_shard_result(
+        2, ['https://b.example.org/'],
+        [{'hash': 'h1', 'count': 1, 'forks': [1]}, {'hash': 'h2', 'count': 1, 'forks': [1]},
+         {'hash': 'h3', 'count': 1}],
+        [SEARXNG_GIT_REPOSITORY, FORK],
+        [{'filename': 'a.py'}], 10)
+    shard_1['instances']['https://a.example.org/']['html']['resources']['script'].append(
+        {'url': 'c.js', 'hashRef': 2})
+    shard_2['instances']['https://b.example.org/']['html']['resources']['script'].append(
+        {'url': 'c.js', 'hashRef': 2})
+
+    merged = merge_results([shard_1, shard_2])
+    assert merged == merge_results([shard_2, shard_1])
+    assert merged['forks'] == [SEARXNG_GIT_REPOSITORY, FORK, fork_2]
+    assert merged['hashes'] == [{'hash': 'h1', 'count': 2, 'forks': [1]}, {'hash': 'h2', 'count': 2, 'forks': [1, 2]},
+                                {'hash': 'h3', 'count': 2}]